@@ -4,22 +4,37 @@ FastAPI Server for Health AI System
 REST API for health predictions and insights
 """
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Dict, List, Optional, Any
+import io
 import json
+import asyncio
 from datetime import datetime, date
 from pathlib import Path
 
 from unified_health_ai import (
-    init_db, get_conn, UserIn, DailyLogIn, SymptomIn, MealIn, 
+    init_db, get_conn, get_pool, close_pool, UserIn, DailyLogIn, SymptomIn, MealIn, 
     SleepSessionIn, WorkoutIn, VitalIn, JournalIn,
-    upsert_daily_log, insert_symptom, insert_meal, insert_sleep_session,
-    insert_workout, insert_vital, insert_journal
+    INGEST_SPECS, validate_records, insert_records, get_writer, stop_writer,
+    EventIn, ingest_events, project_events, replay_events, add_ingest_listener,
+    remove_ingest_listener
 )
-from feature_store import FeatureStore
-from ml_models import HealthModelTrainer, HealthPredictionEngine
+from feature_store import (
+    FeatureStore, rebuild_user_features, materialize_dirty_features, get_feature_cache,
+    FEATURE_MATERIALIZE_INTERVAL_S
+)
+from online_features import get_online_engine, ONLINE_RECONCILE_INTERVAL_S
+from ml_models import (
+    HealthPredictionEngine, GLOBAL_MODEL_ID, get_model_cache, predict_batch,
+    retrain_candidates
+)
+from training_jobs import (
+    submit_training_job, get_job, latest_job, cancel_job, get_training_scheduler, ACTIVE_JOB_STATUSES
+)
+from bulk_import import import_stream, content_fingerprint, default_import_id, IMPORT_FORMATS
+from executors import run_blocking, run_cpu, executor_stats, shutdown_executors
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -54,6 +69,15 @@ class PredictionResponse(BaseModel):
     confidence: Dict[str, float]
     recommendations: List[str]
 
+class BatchPredictionRequest(BaseModel):
+    items: List[PredictionRequest]
+    persist: bool = False  # also write the scores to the predictions table
+
+class BatchPredictionResponse(BaseModel):
+    count: int
+    predicted: int  # pairs with at least one score
+    results: List[Dict[str, Any]]
+
 class HealthDataRequest(BaseModel):
     user_id: str
     data_type: str  # 'daily_log', 'symptom', 'meal', 'sleep', 'workout', 'vital', 'journal'
@@ -64,23 +88,117 @@ class HealthDataResponse(BaseModel):
     message: str
     data_id: Optional[int] = None
 
+class BatchRecord(BaseModel):
+    data_type: str  # same values as HealthDataRequest.data_type
+    data: Dict[str, Any]
+
+class BatchIngestRequest(BaseModel):
+    user_id: str
+    records: List[BatchRecord]
+
+class BatchItemResult(BaseModel):
+    index: int
+    data_type: str
+    success: bool
+    data_id: Optional[int] = None
+    error: Optional[str] = None
+
+class BatchIngestResponse(BaseModel):
+    success: bool
+    message: str
+    inserted: int
+    failed: int
+    results: List[BatchItemResult]
+
+class EventIngestRequest(BaseModel):
+    events: List[EventIn]
+
+class EventIngestResult(BaseModel):
+    event_id: int
+    duplicate: bool
+
+class EventReplayRequest(BaseModel):
+    user_id: Optional[str] = None
+    event_types: Optional[List[str]] = None
+
 class FeatureRebuildRequest(BaseModel):
     user_id: str
     start_date: str
     end_date: str
 
+class FeatureMaterializeRequest(BaseModel):
+    user_id: Optional[str] = None
+
 class ModelTrainRequest(BaseModel):
     user_id: str
     targets: List[str] = ["gut", "skin", "mood", "stress"]
 
+class ModelRetrainRequest(BaseModel):
+    user_ids: Optional[List[str]] = None  # default: every user with stored features
+    targets: List[str] = ["gut", "skin", "mood", "stress"]
+    force: bool = False  # retrain from scratch even if models are fresh
+
+class GlobalModelTrainRequest(BaseModel):
+    user_ids: Optional[List[str]] = None  # default: every user with stored features
+    dataset_path: Optional[str] = None  # train on an exported dataset instead
+
 # API Endpoints
 
+async def materialize_features_periodically():
+    """Keep stored features current by materializing dirty dates in the background."""
+    while True:
+        await asyncio.sleep(FEATURE_MATERIALIZE_INTERVAL_S)
+        try:
+            await _materialize_and_invalidate()
+        except Exception as e:
+            print(f"⚠ Feature materialization failed: {e}")
+
+async def _materialize_and_invalidate(user_id: Optional[str] = None) -> Dict[str, int]:
+    """Materialize dirty dates in a worker, then drop the re-written users' cached reads."""
+    cache = get_feature_cache()
+    pending = cache.take_pending(user_id)
+    try:
+        return await run_cpu(materialize_dirty_features, user_id)
+    finally:
+        for uid in pending:
+            cache.invalidate(uid)
+
+async def reconcile_online_features_periodically():
+    """Check online feature state against batch builds and drop any drifted users."""
+    while True:
+        await asyncio.sleep(ONLINE_RECONCILE_INTERVAL_S)
+        try:
+            report = await run_blocking(get_online_engine().reconcile)
+            if report['users_mismatched']:
+                print(f"⚠ Online features drifted for {report['users_mismatched']} users "
+                      f"(max diff {report['max_abs_diff']:.3g}); they will reseed")
+        except Exception as e:
+            print(f"⚠ Online feature reconciliation failed: {e}")
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize database on startup."""
     init_db()
+    get_writer()
+    add_ingest_listener(get_online_engine().on_ingest)
+    add_ingest_listener(get_feature_cache().on_ingest)
+    app.state.materializer = asyncio.create_task(materialize_features_periodically())
+    app.state.reconciler = asyncio.create_task(reconcile_online_features_periodically())
+    app.state.trainer = asyncio.create_task(get_training_scheduler().run())
     print("🚀 Health AI API started!")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Flush queued writes, stop worker pools and close pooled connections."""
+    app.state.materializer.cancel()
+    app.state.reconciler.cancel()
+    app.state.trainer.cancel()
+    stop_writer()
+    remove_ingest_listener(get_online_engine().on_ingest)
+    remove_ingest_listener(get_feature_cache().on_ingest)
+    shutdown_executors(wait=False)
+    close_pool()
+
 @app.get("/")
 async def root():
     """Root endpoint."""
@@ -95,66 +213,161 @@ async def health_check():
     """Health check endpoint."""
     return {"status": "healthy", "timestamp": datetime.now().isoformat()}
 
+@app.get("/metrics")
+async def get_metrics():
+    """Runtime metrics for the connection pool, execution pools, writer, features, models and training."""
+    return {
+        "db_pool": get_pool().stats(),
+        "executors": executor_stats(),
+        "writer": get_writer().stats(),
+        "online_features": get_online_engine().stats(),
+        "feature_cache": get_feature_cache().stats(),
+        "model_cache": get_model_cache().stats(),
+        "training_jobs": get_training_scheduler().stats()
+    }
+
 # Data Ingestion Endpoints
 
 @app.post("/data/ingest", response_model=HealthDataResponse)
 async def ingest_health_data(request: HealthDataRequest):
     """Ingest health data from various sources."""
     try:
-        data_id = None
-        
-        if request.data_type == "daily_log":
-            log_data = DailyLogIn(user_id=request.user_id, **request.data)
-            upsert_daily_log(log_data)
-            data_id = 1  # Daily logs are upserted, not inserted
-            
-        elif request.data_type == "symptom":
-            symptom_data = SymptomIn(user_id=request.user_id, **request.data)
-            data_id = insert_symptom(symptom_data)
-            
-        elif request.data_type == "meal":
-            meal_data = MealIn(user_id=request.user_id, **request.data)
-            data_id = insert_meal(meal_data)
-            
-        elif request.data_type == "sleep":
-            sleep_data = SleepSessionIn(user_id=request.user_id, **request.data)
-            data_id = insert_sleep_session(sleep_data)
-            
-        elif request.data_type == "workout":
-            workout_data = WorkoutIn(user_id=request.user_id, **request.data)
-            data_id = insert_workout(workout_data)
-            
-        elif request.data_type == "vital":
-            vital_data = VitalIn(user_id=request.user_id, **request.data)
-            data_id = insert_vital(vital_data)
-            
-        elif request.data_type == "journal":
-            journal_data = JournalIn(user_id=request.user_id, **request.data)
-            data_id = insert_journal(journal_data)
-            
-        else:
+        spec = INGEST_SPECS.get(request.data_type)
+        if spec is None:
             raise HTTPException(status_code=400, detail=f"Unknown data type: {request.data_type}")
         
+        record = spec.model(user_id=request.user_id, **request.data)
+        
+        # Queue on the group-commit writer; resolves once the group is committed
+        data_id = await asyncio.wrap_future(get_writer().submit(request.data_type, record))
+        
         return HealthDataResponse(
             success=True,
             message=f"Data ingested successfully",
             data_id=data_id
         )
-        
+    
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/data/ingest/batch", response_model=BatchIngestResponse)
+async def ingest_health_data_batch(request: BatchIngestRequest):
+    """Ingest a mixed list of health records in a single transaction."""
+    valid, errors = validate_records(
+        request.user_id, [(r.data_type, r.data) for r in request.records]
+    )
+    
+    try:
+        ids = await run_blocking(insert_records, [(data_type, record) for _, data_type, record in valid])
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    results = [
+        BatchItemResult(index=idx, data_type=data_type, success=True, data_id=data_id)
+        for (idx, data_type, _), data_id in zip(valid, ids)
+    ]
+    results += [
+        BatchItemResult(index=idx, data_type=request.records[idx].data_type,
+                        success=False, error=error)
+        for idx, error in errors.items()
+    ]
+    results.sort(key=lambda r: r.index)
+    
+    return BatchIngestResponse(
+        success=not errors,
+        message=f"Ingested {len(ids)} of {len(request.records)} records",
+        inserted=len(ids),
+        failed=len(errors),
+        results=results
+    )
+
+@app.post("/data/import")
+async def import_health_data(
+    file: UploadFile = File(...),
+    data_type: Optional[str] = Form(None),
+    user_id: Optional[str] = Form(None),
+    format: Optional[str] = Form(None),
+    import_id: Optional[str] = Form(None)
+):
+    """Stream an NDJSON or CSV upload into the database in chunked transactions.
+    
+    Re-uploading the same file with the import_id returned by an
+    interrupted upload resumes after its last committed chunk. Without an
+    import_id the upload is imported from the start.
+    """
+    fmt = format or ("csv" if (file.filename or "").lower().endswith(".csv") else "ndjson")
+    if fmt not in IMPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown import format: {fmt}")
+    resume = import_id is not None
+    
+    try:
+        if import_id is None:
+            fingerprint = await run_blocking(content_fingerprint, file.file)
+            import_id = default_import_id(file.filename or "", fingerprint, data_type, user_id)
+        stream = io.TextIOWrapper(file.file, encoding="utf-8", newline="")
+        stats = await run_blocking(
+            import_stream, stream, fmt, import_id,
+            data_type=data_type, user_id=user_id, source=file.filename or "", resume=resume
+        )
+        return {"success": True, **stats}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+# Event Log Endpoints
+
+@app.post("/events/ingest")
+async def ingest_events_endpoint(request: EventIngestRequest, background_tasks: BackgroundTasks):
+    """Append raw events to the idempotent event log."""
+    try:
+        results = await run_blocking(ingest_events, request.events)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    created = sum(1 for _, is_new in results if is_new)
+    if created:
+        # Project the new events into the typed tables after responding
+        background_tasks.add_task(run_blocking, project_events)
+    
+    return {
+        "success": True,
+        "accepted": created,
+        "duplicates": len(results) - created,
+        "results": [EventIngestResult(event_id=event_id, duplicate=not is_new)
+                    for event_id, is_new in results]
+    }
+
+@app.post("/events/project")
+async def project_events_endpoint(user_id: Optional[str] = None):
+    """Project unprocessed events into the typed tables."""
+    try:
+        totals = await run_blocking(project_events, user_id)
+        return {"success": True, **totals}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/events/replay")
+async def replay_events_endpoint(request: EventReplayRequest):
+    """Rebuild typed rows from the event log after a projection change."""
+    try:
+        totals = await run_blocking(replay_events, request.user_id, request.event_types)
+        return {"success": True, **totals}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 # Feature Store Endpoints
 
 @app.post("/features/rebuild")
 async def rebuild_features(request: FeatureRebuildRequest):
     """Rebuild features for a user and date range."""
     try:
-        feature_store.rebuild_features(
+        await run_cpu(
+            rebuild_user_features,
             request.user_id, 
             request.start_date, 
             request.end_date
         )
+        # The rebuild ran in a worker process, so this process's cache is stale
+        get_feature_cache().invalidate(request.user_id)
         return {
             "success": True,
             "message": f"Features rebuilt for user {request.user_id}",
@@ -163,11 +376,20 @@ async def rebuild_features(request: FeatureRebuildRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/features/materialize")
+async def materialize_features(request: FeatureMaterializeRequest):
+    """Recompute only the feature rows affected by ingestion since the last run."""
+    try:
+        totals = await _materialize_and_invalidate(request.user_id)
+        return {"success": True, **totals}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/features/{user_id}/{date}")
 async def get_features(user_id: str, date: str):
     """Get features for a specific user and date."""
     try:
-        features = feature_store.get_daily_features(user_id, date)
+        features = await run_blocking(_get_daily_features, user_id, date)
         if features:
             return {
                 "user_id": user_id,
@@ -186,13 +408,9 @@ async def get_features(user_id: str, date: str):
 async def predict_daily_risk(request: PredictionRequest):
     """Get daily risk predictions."""
     try:
-        # Load models if not already loaded
-        if not prediction_engine.models:
-            prediction_engine.load_models(request.user_id)
-        
-        # Get predictions
-        predictions = prediction_engine.predict_daily_risk(request.user_id, request.date)
-        explanations = prediction_engine.get_explanations(request.user_id, request.date)
+        predictions, explanations = await run_blocking(
+            _predict_daily, request.user_id, request.date
+        )
         
         # Calculate confidence (simplified)
         confidence = {target: 0.8 for target in predictions.keys()}
@@ -208,7 +426,23 @@ async def predict_daily_risk(request: PredictionRequest):
             confidence=confidence,
             recommendations=recommendations
         )
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/predict/batch", response_model=BatchPredictionResponse)
+async def predict_batch_risk(request: BatchPredictionRequest):
+    """Daily risk predictions for many (user, date) pairs in one call."""
+    try:
+        pairs = [(item.user_id, item.date) for item in request.items]
+        results = await run_blocking(predict_batch, pairs, request.persist, prediction_engine)
         
+        return BatchPredictionResponse(
+            count=len(results),
+            predicted=sum(1 for result in results if result['predictions']),
+            results=results
+        )
+    
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -216,10 +450,7 @@ async def predict_daily_risk(request: PredictionRequest):
 async def predict_sequence_risk(request: PredictionRequest):
     """Get sequence-based risk predictions."""
     try:
-        if not prediction_engine.models:
-            prediction_engine.load_models(request.user_id)
-        
-        predictions = prediction_engine.predict_sequence_risk(request.user_id, request.date)
+        predictions = await run_blocking(_predict_sequence, request.user_id, request.date)
         
         return {
             "user_id": request.user_id,
@@ -227,53 +458,130 @@ async def predict_sequence_risk(request: PredictionRequest):
             "predictions": predictions,
             "model_type": "sequence"
         }
-        
+    
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # Model Training Endpoints
 
+async def _submit_training(user_id: str, kind: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """Queue a training job (or join the model set's active one) and wake the scheduler."""
+    job = await run_blocking(submit_training_job, user_id, kind, params)
+    get_training_scheduler().wake()
+    return job
+
 @app.post("/models/train")
-async def train_models(request: ModelTrainRequest, background_tasks: BackgroundTasks):
-    """Train models for a user."""
+async def train_models(request: ModelTrainRequest):
+    """Queue model training for a user."""
     try:
-        # Add training to background tasks
-        background_tasks.add_task(
-            train_user_models, 
-            request.user_id, 
-            request.targets
-        )
+        job = await _submit_training(request.user_id, "user", {"targets": request.targets})
         
         return {
             "success": True,
-            "message": f"Model training started for user {request.user_id}",
-            "targets": request.targets
+            "message": (f"Model training already {job['status']} for user {request.user_id}"
+                        if job['deduplicated'] else f"Model training queued for user {request.user_id}"),
+            "job_id": job['job_id'],
+            "deduplicated": job['deduplicated'],
+            "targets": job['params'].get('targets', request.targets)
         }
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/models/train/global")
+async def train_global(request: GlobalModelTrainRequest):
+    """Queue training of the cross-user model set, used for users without their own models."""
+    try:
+        job = await _submit_training(GLOBAL_MODEL_ID, "global", {
+            "user_ids": request.user_ids,
+            "dataset_path": request.dataset_path
+        })
+        
+        return {
+            "success": True,
+            "message": (f"Global model training already {job['status']}"
+                        if job['deduplicated'] else "Global model training queued"),
+            "job_id": job['job_id'],
+            "deduplicated": job['deduplicated'],
+            "model_id": GLOBAL_MODEL_ID
+        }
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/models/retrain")
+async def retrain_models(request: ModelRetrainRequest):
+    """Queue retraining for users whose models are due, warm-starting where possible."""
+    try:
+        decisions = await run_blocking(retrain_candidates, request.user_ids)
+        jobs = []
+        for decision in decisions:
+            if decision['action'] == 'skip' and not request.force:
+                continue
+            job = await run_blocking(submit_training_job, decision['user_id'], "retrain",
+                                     {"targets": request.targets, "force": request.force})
+            jobs.append({"user_id": decision['user_id'], "job_id": job['job_id'],
+                         "action": "full" if request.force else decision['action'],
+                         "reason": decision['reason'], "deduplicated": job['deduplicated']})
+        get_training_scheduler().wake()
         
+        return {
+            "success": True,
+            "checked": len(decisions),
+            "queued": len(jobs),
+            "skipped": len(decisions) - len(jobs),
+            "jobs": jobs
+        }
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/models/jobs/{job_id}")
+async def get_training_job(job_id: int):
+    """Get a training job's status and progress."""
+    try:
+        job = await run_blocking(get_job, job_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Training job {job_id} not found")
+    return job
+
+@app.post("/models/jobs/{job_id}/cancel")
+async def cancel_training_job(job_id: int):
+    """Cancel a training job; a running job stops at its next progress report."""
+    try:
+        job = await run_blocking(cancel_job, job_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Training job {job_id} not found")
+    return job
 
 @app.get("/models/{user_id}/status")
 async def get_model_status(user_id: str):
-    """Get model training status."""
+    """Get model training status and the latest training job."""
     try:
+        job = await run_blocking(latest_job, user_id)
+        
         model_dir = Path("models") / user_id
-        if not model_dir.exists():
-            return {
-                "user_id": user_id,
-                "status": "no_models",
-                "models": []
-            }
+        model_names = []
+        if model_dir.exists():
+            models = list(model_dir.glob("*.pkl")) + list(model_dir.glob("*.pth"))
+            model_names = [model.stem for model in models]
         
-        models = list(model_dir.glob("*.pkl")) + list(model_dir.glob("*.pth"))
-        model_names = [model.stem for model in models]
+        if job and job['status'] in ACTIVE_JOB_STATUSES:
+            status = "training"
+        else:
+            status = "trained" if model_names else "no_models"
         
         return {
             "user_id": user_id,
-            "status": "trained" if model_names else "no_models",
-            "models": model_names
+            "status": status,
+            "models": model_names,
+            "job": job
         }
-        
+    
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -283,46 +591,7 @@ async def get_model_status(user_id: str):
 async def get_user_summary(user_id: str):
     """Get user health summary."""
     try:
-        with get_conn() as conn:
-            # Get recent data counts
-            counts = {}
-            
-            # Daily logs
-            daily_count = conn.execute(
-                "SELECT COUNT(*) FROM daily_logs WHERE user_id=?", (user_id,)
-            ).fetchone()[0]
-            counts['daily_logs'] = daily_count
-            
-            # Symptoms
-            symptom_count = conn.execute(
-                "SELECT COUNT(*) FROM symptoms WHERE user_id=?", (user_id,)
-            ).fetchone()[0]
-            counts['symptoms'] = symptom_count
-            
-            # Meals
-            meal_count = conn.execute(
-                "SELECT COUNT(*) FROM meals WHERE user_id=?", (user_id,)
-            ).fetchone()[0]
-            counts['meals'] = meal_count
-            
-            # Sleep sessions
-            sleep_count = conn.execute(
-                "SELECT COUNT(*) FROM sleep_sessions WHERE user_id=?", (user_id,)
-            ).fetchone()[0]
-            counts['sleep_sessions'] = sleep_count
-            
-            # Workouts
-            workout_count = conn.execute(
-                "SELECT COUNT(*) FROM workouts WHERE user_id=?", (user_id,)
-            ).fetchone()[0]
-            counts['workouts'] = workout_count
-            
-            return {
-                "user_id": user_id,
-                "data_counts": counts,
-                "last_updated": datetime.now().isoformat()
-            }
-            
+        return await run_blocking(_query_user_summary, user_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -330,39 +599,112 @@ async def get_user_summary(user_id: str):
 async def get_health_trends(user_id: str, days: int = 30):
     """Get health trends for a user."""
     try:
-        with get_conn() as conn:
-            # Get recent daily logs
-            daily_logs = conn.execute(
-                """SELECT date, mood, stress, energy, focus 
-                   FROM daily_logs 
-                   WHERE user_id=? 
-                   ORDER BY date DESC 
-                   LIMIT ?""",
-                (user_id, days)
-            ).fetchall()
-            
-            # Get recent symptoms
-            symptoms = conn.execute(
-                """SELECT date, type, severity 
-                   FROM symptoms 
-                   WHERE user_id=? 
-                   ORDER BY date DESC 
-                   LIMIT ?""",
-                (user_id, days * 5)  # More symptoms per day
-            ).fetchall()
-            
-            return {
-                "user_id": user_id,
-                "daily_logs": [dict(row) for row in daily_logs],
-                "symptoms": [dict(row) for row in symptoms],
-                "period_days": days
-            }
-            
+        return await run_blocking(_query_health_trends, user_id, days)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # Helper Functions
 
+def _query_user_summary(user_id: str) -> Dict[str, Any]:
+    """Count a user's records per table."""
+    with get_conn(readonly=True) as conn:
+        # Get recent data counts
+        counts = {}
+        
+        # Daily logs
+        daily_count = conn.execute(
+            "SELECT COUNT(*) FROM daily_logs WHERE user_id=?", (user_id,)
+        ).fetchone()[0]
+        counts['daily_logs'] = daily_count
+        
+        # Symptoms
+        symptom_count = conn.execute(
+            "SELECT COUNT(*) FROM symptoms WHERE user_id=?", (user_id,)
+        ).fetchone()[0]
+        counts['symptoms'] = symptom_count
+        
+        # Meals
+        meal_count = conn.execute(
+            "SELECT COUNT(*) FROM meals WHERE user_id=?", (user_id,)
+        ).fetchone()[0]
+        counts['meals'] = meal_count
+        
+        # Sleep sessions
+        sleep_count = conn.execute(
+            "SELECT COUNT(*) FROM sleep_sessions WHERE user_id=?", (user_id,)
+        ).fetchone()[0]
+        counts['sleep_sessions'] = sleep_count
+        
+        # Workouts
+        workout_count = conn.execute(
+            "SELECT COUNT(*) FROM workouts WHERE user_id=?", (user_id,)
+        ).fetchone()[0]
+        counts['workouts'] = workout_count
+        
+        return {
+            "user_id": user_id,
+            "data_counts": counts,
+            "last_updated": datetime.now().isoformat()
+        }
+
+def _query_health_trends(user_id: str, days: int) -> Dict[str, Any]:
+    """Fetch a user's recent daily logs and symptoms."""
+    with get_conn(readonly=True) as conn:
+        # Get recent daily logs
+        daily_logs = conn.execute(
+            """SELECT date, mood, stress, energy, focus 
+               FROM daily_logs 
+               WHERE user_id=? 
+               ORDER BY date DESC 
+               LIMIT ?""",
+            (user_id, days)
+        ).fetchall()
+        
+        # Get recent symptoms
+        symptoms = conn.execute(
+            """SELECT date, type, severity 
+               FROM symptoms 
+               WHERE user_id=? 
+               ORDER BY date DESC 
+               LIMIT ?""",
+            (user_id, days * 5)  # More symptoms per day
+        ).fetchall()
+        
+        return {
+            "user_id": user_id,
+            "daily_logs": [dict(row) for row in daily_logs],
+            "symptoms": [dict(row) for row in symptoms],
+            "period_days": days
+        }
+
+def _get_daily_features(user_id: str, date: str) -> Optional[Dict[str, Any]]:
+    """Stored features for a date, or today's online features if none are stored yet."""
+    features = feature_store.get_daily_features(user_id, date)
+    if features:
+        return features
+    
+    matrix = get_online_engine().current_matrix(user_id, date)
+    if matrix is None:
+        return None
+    return {
+        'features': dict(zip(matrix.feature_names, matrix.X[0].tolist())),
+        'labels': {}
+    }
+
+def _predict_daily(user_id: str, date: str):
+    """Compute daily predictions with explanations from the user's cached models."""
+    # The current day is served from online state, ahead of materialization
+    matrix = get_online_engine().current_matrix(user_id, date)
+    if matrix is None:
+        matrix = prediction_engine.daily_matrix(user_id, date)
+    predictions = prediction_engine.predict_daily_risk(user_id, date, matrix)
+    explanations = prediction_engine.get_explanations(user_id, date, matrix)
+    return predictions, explanations
+
+def _predict_sequence(user_id: str, date: str) -> Dict[str, float]:
+    """Compute sequence predictions from the user's cached models."""
+    return prediction_engine.predict_sequence_risk(user_id, date)
+
 def generate_recommendations(predictions: Dict[str, float], 
                            explanations: Dict[str, Dict[str, float]]) -> List[str]:
     """Generate personalized recommendations based on predictions."""
@@ -387,30 +729,6 @@ def generate_recommendations(predictions: Dict[str, float],
     
     return recommendations
 
-async def train_user_models(user_id: str, targets: List[str]):
-    """Background task to train models for a user."""
-    try:
-        trainer = HealthModelTrainer()
-        
-        # Train trigger classifiers
-        classifiers = trainer.train_trigger_classifiers(user_id)
-        
-        # Train sequence models for each target
-        sequence_models = {}
-        for target in targets:
-            model = trainer.train_sequence_model(user_id, target)
-            if model:
-                sequence_models[f"sequence_{target}"] = model
-        
-        # Save all models
-        all_models = {**classifiers, **sequence_models}
-        trainer.save_models(user_id, all_models)
-        
-        print(f"✅ Models trained for user {user_id}")
-        
-    except Exception as e:
-        print(f"❌ Error training models for user {user_id}: {e}")
-
 # Run the server
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Bulk Import
+===========
+Streaming NDJSON/CSV import for historical backfills (wearable history,
+exports from other apps)
+"""
+
+import csv
+import json
+import time
+import argparse
+import hashlib
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, TextIO, Tuple
+
+from pydantic import BaseModel
+
+from unified_health_ai import INGEST_SPECS, get_conn, init_db, notify_ingest, write_records
+
+# Configuration
+IMPORT_CHUNK_ROWS = 5000      # rows validated and committed per transaction
+IMPORT_MAX_ERROR_SAMPLES = 20
+IMPORT_FORMATS = ("ndjson", "csv")
+IMPORT_FINGERPRINT_BYTES = 1024 * 1024   # leading bytes hashed into default import ids
+
+def iter_rows(stream: TextIO, fmt: str, skip: int = 0) -> Iterator[Optional[Dict[str, Any]]]:
+    """Yield one dict per source row without reading the whole stream.
+    
+    The first `skip` rows are passed over without being decoded. Rows that
+    can't be parsed yield None so row offsets stay stable.
+    """
+    if fmt == "ndjson":
+        for line in stream:
+            line = line.strip()
+            if not line:
+                continue
+            if skip:
+                skip -= 1
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield None
+    elif fmt == "csv":
+        for row in csv.DictReader(stream):
+            if skip:
+                skip -= 1
+                continue
+            # Drop empty cells so model defaults apply
+            values = {key: _parse_csv_value(value) for key, value in row.items()}
+            yield {key: value for key, value in values.items() if value is not None}
+    else:
+        raise ValueError(f"Unknown import format: {fmt}")
+
+def _parse_csv_value(value: Optional[str]) -> Any:
+    """Empty cells are missing values; JSON cells hold lists/objects (tags, triggers)."""
+    if value is None or value == "":
+        return None
+    if value[0] in "[{":
+        try:
+            return json.loads(value)
+        except ValueError:
+            pass
+    return value
+
+def content_fingerprint(fileobj: BinaryIO) -> str:
+    """Size plus a hash of the leading bytes of a seekable binary file; its position is kept."""
+    position = fileobj.tell()
+    size = fileobj.seek(0, 2)
+    fileobj.seek(0)
+    head = fileobj.read(IMPORT_FINGERPRINT_BYTES)
+    fileobj.seek(position)
+    return f"{size}:{hashlib.sha1(head).hexdigest()}"
+
+def default_import_id(source: str, fingerprint: str, data_type: Optional[str] = None,
+                      user_id: Optional[str] = None) -> str:
+    """Checkpoint key for an import without an explicit id; new file contents get a new key."""
+    return hashlib.md5(f"{source}|{fingerprint}|{data_type}|{user_id}".encode()).hexdigest()
+
+def _load_checkpoint(import_id: str) -> Tuple[int, int, bool]:
+    with get_conn(readonly=True) as conn:
+        row = conn.execute(
+            "SELECT rows_done, rows_failed, completed FROM import_checkpoints WHERE import_id=?",
+            (import_id,)
+        ).fetchone()
+    return (row['rows_done'], row['rows_failed'], bool(row['completed'])) if row else (0, 0, False)
+
+def _commit_chunk(import_id: str, source: str, records: List[Tuple[str, BaseModel]],
+                  rows_done: int, rows_failed: int, completed: bool = False) -> None:
+    """Write a chunk and advance its checkpoint in the same transaction."""
+    with get_conn() as conn:
+        write_records(conn, records)
+        conn.execute(
+            """INSERT INTO import_checkpoints (import_id, source, rows_done, rows_failed, completed, updated_at)
+               VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+               ON CONFLICT (import_id) DO UPDATE SET
+                 rows_done=excluded.rows_done, rows_failed=excluded.rows_failed,
+                 completed=excluded.completed, updated_at=excluded.updated_at""",
+            (import_id, source, rows_done, rows_failed, completed)
+        )
+    notify_ingest(records)
+
+def import_stream(stream: TextIO, fmt: str, import_id: str,
+                  data_type: Optional[str] = None, user_id: Optional[str] = None,
+                  source: str = "", chunk_rows: int = IMPORT_CHUNK_ROWS,
+                  progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+                  resume: bool = True) -> Dict[str, Any]:
+    """Import rows from a text stream in chunked transactions.
+    
+    Each row is validated with the data type's ingestion model (VitalIn,
+    SleepSessionIn, WorkoutIn, MealIn, ...). `data_type` and `user_id` apply
+    to every row unless given per row. With `resume`, rows already committed
+    under an unfinished `import_id` are skipped, so rerunning an interrupted
+    import continues at its checkpoint; a completed checkpoint always starts
+    a new import. Memory is bounded by `chunk_rows`.
+    """
+    if data_type is not None and data_type not in INGEST_SPECS:
+        raise ValueError(f"Unknown data type: {data_type}")
+    
+    rows_done, rows_failed, completed = _load_checkpoint(import_id)
+    if completed or not resume:
+        rows_done = rows_failed = 0
+    resumed_at = rows_done
+    stats = {
+        'import_id': import_id,
+        'resumed_at': resumed_at,
+        'imported': 0,
+        'failed': 0,
+        'rows_done': rows_done,
+        'rows_per_sec': 0.0,
+        'errors': [],
+    }
+    start = time.perf_counter()
+    chunk: List[Tuple[str, BaseModel]] = []
+    
+    def flush(completed: bool = False) -> None:
+        _commit_chunk(import_id, source, chunk, rows_done, rows_failed, completed)
+        stats['imported'] += len(chunk)
+        stats['rows_done'] = rows_done
+        stats['rows_per_sec'] = (rows_done - resumed_at) / max(time.perf_counter() - start, 1e-9)
+        chunk.clear()
+        if progress:
+            progress(stats)
+    
+    for offset, row in enumerate(iter_rows(stream, fmt, skip=resumed_at), start=resumed_at):
+        rows_done += 1
+        try:
+            if row is None:
+                raise ValueError("Unparseable row")
+            if not isinstance(row, dict):
+                raise ValueError("Row is not an object")
+            row_type = data_type or row.pop('data_type', None)
+            spec = INGEST_SPECS.get(row_type)
+            if spec is None:
+                raise ValueError(f"Unknown data type: {row_type}")
+            if user_id is not None:
+                row['user_id'] = user_id
+            chunk.append((row_type, spec.model(**row)))
+        except (ValueError, TypeError) as e:
+            rows_failed += 1
+            stats['failed'] += 1
+            if len(stats['errors']) < IMPORT_MAX_ERROR_SAMPLES:
+                stats['errors'].append({'row': offset, 'error': str(e)})
+        
+        if rows_done - resumed_at and (rows_done - resumed_at) % chunk_rows == 0:
+            flush()
+    
+    flush(completed=True)
+    return stats
+
+def import_file(path: str, fmt: Optional[str] = None, import_id: Optional[str] = None,
+                **kwargs) -> Dict[str, Any]:
+    """Import an NDJSON or CSV file; the format defaults to the file extension.
+    
+    Only an explicit `import_id` resumes an interrupted import; without one
+    the file is imported from the start under a key derived from its path
+    and contents.
+    """
+    file_path = Path(path)
+    fmt = fmt or ("csv" if file_path.suffix.lower() == ".csv" else "ndjson")
+    resume = import_id is not None
+    if import_id is None:
+        with open(file_path, "rb") as raw:
+            fingerprint = content_fingerprint(raw)
+        import_id = default_import_id(str(file_path.resolve()), fingerprint,
+                                      kwargs.get('data_type'), kwargs.get('user_id'))
+    with open(file_path, newline="", encoding="utf-8") as stream:
+        return import_stream(stream, fmt, import_id, source=str(file_path), resume=resume, **kwargs)
+
+def _print_progress(stats: Dict[str, Any]) -> None:
+    print(f"  [{stats['import_id']}] {stats['rows_done']} rows ({stats['imported']} imported, "
+          f"{stats['failed']} failed) - {stats['rows_per_sec']:.0f} rows/sec")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream an NDJSON/CSV file into the health database")
+    parser.add_argument("path", help="NDJSON or CSV file")
+    parser.add_argument("--format", choices=IMPORT_FORMATS, help="defaults to the file extension")
+    parser.add_argument("--data-type", choices=sorted(INGEST_SPECS), help="type of every row (else per-row 'data_type')")
+    parser.add_argument("--user-id", help="user of every row (else per-row 'user_id')")
+    parser.add_argument("--import-id", help="checkpoint key; pass a previous run's id to resume it")
+    parser.add_argument("--chunk-rows", type=int, default=IMPORT_CHUNK_ROWS)
+    args = parser.parse_args()
+    
+    init_db()
+    result = import_file(
+        args.path, fmt=args.format, import_id=args.import_id,
+        data_type=args.data_type, user_id=args.user_id,
+        chunk_rows=args.chunk_rows, progress=_print_progress
+    )
+    if result['resumed_at']:
+        print(f"↻ Resumed at row {result['resumed_at']}")
+    for error in result['errors']:
+        print(f"⚠ Row {error['row']}: {error['error']}")
+    print(f"✅ Imported {result['imported']} rows ({result['failed']} failed) "
+          f"at {result['rows_per_sec']:.0f} rows/sec")
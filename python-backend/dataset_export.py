@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Dataset Export
+==============
+Multi-user training datasets, cut off at an as-of date, written once to
+memory-mapped .npy files, so training and backtests open them without
+re-querying SQLite
+"""
+
+import json
+import time
+import hashlib
+import argparse
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+from feature_store import FeatureStore, FeatureMatrix, FEATURE_DTYPE, LABEL_HORIZON, _shift_date
+from unified_health_ai import init_db
+
+# Configuration
+DATASET_DIR = "datasets"
+DATASET_FORMAT_VERSION = 1
+DATASET_FILES = {'X': 'X.npy', 'Y': 'Y.npy', 'dates': 'dates.npy', 'user_index': 'user_index.npy'}
+MANIFEST_FILE = "manifest.json"
+
+class TrainingDataset(NamedTuple):
+    """An exported dataset opened as read-only memory maps.
+    
+    Rows are grouped by user, then ordered by date. Row t holds the
+    stored features of day t and the labels of day t + LABEL_HORIZON;
+    labels dated after the export's as_of are NaN.
+    """
+    X: np.ndarray            # [rows, features] float32
+    Y: np.ndarray            # [rows, labels] float32, NaN = unknown
+    dates: np.ndarray        # [rows] datetime64[D]
+    user_index: np.ndarray   # [rows] index into manifest['users']
+    manifest: Dict[str, Any]
+    
+    @property
+    def feature_names(self) -> List[str]:
+        return self.manifest['feature_names']
+    
+    @property
+    def label_names(self) -> List[str]:
+        return self.manifest['label_names']
+    
+    @property
+    def users(self) -> List[str]:
+        return [user['user_id'] for user in self.manifest['users']]
+    
+    def rows(self, user_id: str) -> slice:
+        """Row range of one user."""
+        for user in self.manifest['users']:
+            if user['user_id'] == user_id:
+                return slice(user['start'], user['stop'])
+        raise KeyError(user_id)
+    
+    def matrix(self, user_id: Optional[str] = None) -> FeatureMatrix:
+        """One user's rows (default: all rows) as a FeatureMatrix over the maps."""
+        rows = self.rows(user_id) if user_id is not None else slice(0, len(self.dates))
+        return FeatureMatrix(
+            self.dates[rows].astype(str).tolist(), self.X[rows], self.feature_names,
+            self.Y[rows], self.label_names
+        )
+
+def open_dataset(path: str) -> TrainingDataset:
+    """Open an exported dataset without reading its arrays into memory."""
+    path = Path(path)
+    manifest_path = path / MANIFEST_FILE
+    if not manifest_path.exists():
+        raise FileNotFoundError(f"No complete dataset at {path} (missing {MANIFEST_FILE})")
+    manifest = json.loads(manifest_path.read_text())
+    if manifest['format_version'] != DATASET_FORMAT_VERSION:
+        raise ValueError(f"Unsupported dataset format version: {manifest['format_version']}")
+    arrays = {name: np.load(path / filename, mmap_mode='r')
+              for name, filename in manifest['files'].items()}
+    return TrainingDataset(arrays['X'], arrays['Y'], arrays['dates'], arrays['user_index'], manifest)
+
+def _plan_export(store: FeatureStore, user_ids: Optional[List[str]], start_date: Optional[str],
+                 end_date: Optional[str]) -> Dict[str, Any]:
+    """Row counts per user and the union of their column layouts."""
+    layouts = store.stored_layouts(user_ids, start_date, end_date)
+    
+    counts: Dict[str, int] = {}
+    feature_names: Dict[str, None] = {}
+    label_names: Dict[str, None] = {}
+    # Newest schema first, so the shared column order follows the latest layout
+    for user_id, schema_id, names, labels, count in sorted(layouts, key=lambda layout: -layout[1]):
+        counts[user_id] = counts.get(user_id, 0) + count
+        feature_names.update(dict.fromkeys(names))
+        label_names.update(dict.fromkeys(labels))
+    
+    return {
+        'counts': {uid: counts[uid] for uid in sorted(counts)},
+        'feature_names': list(feature_names),
+        'label_names': list(label_names),
+    }
+
+def export_dataset(out_dir: str, user_ids: Optional[List[str]] = None,
+                   start_date: Optional[str] = None, end_date: Optional[str] = None,
+                   as_of: Optional[str] = None, features: Optional[List[str]] = None,
+                   materialize: bool = True,
+                   progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """Write stored feature rows of many users to a memory-mappable dataset.
+    
+    Rows and labels dated after `as_of` are excluded: a row's labels are
+    NaN unless day t + LABEL_HORIZON is on or before both `as_of` and the
+    user's last day of data. Rows hold the features as currently stored,
+    so records ingested after `as_of` for earlier dates are included.
+    `features` fixes the column order; it defaults to the union of the
+    users' stored columns. Returns the manifest, which is written last and
+    marks the export complete.
+    """
+    store = FeatureStore()
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    (out / MANIFEST_FILE).unlink(missing_ok=True)
+    start = time.perf_counter()
+    
+    if materialize:
+        # Stored rows must reflect everything ingested so far
+        for user_id in user_ids or []:
+            store.materialize_dirty(user_id)
+        if user_ids is None:
+            store.materialize_dirty()
+    
+    if as_of is not None and (end_date is None or as_of < end_date):
+        end_date = as_of
+    plan = _plan_export(store, user_ids, start_date, end_date)
+    feature_names = features or plan['feature_names']
+    label_names = plan['label_names']
+    total_rows = sum(plan['counts'].values())
+    if not total_rows:
+        raise ValueError("No stored feature rows match the export")
+    
+    X = np.lib.format.open_memmap(out / DATASET_FILES['X'], mode='w+', dtype=FEATURE_DTYPE,
+                                  shape=(total_rows, len(feature_names)))
+    Y = np.lib.format.open_memmap(out / DATASET_FILES['Y'], mode='w+', dtype=FEATURE_DTYPE,
+                                  shape=(total_rows, len(label_names)))
+    dates = np.lib.format.open_memmap(out / DATASET_FILES['dates'], mode='w+',
+                                      dtype='datetime64[D]', shape=(total_rows,))
+    user_index = np.lib.format.open_memmap(out / DATASET_FILES['user_index'], mode='w+',
+                                           dtype=np.int32, shape=(total_rows,))
+    
+    stats = {'users_total': len(plan['counts']), 'users_done': 0, 'rows': 0}
+    users = []
+    offset = 0
+    for i, (user_id, count) in enumerate(plan['counts'].items()):
+        matrix = store.read_feature_matrix(user_id, start_date, end_date)
+        if len(matrix.dates) != count:
+            raise RuntimeError(f"Feature rows of user {user_id} changed during export; rerun it")
+        
+        rows = slice(offset, offset + count)
+        X[rows] = matrix.columns(feature_names)
+        dates[rows] = np.array(matrix.dates, dtype='datetime64[D]')
+        user_index[rows] = i
+        
+        # Labels need day t + LABEL_HORIZON to have happened and been recorded
+        bounds = store.user_date_bounds(user_id)
+        cutoffs = [day for day in (bounds[1] if bounds else None, as_of) if day]
+        label_cutoff = min(cutoffs) if cutoffs else ''
+        known = np.array([_shift_date(day, LABEL_HORIZON) <= label_cutoff for day in matrix.dates])
+        for j, name in enumerate(label_names):
+            Y[rows, j] = np.where(known, matrix.label(name), np.nan)
+        
+        users.append({'user_id': user_id, 'start': offset, 'stop': offset + count,
+                      'first_date': matrix.dates[0], 'last_date': matrix.dates[-1]})
+        offset += count
+        stats['users_done'] += 1
+        stats['rows'] = offset
+        if progress:
+            progress(stats)
+    
+    for array in (X, Y, dates, user_index):
+        array.flush()
+    del X, Y, dates, user_index
+    
+    manifest = {
+        'format_version': DATASET_FORMAT_VERSION,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'start_date': start_date,
+        'end_date': end_date,
+        'as_of': as_of,
+        'label_horizon': LABEL_HORIZON,
+        'rows': total_rows,
+        'feature_names': feature_names,
+        'label_names': label_names,
+        'schema_hash': hashlib.sha1(json.dumps([feature_names, label_names]).encode()).hexdigest(),
+        'dtype': FEATURE_DTYPE.str,
+        'files': DATASET_FILES,
+        'users': users,
+        'elapsed_s': round(time.perf_counter() - start, 3),
+    }
+    (out / MANIFEST_FILE).write_text(json.dumps(manifest, indent=2))
+    return manifest
+
+def _print_progress(stats: Dict[str, Any]) -> None:
+    print(f"  {stats['users_done']}/{stats['users_total']} users - {stats['rows']} rows")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export stored features as a memory-mapped training dataset")
+    parser.add_argument("out_dir", nargs="?", default=f"{DATASET_DIR}/features-{datetime.now():%Y-%m-%d}")
+    parser.add_argument("--users", nargs="+", help="only these users")
+    parser.add_argument("--start-date")
+    parser.add_argument("--end-date")
+    parser.add_argument("--as-of", help="exclude rows and labels dated after this date")
+    parser.add_argument("--no-materialize", action="store_true",
+                        help="export stored rows as they are, without materializing dirty dates first")
+    args = parser.parse_args()
+    
+    init_db()
+    result = export_dataset(
+        args.out_dir, user_ids=args.users, start_date=args.start_date, end_date=args.end_date,
+        as_of=args.as_of, materialize=not args.no_materialize, progress=_print_progress
+    )
+    print(f"✅ Exported {result['rows']} rows for {len(result['users'])} users "
+          f"({len(result['feature_names'])} features, {len(result['label_names'])} labels) "
+          f"to {args.out_dir} in {result['elapsed_s']:.1f}s")
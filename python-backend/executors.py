@@ -0,0 +1,159 @@
+"""
+Execution Layer
+===============
+Off-loop execution for blocking database and CPU-heavy model work
+"""
+
+import os
+import time
+import asyncio
+import functools
+import multiprocessing
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from unified_health_ai import DB_POOL_SIZE
+
+# Configuration
+BLOCKING_WORKERS = DB_POOL_SIZE                    # threads for sqlite3 / file IO
+BLOCKING_CONCURRENCY = DB_POOL_SIZE * 4            # calls admitted before queueing
+CPU_WORKERS = max(1, (os.cpu_count() or 2) - 1)    # processes for pandas / sklearn / torch
+CPU_CONCURRENCY = CPU_WORKERS * 2
+TRAINING_WORKERS = max(1, CPU_WORKERS // 2)        # processes for queued model training jobs
+
+class BoundedExecutor:
+    """Run sync callables off the event loop with a concurrency limit.
+    
+    Calls beyond `max_concurrency` wait on a semaphore inside the event loop
+    rather than piling up in the executor's own queue, so queue depth and
+    wait time can be observed.
+    """
+    
+    def __init__(self, name: str, executor_factory: Callable[[], Executor],
+                 max_workers: int, max_concurrency: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_concurrency = max_concurrency
+        self._executor_factory = executor_factory
+        self._executor: Optional[Executor] = None
+        self._executor_lock = threading.Lock()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stats = {
+            'queued': 0,
+            'running': 0,
+            'completed': 0,
+            'failed': 0,
+            'wait_total_ms': 0.0,
+            'wait_max_ms': 0.0,
+            'run_total_ms': 0.0,
+        }
+    
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = self._executor_factory()
+        return self._executor
+    
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run func(*args, **kwargs) in the pool and await its result."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # asyncio primitives are bound to the loop that first uses them
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        semaphore = self._semaphore
+        
+        stats = self._stats
+        stats['queued'] += 1
+        wait_start = time.perf_counter()
+        try:
+            await semaphore.acquire()
+        finally:
+            stats['queued'] -= 1
+        waited_ms = (time.perf_counter() - wait_start) * 1000
+        stats['wait_total_ms'] += waited_ms
+        stats['wait_max_ms'] = max(stats['wait_max_ms'], waited_ms)
+        
+        stats['running'] += 1
+        run_start = time.perf_counter()
+        try:
+            result = await loop.run_in_executor(
+                self.executor, functools.partial(func, *args, **kwargs)
+            )
+            stats['completed'] += 1
+            return result
+        except BaseException:
+            stats['failed'] += 1
+            raise
+        finally:
+            stats['running'] -= 1
+            stats['run_total_ms'] += (time.perf_counter() - run_start) * 1000
+            semaphore.release()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Concurrency limits and queue-depth metrics."""
+        stats = dict(self._stats)
+        stats['max_workers'] = self.max_workers
+        stats['max_concurrency'] = self.max_concurrency
+        finished = stats['completed'] + stats['failed']
+        stats['wait_avg_ms'] = stats['wait_total_ms'] / max(1, finished + stats['running'])
+        stats['run_avg_ms'] = stats['run_total_ms'] / max(1, finished)
+        return stats
+    
+    def shutdown(self, wait: bool = True) -> None:
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
+
+blocking_executor = BoundedExecutor(
+    "blocking",
+    lambda: ThreadPoolExecutor(max_workers=BLOCKING_WORKERS, thread_name_prefix="blocking"),
+    BLOCKING_WORKERS, BLOCKING_CONCURRENCY
+)
+
+# Spawned (not forked) workers so children never inherit pooled sqlite
+# connections or torch thread state from the server process
+cpu_executor = BoundedExecutor(
+    "cpu",
+    lambda: ProcessPoolExecutor(max_workers=CPU_WORKERS,
+                                mp_context=multiprocessing.get_context("spawn")),
+    CPU_WORKERS, CPU_CONCURRENCY
+)
+
+# Training jobs run long; their own pool keeps them from starving feature work
+training_executor = BoundedExecutor(
+    "training",
+    lambda: ProcessPoolExecutor(max_workers=TRAINING_WORKERS,
+                                mp_context=multiprocessing.get_context("spawn")),
+    TRAINING_WORKERS, TRAINING_WORKERS
+)
+
+async def run_blocking(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run blocking DB / IO work on the bounded thread pool."""
+    return await blocking_executor.run(func, *args, **kwargs)
+
+async def run_cpu(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run CPU-heavy feature / ML work on the process pool.
+    
+    func and its arguments must be picklable (module-level functions).
+    """
+    return await cpu_executor.run(func, *args, **kwargs)
+
+async def run_training(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run a model training job on the training process pool (picklable func)."""
+    return await training_executor.run(func, *args, **kwargs)
+
+def executor_stats() -> Dict[str, Dict[str, Any]]:
+    """Metrics for every execution pool."""
+    return {ex.name: ex.stats() for ex in (blocking_executor, cpu_executor, training_executor)}
+
+def shutdown_executors(wait: bool = True) -> None:
+    """Shut down every pool."""
+    blocking_executor.shutdown(wait=wait)
+    cpu_executor.shutdown(wait=wait)
+    training_executor.shutdown(wait=wait)
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Feature Backfill
+================
+Rebuild stored features for every user in parallel, e.g. nightly after a
+feature-definition change
+"""
+
+import time
+import argparse
+import multiprocessing
+from datetime import date
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional
+
+import feature_store
+from feature_store import FeatureStore
+from unified_health_ai import get_conn, init_db
+from executors import CPU_WORKERS
+
+# Configuration
+BACKFILL_CHUNK_ROWS = 500        # feature rows committed per transaction
+BACKFILL_USERS_PER_TASK = 8      # users handed to a worker at once
+BACKFILL_STAGES = ("build", "persist", "sequences")
+
+def _pending_users(run_id: str, user_ids: Optional[List[str]] = None) -> List[str]:
+    """Users not yet completed in this run, in a stable order."""
+    with get_conn(readonly=True) as conn:
+        rows = conn.execute(
+            """SELECT user_id FROM users
+               WHERE user_id NOT IN (SELECT user_id FROM feature_backfill_progress WHERE run_id=?)
+               ORDER BY user_id""",
+            (run_id,)
+        ).fetchall()
+    pending = [row[0] for row in rows]
+    if user_ids is not None:
+        wanted = set(user_ids)
+        pending = [uid for uid in pending if uid in wanted]
+    return pending
+
+def backfill_user(run_id: str, user_id: str, chunk_rows: int = BACKFILL_CHUNK_ROWS,
+                  store: Optional[FeatureStore] = None) -> Dict[str, Any]:
+    """Rebuild one user's whole feature history and record it as done."""
+    store = store or FeatureStore()
+    timings = {stage: 0.0 for stage in BACKFILL_STAGES}
+    result = {'user_id': user_id, 'rows': 0, 'timings_ms': timings}
+    # Dirty marks older than this are covered by the rebuild
+    started_seq = time.time_ns()
+    
+    bounds = store.user_date_bounds(user_id)
+    if bounds:
+        # Long histories are built in memory-bounded date blocks
+        blocks = store.iter_daily_features(user_id, *bounds)
+        while True:
+            start = time.perf_counter()
+            df = next(blocks, None)
+            timings['build'] += (time.perf_counter() - start) * 1000
+            if df is None:
+                break
+            
+            start = time.perf_counter()
+            for offset in range(0, len(df), chunk_rows):
+                store.persist_daily_features(user_id, df.iloc[offset:offset + chunk_rows])
+            timings['persist'] += (time.perf_counter() - start) * 1000
+            result['rows'] += len(df)
+        
+        if feature_store.MATERIALIZE_SEQUENCES:
+            start = time.perf_counter()
+            store.persist_sequence_features(user_id, store.build_sequence_features(user_id, *bounds))
+            timings['sequences'] = (time.perf_counter() - start) * 1000
+    
+    with get_conn() as conn:
+        conn.execute(
+            "DELETE FROM fs_dirty_dates WHERE user_id=? AND seq < ?", (user_id, started_seq)
+        )
+        conn.execute(
+            """INSERT OR REPLACE INTO feature_backfill_progress (run_id, user_id, rows, completed_at)
+               VALUES (?, ?, ?, CURRENT_TIMESTAMP)""",
+            (run_id, user_id, result['rows'])
+        )
+    return result
+
+def backfill_users(run_id: str, user_ids: List[str],
+                   chunk_rows: int = BACKFILL_CHUNK_ROWS) -> List[Dict[str, Any]]:
+    """Backfill a partition of users; runs in a worker process.
+    
+    A failing user is reported and left pending so the next run retries it.
+    """
+    store = FeatureStore()
+    results = []
+    for user_id in user_ids:
+        try:
+            results.append(backfill_user(run_id, user_id, chunk_rows, store))
+        except Exception as e:
+            results.append({'user_id': user_id, 'error': str(e)})
+    return results
+
+def run_backfill(run_id: str, user_ids: Optional[List[str]] = None,
+                 workers: int = CPU_WORKERS, users_per_task: int = BACKFILL_USERS_PER_TASK,
+                 chunk_rows: int = BACKFILL_CHUNK_ROWS,
+                 progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """Rebuild features for all (or the given) users across a process pool.
+    
+    Users completed under `run_id` are skipped, so rerunning an interrupted
+    backfill resumes where it stopped.
+    """
+    pending = _pending_users(run_id, user_ids)
+    stats = {
+        'run_id': run_id,
+        'users_total': len(pending),
+        'users_done': 0,
+        'users_failed': 0,
+        'rows': 0,
+        'users_per_min': 0.0,
+        'stage_ms': {stage: 0.0 for stage in BACKFILL_STAGES},
+        'errors': [],
+    }
+    start = time.perf_counter()
+    
+    partitions = [pending[i:i + users_per_task] for i in range(0, len(pending), users_per_task)]
+    # Spawned workers open their own pooled connections
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = [pool.submit(backfill_users, run_id, part, chunk_rows) for part in partitions]
+        for future in as_completed(futures):
+            for result in future.result():
+                if 'error' in result:
+                    stats['users_failed'] += 1
+                    stats['errors'].append(result)
+                    continue
+                stats['users_done'] += 1
+                stats['rows'] += result['rows']
+                for stage, ms in result['timings_ms'].items():
+                    stats['stage_ms'][stage] += ms
+            elapsed_min = (time.perf_counter() - start) / 60
+            stats['users_per_min'] = stats['users_done'] / max(elapsed_min, 1e-9)
+            if progress:
+                progress(stats)
+    
+    stats['elapsed_s'] = time.perf_counter() - start
+    return stats
+
+def _print_progress(stats: Dict[str, Any]) -> None:
+    print(f"  {stats['users_done'] + stats['users_failed']}/{stats['users_total']} users "
+          f"({stats['users_failed']} failed) - {stats['users_per_min']:.1f} users/min")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild stored features for every user")
+    parser.add_argument("--run-id", default=f"features-{date.today().isoformat()}",
+                        help="progress key; reuse it to resume (default: today's date)")
+    parser.add_argument("--users", nargs="+", help="only these users")
+    parser.add_argument("--workers", type=int, default=CPU_WORKERS)
+    parser.add_argument("--users-per-task", type=int, default=BACKFILL_USERS_PER_TASK)
+    parser.add_argument("--chunk-rows", type=int, default=BACKFILL_CHUNK_ROWS)
+    args = parser.parse_args()
+    
+    init_db()
+    result = run_backfill(
+        args.run_id, user_ids=args.users, workers=args.workers,
+        users_per_task=args.users_per_task, chunk_rows=args.chunk_rows,
+        progress=_print_progress
+    )
+    for error in result['errors']:
+        print(f"⚠ User {error['user_id']}: {error['error']}")
+    done = max(result['users_done'], 1)
+    for stage, ms in result['stage_ms'].items():
+        print(f"  {stage}: {ms / 1000:.1f}s total, {ms / done:.1f}ms/user")
+    print(f"✅ Backfilled {result['users_done']} users ({result['rows']} rows, "
+          f"{result['users_failed']} failed) in {result['elapsed_s']:.1f}s "
+          f"at {result['users_per_min']:.1f} users/min")
+    
+    memory = FeatureStore().fleet_memory_report(args.users)
+    mb = 1024 * 1024
+    print(f"  training set: {memory['frame_bytes'] / mb:.1f} MB float64, "
+          f"{memory['row_bytes'] / mb:.1f} MB float32, {memory['compact_row_bytes'] / mb:.1f} MB compact "
+          f"({memory['row_saved_pct']:.0f}% saved); {memory['stored_bytes'] / mb:.1f} MB stored")
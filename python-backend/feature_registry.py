@@ -0,0 +1,164 @@
+"""
+Feature Registry
+================
+Declarative feature definitions resolved as a dependency graph, so a
+build computes only the features it is asked for
+"""
+
+import numpy as np
+from typing import Callable, Dict, Iterable, List, Mapping, MutableMapping, NamedTuple, Optional, Set, Tuple
+
+FEATURE_KINDS = ("feature", "label", "intermediate")
+
+class FeatureDef(NamedTuple):
+    """One registered feature, label or intermediate node."""
+    name: str
+    inputs: Tuple[str, ...]              # source columns or registered nodes
+    compute: Callable[..., np.ndarray]   # called with one array per input
+    window: int = 1                      # trailing days of input read per row
+    lead: int = 0                        # days ahead of the row read (labels)
+    dtype: np.dtype = np.dtype(np.float64)
+    kind: str = "feature"
+    compact_dtype: np.dtype = np.dtype(np.float32)   # narrow type of compact mode
+    partial: bool = False                # computable from any of its inputs (see register)
+
+class FeatureRegistry:
+    """Feature definitions in registration order.
+    
+    Inputs that are not registered nodes are source columns supplied by the
+    caller. A node may only use nodes registered before it, so the graph is
+    acyclic and registration order is a valid evaluation order; it is also
+    the column order of every build.
+    """
+    
+    def __init__(self):
+        self._defs: Dict[str, FeatureDef] = {}
+        self._source_inputs: Set[str] = set()
+    
+    def register(self, name: str, inputs: Iterable[str], compute: Callable[..., np.ndarray],
+                 window: int = 1, lead: int = 0, dtype=np.float64,
+                 kind: str = "feature", compact_dtype=np.float32,
+                 partial: bool = False) -> FeatureDef:
+        """Add a node; its inputs must be source columns or earlier nodes.
+        
+        A partial node (e.g. one kernel over many columns) is available once
+        any input is, and is called with None for the missing ones. Its
+        inputs are not sources of its own: each dependent names the inputs
+        it reads, so a targeted build reads only those.
+        """
+        if kind not in FEATURE_KINDS:
+            raise ValueError(f"Unknown feature kind: {kind}")
+        if name in self._defs:
+            raise ValueError(f"Feature already registered: {name}")
+        if name in self._source_inputs:
+            raise ValueError(f"{name} is already used as a source column by an earlier feature")
+        
+        inputs = tuple(inputs)
+        for dep in inputs:
+            if dep not in self._defs:
+                self._source_inputs.add(dep)
+        
+        definition = FeatureDef(name, inputs, compute, window, lead, np.dtype(dtype), kind,
+                                np.dtype(compact_dtype), partial)
+        self._defs[name] = definition
+        return definition
+    
+    def feature(self, name: str, *inputs: str, **options) -> Callable:
+        """Decorator form of register."""
+        def decorator(compute: Callable[..., np.ndarray]) -> Callable[..., np.ndarray]:
+            self.register(name, inputs, compute, **options)
+            return compute
+        return decorator
+    
+    def __contains__(self, name: str) -> bool:
+        return name in self._defs
+    
+    def __getitem__(self, name: str) -> FeatureDef:
+        return self._defs[name]
+    
+    def names(self, kinds: Iterable[str] = ("feature", "label")) -> List[str]:
+        """Registered names of the given kinds, in order."""
+        kinds = set(kinds)
+        return [name for name, d in self._defs.items() if d.kind in kinds]
+    
+    def dependencies(self, names: Iterable[str], provided: Iterable[str] = ()) -> List[str]:
+        """The registered nodes needed for `names` (including them), in evaluation order.
+        
+        Nodes in `provided` are already computed, so neither they nor their
+        inputs are needed.
+        """
+        provided = set(provided)
+        needed: Set[str] = set()
+        stack = [name for name in names if name in self._defs]
+        while stack:
+            name = stack.pop()
+            if name not in needed and name not in provided:
+                needed.add(name)
+                stack.extend(dep for dep in self._defs[name].inputs if dep in self._defs)
+        return [name for name in self._defs if name in needed]
+    
+    def sources(self, names: Iterable[str]) -> Set[str]:
+        """Source columns `names` read, directly or through other nodes."""
+        names = list(names)
+        out = {name for name in names if name not in self._defs}
+        for node in self.dependencies(names):
+            d = self._defs[node]
+            if not d.partial or node in names:
+                out.update(dep for dep in d.inputs if dep not in self._defs)
+        return out
+    
+    def available(self, provided: Iterable[str], names: Optional[Iterable[str]] = None,
+                  kinds: Iterable[str] = ("feature", "label")) -> List[str]:
+        """Registered names computable from the provided columns, in order.
+        
+        `provided` may include registered nodes (e.g. a precomputed
+        intermediate), which then count as available without their inputs.
+        Restricted to `names` if given.
+        """
+        ready = set(provided)
+        for name, d in self._defs.items():
+            if name not in ready and (any if d.partial else all)(dep in ready for dep in d.inputs):
+                ready.add(name)
+        
+        kinds = set(kinds)
+        wanted = None if names is None else set(names)
+        return [name for name, d in self._defs.items()
+                if name in ready and (d.kind in kinds if wanted is None else name in wanted)]
+    
+    def _reach(self, names: Optional[Iterable[str]], extent: Callable[[FeatureDef], int]) -> int:
+        """Largest cumulative extent along any dependency path of `names`."""
+        reach: Dict[str, int] = {}
+        for name, d in self._defs.items():
+            own = extent(d)
+            reach[name] = own + max((reach.get(dep, 0) for dep in d.inputs), default=0)
+        nodes = self._defs if names is None else [name for name in names if name in self._defs]
+        return max((reach[name] for name in nodes), default=0)
+    
+    def lookback(self, names: Optional[Iterable[str]] = None) -> int:
+        """Days before a row whose source data can change `names` (default: all)."""
+        return self._reach(names, lambda d: d.window - 1)
+    
+    def lead(self, names: Optional[Iterable[str]] = None) -> int:
+        """Days after a row whose source data can change `names` (default: all)."""
+        return self._reach(names, lambda d: d.lead)
+    
+    def evaluate(self, names: Iterable[str], inputs: Mapping[str, np.ndarray],
+                 cache: Optional[MutableMapping[str, np.ndarray]] = None) -> Dict[str, np.ndarray]:
+        """Compute `names` from source arrays, each node at most once.
+        
+        Nodes present in `inputs` or `cache` are not recomputed; every node
+        computed along the way is left in `cache` for later calls over the
+        same inputs.
+        """
+        names = list(names)
+        cache = {} if cache is None else cache
+        
+        def value(name: str) -> np.ndarray:
+            return cache[name] if name in cache else inputs[name]
+        
+        for name in self.dependencies(names, provided=set(inputs) | set(cache)):
+            d = self._defs[name]
+            args = [cache.get(dep, inputs.get(dep)) if d.partial else value(dep) for dep in d.inputs]
+            cache[name] = np.asarray(d.compute(*args)).astype(d.dtype, copy=False)
+        
+        return {name: value(name) for name in names}
@@ -6,26 +6,571 @@ Materialized feature engineering for health AI system
 
 import json
 import math
+import time
+import hashlib
+import threading
 import numpy as np
 import pandas as pd
-from typing import Dict, List, Optional, Tuple, Any
+from typing import Dict, Iterator, List, NamedTuple, Optional, Set, Tuple, Any
 from datetime import datetime, timedelta
+from functools import partial
+from collections import OrderedDict
+from numpy.lib.stride_tricks import sliding_window_view
 import sqlite3
 from pathlib import Path
 
-from unified_health_ai import get_conn, ROLL_DAYS, SEQ_LEN
+from unified_health_ai import get_conn, ROLL_DAYS, SEQ_LEN, INGEST_SPECS
+from feature_registry import FeatureRegistry
+
+MAX_LAG = 3                # lag features go back this many days
+HRV_BASELINE_DAYS = 7      # window of the hrv_recovery baseline
+LABEL_HORIZON = 1          # labels look this many days ahead
+FEATURE_MATERIALIZE_INTERVAL_S = 60
+FEATURE_DTYPE = np.dtype('<f4')   # storage type of feature and label vectors
+# Also write every sequence window to fs_seq_user; windows are otherwise
+# built on demand from fs_daily_user
+MATERIALIZE_SEQUENCES = False
+# "numpy" = registry-driven array kernel, "pandas" = reference implementation
+FEATURE_KERNEL = "numpy"
+FEATURE_CACHE_MAX_ENTRIES = 4096   # cached per-day reads (daily rows, sequence windows)
+FEATURE_CACHE_TTL_S = 300          # bounds staleness from writers in other processes
+# Long rebuilds run in date blocks sized so one block's frames fit this budget
+FEATURE_BUILD_MEMORY_MB = 64
+FEATURE_BUILD_BYTES_PER_VALUE = 64   # peak bytes per (day, column) of a build, measured
+# Build frames and stored rows with each column's narrow compact dtype
+# (int8/int16/float32); reads still return float32 matrices
+FEATURE_COMPACT = False
+
+ROLLING_COLUMNS = ['caffeine', 'sleep_min', 'sleep_score', 'hrv_ms', 'steps', 
+                   'mood', 'stress', 'energy', 'focus', 'workout_count']
+LAG_COLUMNS = ['mood', 'stress', 'sleep_score', 'caffeine', 'workout_count']
+# Next-day label: (symptom or log column, comparison, threshold)
+LABEL_RULES = {
+    'y_gut_next': ('gut', '>=', 5),
+    'y_skin_next': ('skin', '>=', 5),
+    'y_mood_next': ('mood', '<=', 3),       # Low mood
+    'y_stress_next': ('stress', '>=', 8),   # High stress
+}
+
+# Base columns each source table contributes, in merge order; symptom
+# columns are the user's symptom types and sit between daily_logs and workouts
+SOURCE_COLUMNS = {
+    'meals': ['caffeine', 'meals_cnt', 'avg_calories', 'total_protein', 'total_carbs', 'total_fat', 'total_fiber', 'total_sugar'],
+    'sleep_sessions': ['sleep_min', 'sleep_score', 'deep_min', 'rem_min', 'avg_awakenings'],
+    'vitals': ['hrv_ms', 'steps', 'hr_mean', 'hr_max', 'spo2', 'active_min', 'calories_burned'],
+    'daily_logs': ['mood', 'stress', 'energy', 'focus'],
+    'symptoms': [],
+    'workouts': ['workout_count', 'total_workout_min', 'avg_intensity', 'workout_calories'],
+}
+# Compact dtypes of integer-valued base columns; other known columns are
+# float32 and symptom types (0-10 severities) int8
+BASE_COMPACT_DTYPES = {
+    'meals_cnt': np.int16, 'steps': np.int32, 'mood': np.int8, 'stress': np.int8,
+    'energy': np.int8, 'focus': np.int8, 'workout_count': np.int16,
+}
+
+def _shift_date(day: str, days: int) -> str:
+    """Shift an ISO date string by a number of days."""
+    return (datetime.strptime(day, "%Y-%m-%d") + timedelta(days=days)).strftime("%Y-%m-%d")
+
+def date_runs(dates: List[str]) -> List[Tuple[str, str]]:
+    """Runs of consecutive ISO dates as (first, last) pairs, in order."""
+    runs: List[Tuple[str, str]] = []
+    for day in sorted(set(dates)):
+        if runs and _shift_date(runs[-1][1], 1) == day:
+            runs[-1] = (runs[-1][0], day)
+        else:
+            runs.append((day, day))
+    return runs
+
+def rolling_stats(X: np.ndarray, window: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Trailing-window mean, std, min and max of every column of X.
+    
+    Matches pandas rolling(window, min_periods=1): NaNs are skipped, std is
+    the sample std (NaN below two values) and windows with no values are
+    NaN. Sums come from one cumulative sum per statistic; min/max reduce a
+    strided window view.
+    """
+    n, k = X.shape
+    valid = ~np.isnan(X)
+    # Centering each column keeps the sum-of-squares variance precise
+    center = np.zeros(k)
+    has_values = valid.any(axis=0)
+    center[has_values] = np.nanmean(X[:, has_values], axis=0)
+    dev = np.where(valid, X - center, 0.0)
+    
+    ends = np.arange(1, n + 1)
+    starts = np.maximum(ends - window, 0)
+    
+    def trailing_sum(values: np.ndarray) -> np.ndarray:
+        cumsum = np.zeros((n + 1, k))
+        np.cumsum(values, axis=0, out=cumsum[1:])
+        return cumsum[ends] - cumsum[starts]
+    
+    count = trailing_sum(valid.astype(np.float64))
+    total = trailing_sum(dev)
+    squares = trailing_sum(dev * dev)
+    
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count + center
+        var = (squares - total * total / count) / (count - 1)
+    mean[count == 0] = np.nan
+    
+    padded = np.vstack([np.full((window - 1, k), np.nan), X])
+    windows = sliding_window_view(padded, window, axis=0)  # [n, k, window]
+    missing = np.isnan(windows)
+    rmin = np.where(missing, np.inf, windows).min(axis=2)
+    rmax = np.where(missing, -np.inf, windows).max(axis=2)
+    rmin[count == 0] = np.nan
+    rmax[count == 0] = np.nan
+    
+    std = np.sqrt(np.clip(var, 0, None))
+    # Constant windows are exact, not the cumulative sums' rounding residue
+    constant = rmin == rmax
+    mean[constant] = rmin[constant]
+    std[constant] = 0.0
+    std[count < 2] = np.nan
+    return mean, std, rmin, rmax
+
+def _lag(values: np.ndarray, lag: int) -> np.ndarray:
+    """values shifted down by lag rows, NaN-filled at the top."""
+    out = np.full_like(values, np.nan)
+    if lag < len(values):
+        out[lag:] = values[:len(values) - lag]
+    return out
+
+def _lead(values: np.ndarray, lead: int) -> np.ndarray:
+    """values shifted up by lead rows, NaN-filled at the bottom."""
+    out = np.full_like(values, np.nan)
+    if lead < len(values):
+        out[:len(values) - lead] = values[lead:]
+    return out
+
+ROLLING_STATS = ['rmean', 'rstd', 'rmin', 'rmax']
+
+def _rolling(*columns: Optional[np.ndarray], window: int) -> np.ndarray:
+    """[rows, columns, 4] trailing mean, std (0 below two values), min and max.
+    
+    One rolling_stats pass over the given columns stacked; columns passed
+    as None are left NaN.
+    """
+    present = [i for i, values in enumerate(columns) if values is not None]
+    n = len(columns[present[0]])
+    out = np.full((n, len(columns), len(ROLLING_STATS)), np.nan)
+    mean, std, rmin, rmax = rolling_stats(np.column_stack([columns[i] for i in present]), window)
+    out[:, present] = np.stack([mean, np.nan_to_num(std, nan=0.0), rmin, rmax], axis=2)
+    return out
+
+def _select(stats: np.ndarray, column: np.ndarray, i: int, j: int) -> np.ndarray:
+    """Statistic j of rolling column i; `column` only ties the feature to its source."""
+    return stats[:, i, j]
+
+def _sleep_efficiency(sleep_min: np.ndarray, awakenings: np.ndarray) -> np.ndarray:
+    with np.errstate(invalid='ignore', divide='ignore'):
+        efficiency = sleep_min / (sleep_min + awakenings * 10)
+    return np.clip(np.where(np.isnan(efficiency), 0.0, efficiency), 0, 1)
+
+def _hrv_recovery(hrv_ms: np.ndarray, baseline: np.ndarray) -> np.ndarray:
+    with np.errstate(invalid='ignore', divide='ignore'):
+        recovery = hrv_ms / baseline
+    return np.where(np.isnan(recovery), 1.0, recovery)
+
+def _label(values: np.ndarray, op: str, threshold: float) -> np.ndarray:
+    upcoming = _lead(values, LABEL_HORIZON)
+    # Comparisons with NaN (no next day) are False
+    with np.errstate(invalid='ignore'):
+        return upcoming >= threshold if op == '>=' else upcoming <= threshold
+
+def _register_features(registry: FeatureRegistry) -> None:
+    """Register every feature, in stored column order after the base columns."""
+    # Every rolling statistic of every column comes from one pass
+    stats = f'rolling_{ROLL_DAYS}'
+    registry.register(stats, ROLLING_COLUMNS, partial(_rolling, window=ROLL_DAYS),
+                      window=ROLL_DAYS, kind='intermediate', partial=True)
+    for i, col in enumerate(ROLLING_COLUMNS):
+        for j, stat in enumerate(ROLLING_STATS):
+            # Window extremes keep the type of their column
+            narrow = BASE_COMPACT_DTYPES.get(col, np.float32) if stat in ('rmin', 'rmax') else np.float32
+            registry.register(f'{col}_{stat}_{ROLL_DAYS}', (stats, col), partial(_select, i=i, j=j),
+                              compact_dtype=narrow)
+    
+    for col in LAG_COLUMNS:
+        for lag in range(1, MAX_LAG + 1):
+            registry.register(f'{col}_lag{lag}', (col,), partial(_lag, lag=lag), window=lag + 1)
+    
+    registry.register('sleep_efficiency', ('sleep_min', 'avg_awakenings'), _sleep_efficiency)
+    # Caffeine timing (simplified)
+    registry.register('caffeine_afternoon', ('caffeine',), lambda caffeine: caffeine * 0.7)
+    registry.register('caffeine_evening', ('caffeine',), lambda caffeine: caffeine * 0.3)
+    registry.register('stress_sleep_interaction', ('stress', 'sleep_score'),
+                      lambda stress, sleep_score: stress * (10 - sleep_score))
+    registry.register('exercise_load', ('total_workout_min', 'avg_intensity'),
+                      lambda minutes, intensity: minutes * intensity)
+    if HRV_BASELINE_DAYS == ROLL_DAYS:
+        # Already computed by the rolling pass
+        registry.register('hrv_baseline', (f'hrv_ms_rmean_{ROLL_DAYS}',), lambda mean: mean,
+                          kind='intermediate')
+    else:
+        registry.register('hrv_baseline', ('hrv_ms',),
+                          lambda hrv: rolling_stats(hrv[:, None], HRV_BASELINE_DAYS)[0][:, 0],
+                          window=HRV_BASELINE_DAYS, kind='intermediate')
+    registry.register('hrv_recovery', ('hrv_ms', 'hrv_baseline'), _hrv_recovery)
+    
+    for name, (col, op, threshold) in LABEL_RULES.items():
+        registry.register(name, (col,), partial(_label, op=op, threshold=threshold),
+                          lead=LABEL_HORIZON, dtype=np.int64, kind='label', compact_dtype=np.int8)
+
+FEATURES = FeatureRegistry()
+_register_features(FEATURES)
+
+DERIVED_FEATURES = ['sleep_efficiency', 'caffeine_afternoon', 'caffeine_evening',
+                    'stress_sleep_interaction', 'exercise_load', 'hrv_recovery']
+DERIVED_INPUTS = sorted(FEATURES.sources(DERIVED_FEATURES))
+# Days before a feature row whose raw data can change it
+FEATURE_LOOKBACK_DAYS = FEATURES.lookback()
+
+def compact_dtype(name: str) -> np.dtype:
+    """Narrow dtype of a base column, feature or label in compact mode."""
+    if name in FEATURES:
+        return FEATURES[name].compact_dtype
+    if name in BASE_COMPACT_DTYPES:
+        return np.dtype(BASE_COMPACT_DTYPES[name])
+    known = {col for cols in SOURCE_COLUMNS.values() for col in cols}
+    return FEATURE_DTYPE if name in known else np.dtype(np.int8)
+
+def compact_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """df with every value column cast to its compact dtype.
+    
+    A column whose values don't fit its integer type (fractions, NaN or
+    out of range) falls back to float32.
+    """
+    casts = {}
+    for col in df.columns:
+        if col == 'date':
+            continue
+        dtype = compact_dtype(col)
+        if dtype.kind in 'iu':
+            values = df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+            info = np.iinfo(dtype)
+            if not (np.all(np.isfinite(values)) and np.all(values == np.round(values))
+                    and (not len(values) or (values.min() >= info.min and values.max() <= info.max))):
+                dtype = FEATURE_DTYPE
+        casts[col] = dtype
+    return df.astype(casts, copy=False)
+
+def derived_features(values: Dict[str, np.ndarray],
+                     hrv_baseline: Optional[np.ndarray] = None) -> List[Tuple[str, np.ndarray]]:
+    """Derived features computable from base column arrays, in feature order.
+    
+    hrv_baseline is the trailing HRV_BASELINE_DAYS mean of hrv_ms, for
+    callers (the online engine) that keep it incrementally.
+    """
+    inputs = dict(values)
+    if hrv_baseline is not None:
+        inputs['hrv_baseline'] = hrv_baseline
+    else:
+        inputs.pop('hrv_ms', None)
+    names = FEATURES.available(inputs, DERIVED_FEATURES)
+    computed = FEATURES.evaluate(names, inputs)
+    return [(name, computed[name]) for name in names]
+
+class FeatureMatrix(NamedTuple):
+    """Stored daily feature rows of one user as aligned arrays."""
+    dates: List[str]
+    X: np.ndarray              # [rows, features] float32
+    feature_names: List[str]
+    Y: np.ndarray              # [rows, labels] float32, NaN = unknown
+    label_names: List[str]
+    
+    def columns(self, names: List[str]) -> np.ndarray:
+        """X with columns in the given order; names not stored are 0."""
+        index = {name: i for i, name in enumerate(self.feature_names)}
+        out = np.zeros((len(self.dates), len(names)), dtype=FEATURE_DTYPE)
+        for j, name in enumerate(names):
+            if name in index:
+                out[:, j] = self.X[:, index[name]]
+        return out
+    
+    def label(self, name: str) -> np.ndarray:
+        """One label column; NaN where the label isn't stored."""
+        if name in self.label_names:
+            return self.Y[:, self.label_names.index(name)]
+        return np.full(len(self.dates), np.nan, dtype=FEATURE_DTYPE)
+    
+    def labels_at(self, i: int) -> Dict[str, Optional[int]]:
+        """Labels of one row; unknown labels are None."""
+        return {name: None if np.isnan(value) else int(value)
+                for name, value in zip(self.label_names, self.Y[i].tolist())}
+    
+    def merge(self, other: "FeatureMatrix") -> "FeatureMatrix":
+        """Rows of both matrices by date, other's row winning on shared dates.
+        
+        Columns are the union of both layouts; a column missing from a row's
+        matrix is 0 (features) or NaN (labels) there.
+        """
+        feature_names = list(dict.fromkeys(self.feature_names + other.feature_names))
+        label_names = list(dict.fromkeys(self.label_names + other.label_names))
+        X = np.vstack([self.columns(feature_names), other.columns(feature_names)])
+        Y = np.vstack([np.column_stack([m.label(name) for name in label_names])
+                       if label_names else np.empty((len(m.dates), 0), dtype=FEATURE_DTYPE)
+                       for m in (self, other)])
+        source = {day: i for i, day in enumerate(self.dates)}
+        source.update((day, len(self.dates) + i) for i, day in enumerate(other.dates))
+        dates = sorted(source)
+        rows = [source[day] for day in dates]
+        return FeatureMatrix(dates, X[rows], feature_names, Y[rows], label_names)
+
+class SequenceView:
+    """Sequence windows over a daily feature matrix, without copying rows.
+    
+    Window i covers rows i..i+seq_len-1 and is paired with the date and
+    labels of the following row, so a matrix of n rows has n - seq_len
+    windows.
+    """
+    
+    def __init__(self, matrix: FeatureMatrix, seq_len: int = SEQ_LEN):
+        self.matrix = matrix
+        self.seq_len = seq_len
+    
+    def __len__(self) -> int:
+        return max(0, len(self.matrix.dates) - self.seq_len)
+    
+    @property
+    def dates(self) -> List[str]:
+        """Date each window predicts for."""
+        return self.matrix.dates[self.seq_len:]
+    
+    @property
+    def windows(self) -> np.ndarray:
+        """All windows as a read-only strided [windows, seq_len, features] view."""
+        X = self.matrix.X
+        if not len(self):
+            return np.empty((0, self.seq_len, X.shape[1]), dtype=X.dtype)
+        return sliding_window_view(X[:-1], self.seq_len, axis=0).transpose(0, 2, 1)
+    
+    def window(self, i: int) -> np.ndarray:
+        """Window i as a [seq_len, features] view."""
+        return self.matrix.X[i:i + self.seq_len]
+    
+    def label(self, name: str) -> np.ndarray:
+        """One label per window."""
+        return self.matrix.label(name)[self.seq_len:]
+    
+    def labels_at(self, i: int) -> Dict[str, Optional[int]]:
+        """Labels of window i; unknown labels are None."""
+        return self.matrix.labels_at(i + self.seq_len)
+
+class FeatureCache:
+    """Read-through LRU cache of per-day feature reads, with TTL expiry.
+    
+    Entries are keyed by (user_id, date, kind) and must be treated as
+    read-only. Ingestion invalidates the window of dates a record can
+    change (register `on_ingest` with unified_health_ai.add_ingest_listener);
+    users touched since the last `take_pending` should be invalidated again
+    once their rows are re-materialized.
+    """
+    
+    def __init__(self, max_entries: int = FEATURE_CACHE_MAX_ENTRIES,
+                 ttl_s: float = FEATURE_CACHE_TTL_S):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._entries: "OrderedDict[Tuple[str, str, str], Tuple[float, Any]]" = OrderedDict()
+        self._by_user: Dict[str, Set[Tuple[str, str, str]]] = {}
+        self._pending: Set[str] = set()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+    
+    def _drop(self, key: Tuple[str, str, str]) -> None:
+        del self._entries[key]
+        keys = self._by_user[key[0]]
+        keys.discard(key)
+        if not keys:
+            del self._by_user[key[0]]
+    
+    def get(self, key: Tuple[str, str, str], default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                self._drop(key)
+                self._stats['expirations'] += 1
+                entry = None
+            if entry is None:
+                self._stats['misses'] += 1
+                return default
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry[1]
+    
+    def put(self, key: Tuple[str, str, str], value: Any) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl_s, value)
+            self._by_user.setdefault(key[0], set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self._stats['evictions'] += 1
+    
+    def invalidate(self, user_id: str, start_date: Optional[str] = None,
+                   end_date: Optional[str] = None) -> int:
+        """Drop a user's entries, optionally only those dated within a range."""
+        with self._lock:
+            keys = [key for key in self._by_user.get(user_id, ())
+                    if (start_date is None or key[1] >= start_date)
+                    and (end_date is None or key[1] <= end_date)]
+            for key in keys:
+                self._drop(key)
+            self._stats['invalidations'] += len(keys)
+            return len(keys)
+    
+    def on_ingest(self, records: List[Tuple[str, Any]]) -> None:
+        """Ingest listener: drop every cached day a record can change."""
+        windows: Dict[str, Tuple[str, str]] = {}
+        for data_type, record in records:
+            feature_date = INGEST_SPECS[data_type].feature_date
+            if feature_date is None:
+                continue
+            day = feature_date(record).isoformat()
+            # Its label row before it, the rows whose windows read it, and
+            # the sequence windows ending on those rows
+            start = _shift_date(day, -LABEL_HORIZON)
+            end = _shift_date(day, FEATURE_LOOKBACK_DAYS + SEQ_LEN)
+            if record.user_id in windows:
+                low, high = windows[record.user_id]
+                start, end = min(start, low), max(end, high)
+            windows[record.user_id] = (start, end)
+        
+        for user_id, (start, end) in windows.items():
+            self.invalidate(user_id, start, end)
+        with self._lock:
+            self._pending.update(windows)
+    
+    def take_pending(self, user_id: Optional[str] = None) -> Set[str]:
+        """Users ingested for since the last call (or just user_id, if pending)."""
+        with self._lock:
+            if user_id is None:
+                pending, self._pending = self._pending, set()
+                return pending
+            if user_id in self._pending:
+                self._pending.discard(user_id)
+                return {user_id}
+            return set()
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Size and hit/miss/eviction counters."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        stats['max_entries'] = self.max_entries
+        stats['ttl_s'] = self.ttl_s
+        return stats
+
+_feature_cache: Optional[FeatureCache] = None
+
+def get_feature_cache() -> FeatureCache:
+    """Get the process-wide feature read cache."""
+    global _feature_cache
+    if _feature_cache is None:
+        _feature_cache = FeatureCache()
+    return _feature_cache
+
+def _stack_vectors(blobs: List[bytes], width: int) -> np.ndarray:
+    """Concatenate float32 BLOBs into a writable [rows, width] array."""
+    buffer = bytearray()
+    for blob in blobs:
+        buffer += blob
+    return np.frombuffer(buffer, dtype=FEATURE_DTYPE).reshape(len(blobs), width)
+
+def _record_dtype(dtypes: List[str]) -> np.dtype:
+    """Packed record type with one field per column (f0, f1, ...)."""
+    return np.dtype([(f'f{j}', dtype) for j, dtype in enumerate(dtypes)])
+
+def _pack_records(df: pd.DataFrame, cols: List[str]) -> np.ndarray:
+    """Columns of a compact frame as packed records, one per row."""
+    records = np.empty(len(df), dtype=_record_dtype([df[col].dtype.str for col in cols]))
+    for j, col in enumerate(cols):
+        records[f'f{j}'] = df[col].to_numpy()
+    return records
+
+def _decode_vectors(blobs: List[bytes], width: int, dtypes: Optional[List[str]]) -> np.ndarray:
+    """Stored BLOBs as a writable float32 [rows, width] array.
+    
+    dtypes is None for float32 vectors, else the field types of packed
+    compact records.
+    """
+    if dtypes is None:
+        return _stack_vectors(blobs, width)
+    out = np.empty((len(blobs), width), dtype=FEATURE_DTYPE)
+    if width:
+        records = np.frombuffer(b''.join(blobs), dtype=_record_dtype(dtypes))
+        for j in range(width):
+            out[:, j] = records[f'f{j}']
+    return out
+
+def _saved_report(report: Dict[str, Any]) -> Dict[str, Any]:
+    """Add the percentage compact dtypes save on frames and rows."""
+    for kind in ('frame', 'row'):
+        wide = report[f'{kind}_bytes']
+        report[f'{kind}_saved_pct'] = round(100 * (1 - report[f'compact_{kind}_bytes'] / wide), 1) if wide else 0.0
+    return report
 
 class FeatureStore:
     """Feature store for materialized health features."""
     
-    def __init__(self, db_path: str = "unified_health.db"):
+    def __init__(self, db_path: str = "unified_health.db", cache: Optional[FeatureCache] = None,
+                 compact: Optional[bool] = None):
         self.db_path = db_path
+        self.cache = cache or get_feature_cache()
+        self.compact = FEATURE_COMPACT if compact is None else compact
+        # Schemas never change once written, so both directions are cached
+        self._schema_ids: Dict[str, int] = {}
+        self._schemas: Dict[int, Tuple[List[str], List[str]]] = {}
+        # Record field types of compact schemas; None = float32 vectors
+        self._schema_dtypes: Dict[int, Optional[Tuple[List[str], List[str]]]] = {}
     
-    def build_daily_features(self, user_id: str, start_date: str, end_date: str) -> pd.DataFrame:
-        """Build daily tabular features for a user."""
-        with get_conn() as conn:
-            # Pull all source data
-            meals = pd.read_sql_query(
+    def build_daily_features(self, user_id: str, start_date: str, end_date: str,
+                             base_columns: Optional[List[str]] = None,
+                             kernel: Optional[str] = None,
+                             features: Optional[List[str]] = None,
+                             compact: Optional[bool] = None) -> pd.DataFrame:
+        """Build daily tabular features for a user.
+        
+        Pass base_columns (see user_base_columns) to get the same columns a
+        build over the user's whole history would have. kernel overrides
+        FEATURE_KERNEL. With `features`, only those columns (base, registered
+        features or labels) are returned, and only the source tables and
+        registry nodes they depend on are read and computed. compact
+        overrides the store's compact mode (narrow column dtypes).
+        """
+        # Index-friendly range on raw timestamps, one day wider on each
+        # side for UTC offsets; date(...) BETWEEN then trims it exactly
+        ts_bounds = [_shift_date(start_date, -1), _shift_date(end_date, 2)]
+        
+        tables = set(SOURCE_COLUMNS)
+        if features is not None:
+            sources = FEATURES.sources(features)
+            tables = {table for table, cols in SOURCE_COLUMNS.items() if sources.intersection(cols)}
+            known = {col for cols in SOURCE_COLUMNS.values() for col in cols}
+            if not sources <= known:
+                tables.add('symptoms')  # the rest are symptom types
+            if base_columns is not None:
+                base_columns = [col for col in base_columns if col in sources]
+        
+        with get_conn(readonly=True) as conn:
+            def query(table: str, sql: str, params: List[Any]) -> pd.DataFrame:
+                if table not in tables:
+                    return pd.DataFrame({'date': []})
+                return pd.read_sql_query(sql, conn, params=params)
+            
+            # Pull source data for the requested dates only
+            meals = query('meals',
                 """SELECT date(ts) as date, 
                           SUM(caffeine_mg) AS caffeine, 
                           COUNT(*) AS meals_cnt,
@@ -36,12 +581,12 @@ class FeatureStore:
                           SUM(fiber_g) AS total_fiber,
                           SUM(sugar_g) AS total_sugar
                    FROM meals 
-                   WHERE user_id=? 
-                   GROUP BY date(ts)""", 
-                conn, params=[user_id]
+                   WHERE user_id=? AND ts >= ? AND ts < ? AND date(ts) BETWEEN ? AND ?
+                   GROUP BY date(ts)""",
+                [user_id, *ts_bounds, start_date, end_date]
             )
             
-            sleep = pd.read_sql_query(
+            sleep = query('sleep_sessions',
                 """SELECT date(end_time) as date, 
                           SUM(total_min) AS sleep_min, 
                           AVG(sleep_score) as sleep_score,
@@ -49,43 +594,52 @@ class FeatureStore:
                           SUM(rem_min) AS rem_min,
                           AVG(awakenings) AS avg_awakenings
                    FROM sleep_sessions 
-                   WHERE user_id=? 
-                   GROUP BY date(end_time)""", 
-                conn, params=[user_id]
+                   WHERE user_id=? AND end_time >= ? AND end_time < ?
+                     AND date(end_time) BETWEEN ? AND ?
+                   GROUP BY date(end_time)""",
+                [user_id, *ts_bounds, start_date, end_date]
             )
             
-            vitals = pd.read_sql_query(
-                """SELECT date, hrv_ms, steps, hr_mean, hr_max, spo2, active_min, calories_burned 
+            vitals = query('vitals',
+                """SELECT date, 
+                          AVG(hrv_ms) AS hrv_ms,
+                          SUM(steps) AS steps,
+                          AVG(hr_mean) AS hr_mean,
+                          MAX(hr_max) AS hr_max,
+                          AVG(spo2) AS spo2,
+                          SUM(active_min) AS active_min,
+                          SUM(calories_burned) AS calories_burned
                    FROM vitals 
-                   WHERE user_id=?""", 
-                conn, params=[user_id]
+                   WHERE user_id=? AND date BETWEEN ? AND ?
+                   GROUP BY date""",
+                [user_id, start_date, end_date]
             )
             
-            daily_logs = pd.read_sql_query(
+            daily_logs = query('daily_logs',
                 """SELECT date, mood, stress, energy, focus 
                    FROM daily_logs 
-                   WHERE user_id=?""", 
-                conn, params=[user_id]
+                   WHERE user_id=? AND date BETWEEN ? AND ?""",
+                [user_id, start_date, end_date]
             )
             
-            symptoms = pd.read_sql_query(
+            symptoms = query('symptoms',
                 """SELECT date, type, MAX(severity) AS max_severity
                    FROM symptoms 
-                   WHERE user_id=? 
-                   GROUP BY date, type""", 
-                conn, params=[user_id]
+                   WHERE user_id=? AND date BETWEEN ? AND ?
+                   GROUP BY date, type""",
+                [user_id, start_date, end_date]
             )
             
-            workouts = pd.read_sql_query(
+            workouts = query('workouts',
                 """SELECT date(ts) as date, 
                           COUNT(*) AS workout_count,
                           SUM(duration_min) AS total_workout_min,
                           AVG(intensity) AS avg_intensity,
                           SUM(calories_burned) AS workout_calories
                    FROM workouts 
-                   WHERE user_id=? 
-                   GROUP BY date(ts)""", 
-                conn, params=[user_id]
+                   WHERE user_id=? AND ts >= ? AND ts < ? AND date(ts) BETWEEN ? AND ?
+                   GROUP BY date(ts)""",
+                [user_id, *ts_bounds, start_date, end_date]
             )
             
             # Pivot symptoms by type
@@ -100,12 +654,12 @@ class FeatureStore:
             
             # Merge all data
             for data, cols in [
-                (meals, ['caffeine', 'meals_cnt', 'avg_calories', 'total_protein', 'total_carbs', 'total_fat', 'total_fiber', 'total_sugar']),
-                (sleep, ['sleep_min', 'sleep_score', 'deep_min', 'rem_min', 'avg_awakenings']),
-                (vitals, ['hrv_ms', 'steps', 'hr_mean', 'hr_max', 'spo2', 'active_min', 'calories_burned']),
-                (daily_logs, ['mood', 'stress', 'energy', 'focus']),
+                (meals, SOURCE_COLUMNS['meals']),
+                (sleep, SOURCE_COLUMNS['sleep_sessions']),
+                (vitals, SOURCE_COLUMNS['vitals']),
+                (daily_logs, SOURCE_COLUMNS['daily_logs']),
                 (symptoms_pivot, [col for col in symptoms_pivot.columns if col != 'date']),
-                (workouts, ['workout_count', 'total_workout_min', 'avg_intensity', 'workout_calories'])
+                (workouts, SOURCE_COLUMNS['workouts'])
             ]:
                 if not data.empty:
                     data = data.copy()
@@ -113,29 +667,45 @@ class FeatureStore:
                     df = df.merge(data[['date'] + [col for col in cols if col in data.columns]], on='date', how='left')
             
             # Fill missing values with sensible defaults
-            numeric_cols = df.select_dtypes(include=[np.number]).columns
-            df[numeric_cols] = df[numeric_cols].fillna(0)
-            
-            # Add rolling features
-            df = self._add_rolling_features(df)
-            
-            # Add lag features
-            df = self._add_lag_features(df)
+            # Columns whose values are all NULL come back as object dtype
+            value_cols = [col for col in df.columns if col != 'date']
+            if value_cols:
+                df[value_cols] = df[value_cols].apply(pd.to_numeric).fillna(0)
             
-            # Add derived features
-            df = self._add_derived_features(df)
+            if base_columns is not None:
+                # Sources with no rows in this window still get their columns
+                for col in base_columns:
+                    if col not in df.columns:
+                        df[col] = 0.0
+                df = df[['date'] + base_columns + 
+                        [col for col in df.columns if col != 'date' and col not in base_columns]]
             
-            # Add labels for next-day prediction
-            df = self._add_labels(df)
+            if (kernel or FEATURE_KERNEL) == "pandas":
+                # Add rolling features
+                df = self._add_rolling_features(df)
+                
+                # Add lag features
+                df = self._add_lag_features(df)
+                
+                # Add derived features
+                df = self._add_derived_features(df)
+                
+                # Add labels for next-day prediction
+                df = self._add_labels(df)
+                
+                if features is not None:
+                    wanted = set(features)
+                    df = df[['date'] + [col for col in df.columns if col in wanted]]
+            else:
+                df = self._add_registry_features(df, features)
             
+            if self.compact if compact is None else compact:
+                df = compact_frame(df)
             return df
     
     def _add_rolling_features(self, df: pd.DataFrame) -> pd.DataFrame:
         """Add rolling window features."""
-        rolling_cols = ['caffeine', 'sleep_min', 'sleep_score', 'hrv_ms', 'steps', 
-                       'mood', 'stress', 'energy', 'focus', 'workout_count']
-        
-        for col in rolling_cols:
+        for col in ROLLING_COLUMNS:
             if col in df.columns:
                 # Rolling mean and std
                 df[f'{col}_rmean_{ROLL_DAYS}'] = df[col].rolling(ROLL_DAYS, min_periods=1).mean()
@@ -149,13 +719,10 @@ class FeatureStore:
     
     def _add_lag_features(self, df: pd.DataFrame) -> pd.DataFrame:
         """Add lag features."""
-        lag_cols = ['mood', 'stress', 'sleep_score', 'caffeine', 'workout_count']
-        
-        for col in lag_cols:
+        for col in LAG_COLUMNS:
             if col in df.columns:
-                df[f'{col}_lag1'] = df[col].shift(1)
-                df[f'{col}_lag2'] = df[col].shift(2)
-                df[f'{col}_lag3'] = df[col].shift(3)
+                for lag in range(1, MAX_LAG + 1):
+                    df[f'{col}_lag{lag}'] = df[col].shift(lag)
         
         return df
     
@@ -181,11 +748,40 @@ class FeatureStore:
         
         # HRV recovery
         if 'hrv_ms' in df.columns:
-            df['hrv_recovery'] = df['hrv_ms'] / df['hrv_ms'].rolling(7, min_periods=1).mean()
+            df['hrv_recovery'] = df['hrv_ms'] / df['hrv_ms'].rolling(HRV_BASELINE_DAYS, min_periods=1).mean()
             df['hrv_recovery'] = df['hrv_recovery'].fillna(1)
         
         return df
     
+    def _add_registry_features(self, df: pd.DataFrame,
+                               features: Optional[List[str]] = None) -> pd.DataFrame:
+        """Add registered features and labels (numpy kernel).
+        
+        Without `features` this produces the same columns, in the same order,
+        as the pandas methods; with them, only the requested columns and
+        their registry dependencies are computed.
+        """
+        base = [col for col in df.columns if col != 'date']
+        names = FEATURES.available(base, features)
+        if features is not None:
+            wanted = set(features)
+            base = [col for col in base if col in wanted]
+        
+        inputs = {col: df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+                  for col in FEATURES.sources(names)}
+        computed = FEATURES.evaluate(names, inputs)
+        
+        # One block per dtype keeps the frame cheap to assemble
+        blocks = [df[['date'] + base]]
+        for dtype in dict.fromkeys(FEATURES[name].dtype for name in names):
+            cols = [name for name in names if FEATURES[name].dtype == dtype]
+            blocks.append(pd.DataFrame(np.column_stack([computed[name] for name in cols]),
+                                       columns=cols, index=df.index))
+        out = pd.concat(blocks, axis=1)
+        if list(out.columns) != ['date'] + base + names:
+            out = out[['date'] + base + names]
+        return out
+    
     def _add_labels(self, df: pd.DataFrame) -> pd.DataFrame:
         """Add next-day prediction labels."""
         # Binary labels for high-risk days
@@ -200,113 +796,541 @@ class FeatureStore:
         
         return df
     
-    def persist_daily_features(self, user_id: str, df: pd.DataFrame) -> None:
-        """Persist daily features to database."""
-        with get_conn() as conn:
-            for _, row in df.iterrows():
-                # Extract features (exclude labels and date)
-                feature_cols = [col for col in df.columns 
-                              if not col.startswith('y_') and col != 'date']
-                features = row[feature_cols].to_dict()
-                
-                # Extract labels
-                label_cols = [col for col in df.columns if col.startswith('y_')]
-                labels = {col: int(row[col]) if not pd.isna(row[col]) else None 
-                         for col in label_cols}
-                
-                conn.execute(
-                    """INSERT OR REPLACE INTO fs_daily_user (user_id, date, features_json, labels_json)
-                       VALUES (?, ?, ?, ?)""",
-                    (user_id, row['date'], json.dumps(features), json.dumps(labels))
-                )
+    def _schema_id(self, conn, feature_names: List[str], label_names: List[str],
+                   dtypes: Optional[Tuple[List[str], List[str]]] = None) -> Tuple[str, int]:
+        """Hash and id of a column layout, registering it if new.
+        
+        dtypes are the record field types of compact rows (None for
+        float32 vectors) and are part of the layout.
+        """
+        layout = [feature_names, label_names] if dtypes is None else [feature_names, label_names, list(dtypes)]
+        schema_hash = hashlib.sha1(json.dumps(layout).encode()).hexdigest()
+        if schema_hash in self._schema_ids:
+            return schema_hash, self._schema_ids[schema_hash]
+        
+        conn.execute(
+            """INSERT OR IGNORE INTO fs_feature_schemas
+                 (schema_hash, feature_names_json, label_names_json, dtypes_json)
+               VALUES (?, ?, ?, ?)""",
+            (schema_hash, json.dumps(feature_names), json.dumps(label_names),
+             None if dtypes is None else json.dumps(list(dtypes)))
+        )
+        row = conn.execute(
+            "SELECT schema_id FROM fs_feature_schemas WHERE schema_hash=?", (schema_hash,)
+        ).fetchone()
+        return schema_hash, row[0]
     
-    def build_sequence_features(self, user_id: str, start_date: str, end_date: str, 
-                              seq_len: int = SEQ_LEN) -> List[Dict[str, Any]]:
-        """Build sequence features for deep learning models."""
+    def _load_schemas(self, conn, schema_ids) -> Dict[int, Tuple[List[str], List[str]]]:
+        """Feature and label names for each schema id."""
+        missing = [sid for sid in schema_ids if sid not in self._schemas]
+        if missing:
+            rows = conn.execute(
+                f"""SELECT schema_id, feature_names_json, label_names_json, dtypes_json
+                    FROM fs_feature_schemas WHERE schema_id IN ({','.join('?' * len(missing))})""",
+                missing
+            ).fetchall()
+            for row in rows:
+                self._schemas[row[0]] = (json.loads(row[1]), json.loads(row[2]))
+                self._schema_dtypes[row[0]] = tuple(json.loads(row[3])) if row[3] else None
+        return {sid: self._schemas[sid] for sid in schema_ids}
+    
+    def persist_daily_features(self, user_id: str, df: pd.DataFrame) -> None:
+        """Persist daily features to database as float32 vectors.
+        
+        In compact mode rows are packed records of each column's compact
+        dtype instead.
+        """
+        if df.empty:
+            return
+        
+        # Features exclude labels and date
+        feature_cols = [col for col in df.columns if not col.startswith('y_') and col != 'date']
+        label_cols = [col for col in df.columns if col.startswith('y_')]
+        if self.compact:
+            df = compact_frame(df)
+            dtypes = ([df[col].dtype.str for col in feature_cols], [df[col].dtype.str for col in label_cols])
+            X = _pack_records(df, feature_cols)
+            Y = _pack_records(df, label_cols)
+        else:
+            dtypes = None
+            X = np.ascontiguousarray(df[feature_cols].to_numpy(dtype=FEATURE_DTYPE, na_value=np.nan))
+            Y = np.ascontiguousarray(df[label_cols].to_numpy(dtype=FEATURE_DTYPE, na_value=np.nan))
+        
         with get_conn() as conn:
-            df = pd.read_sql_query(
-                """SELECT date, features_json, labels_json 
-                   FROM fs_daily_user 
-                   WHERE user_id=? AND date BETWEEN ? AND ? 
-                   ORDER BY date""",
-                conn, params=[user_id, start_date, end_date]
+            schema_hash, schema_id = self._schema_id(conn, feature_cols, label_cols, dtypes)
+            conn.executemany(
+                """INSERT OR REPLACE INTO fs_daily_user (user_id, date, schema_id, features, labels)
+                   VALUES (?, ?, ?, ?, ?)""",
+                [(user_id, str(day), schema_id, x.tobytes(), y.tobytes())
+                 for day, x, y in zip(df['date'], X, Y)]
             )
+        # Only cache ids whose registration committed
+        self._schema_ids[schema_hash] = schema_id
+        # Sequence windows ending up to SEQ_LEN days later include these rows
+        dates = df['date'].astype(str)
+        self.cache.invalidate(user_id, dates.min(), _shift_date(dates.max(), SEQ_LEN))
+    
+    def read_feature_matrix(self, user_id: str, start_date: Optional[str] = None,
+                            end_date: Optional[str] = None,
+                            last_n: Optional[int] = None) -> FeatureMatrix:
+        """Stored feature rows for a user/date range, ordered by date.
         
-        if df.empty:
-            return []
+        last_n keeps only the latest rows of the range. Rows written under
+        an older schema are aligned to the newest one by column name.
+        """
+        query = "SELECT date, schema_id, features, labels FROM fs_daily_user WHERE user_id=?"
+        params: List[Any] = [user_id]
+        if start_date:
+            query += " AND date >= ?"
+            params.append(start_date)
+        if end_date:
+            query += " AND date <= ?"
+            params.append(end_date)
+        if last_n is not None:
+            query += " ORDER BY date DESC LIMIT ?"
+            params.append(last_n)
+        else:
+            query += " ORDER BY date"
+        
+        with get_conn(readonly=True) as conn:
+            rows = conn.execute(query, params).fetchall()
+            schemas = self._load_schemas(conn, {row[1] for row in rows})
+        if last_n is not None:
+            rows.reverse()
         
-        # Parse features and labels
-        features_list = df['features_json'].apply(json.loads).tolist()
-        labels_list = df['labels_json'].apply(json.loads).tolist()
+        if not rows:
+            empty = np.empty((0, 0), dtype=FEATURE_DTYPE)
+            return FeatureMatrix([], empty, [], empty, [])
+        
+        dates = [row[0] for row in rows]
+        schema_ids = [row[1] for row in rows]
+        feature_names, label_names = schemas[schema_ids[-1]]
+        
+        if len(schemas) == 1:
+            dtypes = self._schema_dtypes[schema_ids[-1]] or (None, None)
+            X = _decode_vectors([row[2] for row in rows], len(feature_names), dtypes[0])
+            Y = _decode_vectors([row[3] for row in rows], len(label_names), dtypes[1])
+            return FeatureMatrix(dates, X, feature_names, Y, label_names)
+        
+        X = np.zeros((len(rows), len(feature_names)), dtype=FEATURE_DTYPE)
+        Y = np.full((len(rows), len(label_names)), np.nan, dtype=FEATURE_DTYPE)
+        for schema_id, (names, labels) in schemas.items():
+            idx = [i for i, sid in enumerate(schema_ids) if sid == schema_id]
+            dtypes = self._schema_dtypes[schema_id] or (None, None)
+            part = FeatureMatrix(
+                [dates[i] for i in idx],
+                _decode_vectors([rows[i][2] for i in idx], len(names), dtypes[0]), names,
+                _decode_vectors([rows[i][3] for i in idx], len(labels), dtypes[1]), labels
+            )
+            X[idx] = part.columns(feature_names)
+            for j, name in enumerate(label_names):
+                Y[idx, j] = part.label(name)
+        return FeatureMatrix(dates, X, feature_names, Y, label_names)
+    
+    def build_feature_matrix(self, user_id: str, start_date: str, end_date: str,
+                             features: Optional[List[str]] = None) -> FeatureMatrix:
+        """Compute features for a date range without reading stored rows.
         
-        # Convert to numpy arrays
-        X = np.array([list(f.values()) for f in features_list], dtype=np.float32)
-        dates = pd.to_datetime(df['date']).dt.date.tolist()
+        Only `features` (default: all) and their dependencies are computed.
+        History is read back as far as they look (and labels ahead), so
+        values match a build over the user's whole history.
+        """
+        bounds = self.user_date_bounds(user_id)
+        empty = np.empty((0, 0), dtype=FEATURE_DTYPE)
+        if not bounds or start_date > end_date:
+            return FeatureMatrix([], empty, [], empty, [])
         
-        # Create sequences
-        sequences = []
-        for i in range(len(X) - seq_len):
-            x_seq = X[i:i+seq_len]
-            y = labels_list[i+seq_len]
-            sequences.append({
-                'date': dates[i+seq_len],
-                'X': x_seq.tolist(),
-                'Y': y
-            })
+        first, last = bounds
+        build_start = max(first, _shift_date(start_date, -FEATURES.lookback(features)))
+        build_end = max(end_date, min(last, _shift_date(end_date, FEATURES.lead(features))))
+        if build_start > build_end:
+            return FeatureMatrix([], empty, [], empty, [])
         
-        return sequences
+        df = self.build_daily_features(user_id, build_start, build_end,
+                                       self.user_base_columns(user_id), features=features)
+        df = df[(df['date'] >= start_date) & (df['date'] <= end_date)]
+        feature_cols = [col for col in df.columns if not col.startswith('y_') and col != 'date']
+        label_cols = [col for col in df.columns if col.startswith('y_')]
+        return FeatureMatrix(
+            df['date'].tolist(),
+            df[feature_cols].to_numpy(dtype=FEATURE_DTYPE, na_value=np.nan), feature_cols,
+            df[label_cols].to_numpy(dtype=FEATURE_DTYPE, na_value=np.nan), label_cols
+        )
+    
+    def sequence_view(self, user_id: str, start_date: Optional[str] = None,
+                      end_date: Optional[str] = None, seq_len: int = SEQ_LEN) -> SequenceView:
+        """Sequence windows over the user's stored daily rows."""
+        return SequenceView(self.read_feature_matrix(user_id, start_date, end_date), seq_len)
+    
+    def build_sequence_features(self, user_id: str, start_date: str, end_date: str, 
+                              seq_len: int = SEQ_LEN) -> List[Dict[str, Any]]:
+        """Build sequence features for deep learning models."""
+        view = self.sequence_view(user_id, start_date, end_date, seq_len)
+        return [
+            {'date': day, 'X': view.window(i), 'Y': view.labels_at(i)}
+            for i, day in enumerate(view.dates)
+        ]
     
     def persist_sequence_features(self, user_id: str, sequences: List[Dict[str, Any]]) -> None:
-        """Persist sequence features to database."""
+        """Persist sequence features to database (only with MATERIALIZE_SEQUENCES)."""
         with get_conn() as conn:
-            for seq in sequences:
-                conn.execute(
-                    """INSERT OR REPLACE INTO fs_seq_user (user_id, date, seq_json)
-                       VALUES (?, ?, ?)""",
-                    (user_id, seq['date'].isoformat(), json.dumps(seq))
-                )
+            conn.executemany(
+                """INSERT OR REPLACE INTO fs_seq_user (user_id, date, seq_json)
+                   VALUES (?, ?, ?)""",
+                [(user_id, seq['date'], 
+                  json.dumps({'date': seq['date'], 'X': np.asarray(seq['X']).tolist(), 'Y': seq['Y']}))
+                 for seq in sequences]
+            )
+    
+    def read_daily_row(self, user_id: str, date: str) -> FeatureMatrix:
+        """The stored row for one day as a read-only matrix, through the cache."""
+        key = (user_id, date, 'daily')
+        matrix = self.cache.get(key)
+        if matrix is None:
+            matrix = self.read_feature_matrix(user_id, date, date)
+            if matrix.dates:
+                matrix.X.setflags(write=False)
+                matrix.Y.setflags(write=False)
+                self.cache.put(key, matrix)
+        return matrix
     
     def get_daily_features(self, user_id: str, date: str) -> Optional[Dict[str, Any]]:
         """Get daily features for a specific date."""
-        with get_conn() as conn:
-            result = conn.execute(
-                """SELECT features_json, labels_json 
-                   FROM fs_daily_user 
-                   WHERE user_id=? AND date=?""",
-                (user_id, date)
-            ).fetchone()
-            
-            if result:
-                return {
-                    'features': json.loads(result[0]),
-                    'labels': json.loads(result[1])
-                }
+        matrix = self.read_daily_row(user_id, date)
+        if matrix.dates:
+            return {
+                'features': dict(zip(matrix.feature_names, matrix.X[0].tolist())),
+                'labels': matrix.labels_at(0)
+            }
+        return None
+    
+    def get_sequence_features(self, user_id: str, date: str,
+                              seq_len: int = SEQ_LEN) -> Optional[Dict[str, Any]]:
+        """Get sequence features for a specific date (cached; treat as read-only)."""
+        key = (user_id, date, f'seq{seq_len}')
+        sequence = self.cache.get(key)
+        if sequence is None:
+            sequence = self._read_sequence_features(user_id, date, seq_len)
+            if sequence is not None:
+                self.cache.put(key, sequence)
+        return sequence
+    
+    def _read_sequence_features(self, user_id: str, date: str,
+                                seq_len: int) -> Optional[Dict[str, Any]]:
+        if MATERIALIZE_SEQUENCES:
+            with get_conn(readonly=True) as conn:
+                result = conn.execute(
+                    """SELECT seq_json 
+                       FROM fs_seq_user 
+                       WHERE user_id=? AND date=?""",
+                    (user_id, date)
+                ).fetchone()
+            return json.loads(result[0]) if result else None
+        
+        # The window before `date` plus the row for `date` itself
+        matrix = self.read_feature_matrix(user_id, end_date=date, last_n=seq_len + 1)
+        matrix.X.setflags(write=False)
+        view = SequenceView(matrix, seq_len)
+        if not len(view) or view.dates[-1] != date:
             return None
+        return {'date': date, 'X': view.window(0), 'Y': view.labels_at(0)}
     
-    def get_sequence_features(self, user_id: str, date: str) -> Optional[Dict[str, Any]]:
-        """Get sequence features for a specific date."""
-        with get_conn() as conn:
-            result = conn.execute(
-                """SELECT seq_json 
-                   FROM fs_seq_user 
-                   WHERE user_id=? AND date=?""",
-                (user_id, date)
+    def user_date_bounds(self, user_id: str) -> Optional[Tuple[str, str]]:
+        """First and last day with any feature source data for a user."""
+        with get_conn(readonly=True) as conn:
+            row = conn.execute(
+                """SELECT MIN(d), MAX(d) FROM (
+                       SELECT MIN(date(ts)) AS d FROM meals WHERE user_id=:u
+                       UNION ALL SELECT MAX(date(ts)) FROM meals WHERE user_id=:u
+                       UNION ALL SELECT MIN(date(end_time)) FROM sleep_sessions WHERE user_id=:u
+                       UNION ALL SELECT MAX(date(end_time)) FROM sleep_sessions WHERE user_id=:u
+                       UNION ALL SELECT MIN(date) FROM vitals WHERE user_id=:u
+                       UNION ALL SELECT MAX(date) FROM vitals WHERE user_id=:u
+                       UNION ALL SELECT MIN(date) FROM daily_logs WHERE user_id=:u
+                       UNION ALL SELECT MAX(date) FROM daily_logs WHERE user_id=:u
+                       UNION ALL SELECT MIN(date) FROM symptoms WHERE user_id=:u
+                       UNION ALL SELECT MAX(date) FROM symptoms WHERE user_id=:u
+                       UNION ALL SELECT MIN(date(ts)) FROM workouts WHERE user_id=:u
+                       UNION ALL SELECT MAX(date(ts)) FROM workouts WHERE user_id=:u
+                   )""",
+                {'u': user_id}
             ).fetchone()
+        return (row[0], row[1]) if row and row[0] else None
+    
+    def user_base_columns(self, user_id: str, start_date: Optional[str] = None,
+                          end_date: Optional[str] = None) -> List[str]:
+        """Base columns a build over the user's whole history produces, in order.
+        
+        With start_date and end_date, the columns a build over just that
+        range produces.
+        """
+        date_sql = {spec.table: spec.date_sql for spec in INGEST_SPECS.values() if spec.date_sql}
+        columns: List[str] = []
+        with get_conn(readonly=True) as conn:
+            for table, cols in SOURCE_COLUMNS.items():
+                where = "user_id=?"
+                params: List[Any] = [user_id]
+                if start_date and end_date:
+                    where += f" AND {date_sql[table]} BETWEEN ? AND ?"
+                    params += [start_date, end_date]
+                if table == 'symptoms':
+                    columns += [row[0] for row in conn.execute(
+                        f"SELECT DISTINCT type FROM symptoms WHERE {where} ORDER BY type", params
+                    )]
+                elif conn.execute(f"SELECT 1 FROM {table} WHERE {where} LIMIT 1", params).fetchone():
+                    columns += cols
+        return columns
+    
+    @staticmethod
+    def chunk_days(n_base_columns: int, memory_budget_mb: Optional[float] = None) -> int:
+        """Days per build block that keep a block's frames within the budget."""
+        budget = (memory_budget_mb or FEATURE_BUILD_MEMORY_MB) * 1024 * 1024
+        # Every base column feeds roughly a handful of registered columns
+        n_values = max(1, n_base_columns + len(FEATURES.names()))
+        halo = FEATURE_LOOKBACK_DAYS + LABEL_HORIZON
+        return max(halo + 1, int(budget // (n_values * FEATURE_BUILD_BYTES_PER_VALUE)) - halo)
+    
+    def iter_daily_features(self, user_id: str, start_date: str, end_date: str,
+                            base_columns: Optional[List[str]] = None,
+                            chunk_days: Optional[int] = None,
+                            memory_budget_mb: Optional[float] = None) -> Iterator[pd.DataFrame]:
+        """build_daily_features over [start_date, end_date] in consecutive date blocks.
+        
+        Each block is built with a halo of FEATURE_LOOKBACK_DAYS before it
+        and LABEL_HORIZON after it, so the blocks put together equal one
+        build over the whole range, while only one block's frames are in
+        memory at a time. Blocks are chunk_days long (default: sized to
+        memory_budget_mb, itself defaulting to FEATURE_BUILD_MEMORY_MB).
+        """
+        if base_columns is None:
+            # Every block needs the columns of the whole range
+            base_columns = self.user_base_columns(user_id, start_date, end_date)
+        chunk_days = chunk_days or self.chunk_days(len(base_columns), memory_budget_mb)
+        
+        block_start = start_date
+        while block_start <= end_date:
+            block_end = min(end_date, _shift_date(block_start, chunk_days - 1))
+            df = self.build_daily_features(
+                user_id,
+                max(start_date, _shift_date(block_start, -FEATURE_LOOKBACK_DAYS)),
+                min(end_date, _shift_date(block_end, LABEL_HORIZON)),
+                base_columns
+            )
+            yield df[(df['date'] >= block_start) & (df['date'] <= block_end)].reset_index(drop=True)
+            block_start = _shift_date(block_end, 1)
+    
+    def memory_report(self, user_id: str, start_date: Optional[str] = None,
+                      end_date: Optional[str] = None) -> Dict[str, Any]:
+        """Bytes of one user's feature build in wide and compact dtypes.
+        
+        Compares the build frame (float64/int64 against compact columns)
+        and its stored rows (float32 vectors against packed records) over
+        the range (default: the user's whole history).
+        """
+        bounds = self.user_date_bounds(user_id)
+        if not bounds:
+            return {}
+        df = self.build_daily_features(user_id, start_date or bounds[0], end_date or bounds[1],
+                                       self.user_base_columns(user_id), compact=False)
+        compact = compact_frame(df)
+        value_cols = [col for col in df.columns if col != 'date']
+        feature_cols = [col for col in value_cols if not col.startswith('y_')]
+        label_cols = [col for col in value_cols if col.startswith('y_')]
+        record_bytes = sum(_record_dtype([compact[col].dtype.str for col in cols]).itemsize
+                           for cols in (feature_cols, label_cols))
+        return _saved_report({
+            'rows': len(df),
+            'columns': len(value_cols),
+            'frame_bytes': int(df[value_cols].memory_usage(index=False).sum()),
+            'compact_frame_bytes': int(compact[value_cols].memory_usage(index=False).sum()),
+            'row_bytes': len(df) * len(value_cols) * FEATURE_DTYPE.itemsize,
+            'compact_row_bytes': len(df) * record_bytes,
+        })
+    
+    def stored_layouts(self, user_ids: Optional[List[str]] = None, start_date: Optional[str] = None,
+                       end_date: Optional[str] = None) -> List[Tuple[str, int, List[str], List[str], int]]:
+        """Column layouts of stored rows: (user_id, schema_id, feature_names, label_names, rows).
+        
+        One entry per user and schema among the rows in the date range
+        (default: all users and dates), ordered by user and schema id.
+        """
+        query = "SELECT user_id, schema_id, COUNT(*) FROM fs_daily_user WHERE 1=1"
+        params: List[Any] = []
+        if user_ids is not None:
+            query += f" AND user_id IN ({','.join('?' * len(user_ids))})"
+            params.extend(user_ids)
+        if start_date:
+            query += " AND date >= ?"
+            params.append(start_date)
+        if end_date:
+            query += " AND date <= ?"
+            params.append(end_date)
+        query += " GROUP BY user_id, schema_id ORDER BY user_id, schema_id"
+        
+        with get_conn(readonly=True) as conn:
+            rows = conn.execute(query, params).fetchall()
+            schemas = self._load_schemas(conn, {row[1] for row in rows})
+        return [(user_id, schema_id, *schemas[schema_id], count) for user_id, schema_id, count in rows]
+    
+    def fleet_memory_report(self, user_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Bytes of a training set over all stored rows (default: every user).
+        
+        frame/row bytes are the set as float64 frames and float32 matrices;
+        the compact figures use each column's compact dtype (the stored one
+        for rows written in compact mode). stored_bytes is what the rows
+        take in fs_daily_user.
+        """
+        query = """SELECT user_id, schema_id, COUNT(*), SUM(length(features) + length(labels))
+                   FROM fs_daily_user"""
+        params: List[Any] = []
+        if user_ids is not None:
+            query += f" WHERE user_id IN ({','.join('?' * len(user_ids))})"
+            params.extend(user_ids)
+        query += " GROUP BY user_id, schema_id"
+        
+        with get_conn(readonly=True) as conn:
+            rows = conn.execute(query, params).fetchall()
+            schemas = self._load_schemas(conn, {row[1] for row in rows})
+        
+        report = {'users': len({row[0] for row in rows}), 'rows': 0, 'columns': 0,
+                  'frame_bytes': 0, 'compact_frame_bytes': 0, 'row_bytes': 0,
+                  'compact_row_bytes': 0, 'stored_bytes': 0}
+        for _, schema_id, count, stored in rows:
+            names, labels = schemas[schema_id]
+            width = len(names) + len(labels)
+            dtypes = self._schema_dtypes[schema_id]
+            if dtypes is None:
+                dtypes = ([compact_dtype(name).str for name in names],
+                          [compact_dtype(name).str for name in labels])
+            narrow = sum(np.dtype(dtype).itemsize for part in dtypes for dtype in part)
+            report['rows'] += count
+            report['columns'] = max(report['columns'], width)
+            report['frame_bytes'] += count * width * 8
+            report['compact_frame_bytes'] += count * narrow
+            report['row_bytes'] += count * width * FEATURE_DTYPE.itemsize
+            report['compact_row_bytes'] += count * narrow
+            report['stored_bytes'] += stored or 0
+        return _saved_report(report)
+    
+    def _stored_base_columns(self, user_id: str, count: int) -> List[str]:
+        """Leading feature columns of the user's latest stored row."""
+        with get_conn(readonly=True) as conn:
+            row = conn.execute(
+                "SELECT schema_id FROM fs_daily_user WHERE user_id=? ORDER BY date DESC LIMIT 1",
+                (user_id,)
+            ).fetchone()
+            if not row:
+                return []
+            feature_names, _ = self._load_schemas(conn, [row[0]])[row[0]]
+        return feature_names[:count]
+    
+    @staticmethod
+    def affected_ranges(dirty_dates: List[str], bounds: Tuple[str, str]) -> List[Tuple[str, str]]:
+        """Feature-row date ranges reached by raw changes on the dirty dates.
+        
+        A change on day d reaches the rolling/lag/baseline features of the
+        following FEATURE_LOOKBACK_DAYS days and the label of the day before.
+        Ranges are clamped to the user's data bounds and merged when their
+        lookback halos would overlap.
+        """
+        first, last = bounds
+        spans = sorted(
+            (max(first, _shift_date(d, -LABEL_HORIZON)), min(last, _shift_date(d, FEATURE_LOOKBACK_DAYS)))
+            for d in dirty_dates
+        )
+        ranges: List[Tuple[str, str]] = []
+        for start, end in spans:
+            if start > end:
+                continue
+            if ranges and _shift_date(ranges[-1][1], FEATURE_LOOKBACK_DAYS + LABEL_HORIZON + 1) >= start:
+                ranges[-1] = (ranges[-1][0], max(ranges[-1][1], end))
+            else:
+                ranges.append((start, end))
+        return ranges
+    
+    def materialize_range(self, user_id: str, start_date: str, end_date: str,
+                          bounds: Tuple[str, str], base_columns: List[str]) -> int:
+        """Recompute and persist feature rows for [start_date, end_date].
+        
+        Source data is read with a lookback halo (and a label day ahead) so
+        the rows equal those of a build over the user's whole history.
+        """
+        first, last = bounds
+        build_start = max(first, _shift_date(start_date, -FEATURE_LOOKBACK_DAYS))
+        build_end = min(last, _shift_date(end_date, LABEL_HORIZON))
+        rows = 0
+        for block in self.iter_daily_features(user_id, build_start, build_end, base_columns):
+            block = block[(block['date'] >= start_date) & (block['date'] <= end_date)]
+            self.persist_daily_features(user_id, block)
+            rows += len(block)
+        
+        if MATERIALIZE_SEQUENCES:
+            # Sequences ending after a changed row and within SEQ_LEN of it
+            sequences = self.build_sequence_features(
+                user_id, _shift_date(start_date, 1 - SEQ_LEN), _shift_date(end_date, SEQ_LEN)
+            )
+            self.persist_sequence_features(user_id, sequences)
+        return rows
+    
+    def materialize_dirty(self, user_id: Optional[str] = None) -> Dict[str, int]:
+        """Recompute only the feature rows reached by ingestion since the last run."""
+        with get_conn(readonly=True) as conn:
+            marks = conn.execute(
+                f"""SELECT user_id, date, seq FROM fs_dirty_dates
+                    {'WHERE user_id=?' if user_id else ''}
+                    ORDER BY user_id, date""",
+                [user_id] if user_id else []
+            ).fetchall()
+        
+        by_user: Dict[str, List[Tuple[str, int]]] = {}
+        for mark in marks:
+            by_user.setdefault(mark['user_id'], []).append((mark['date'], mark['seq']))
+        
+        totals = {'users': 0, 'dirty_dates': len(marks), 'rows': 0}
+        for uid, user_marks in by_user.items():
+            bounds = self.user_date_bounds(uid)
+            if bounds:
+                base_columns = self.user_base_columns(uid)
+                if self._stored_base_columns(uid, len(base_columns)) == base_columns:
+                    ranges = self.affected_ranges([d for d, _ in user_marks], bounds)
+                else:
+                    # New source or symptom type: every stored row changes shape
+                    ranges = [bounds]
+                for start, end in ranges:
+                    totals['rows'] += self.materialize_range(uid, start, end, bounds, base_columns)
             
-            if result:
-                return json.loads(result[0])
-            return None
+            # Marks touched again while we worked carry a newer seq and stay
+            with get_conn() as conn:
+                conn.executemany(
+                    "DELETE FROM fs_dirty_dates WHERE user_id=? AND date=? AND seq=?",
+                    [(uid, d, seq) for d, seq in user_marks]
+                )
+            totals['users'] += 1
+        
+        return totals
     
     def rebuild_features(self, user_id: str, start_date: str, end_date: str) -> None:
         """Rebuild all features for a user and date range."""
         print(f"Building features for user {user_id} from {start_date} to {end_date}")
         
-        # Build daily features
-        daily_df = self.build_daily_features(user_id, start_date, end_date)
-        self.persist_daily_features(user_id, daily_df)
-        
-        # Build sequence features
-        sequences = self.build_sequence_features(user_id, start_date, end_date)
-        self.persist_sequence_features(user_id, sequences)
+        # Build daily features, one memory-bounded block at a time
+        rows = 0
+        for block in self.iter_daily_features(user_id, start_date, end_date):
+            self.persist_daily_features(user_id, block)
+            rows += len(block)
         
-        print(f"✅ Features rebuilt: {len(daily_df)} daily records, {len(sequences)} sequences")
\ No newline at end of file
+        # Sequence windows are built on demand unless materialization is on
+        if MATERIALIZE_SEQUENCES:
+            sequences = self.build_sequence_features(user_id, start_date, end_date)
+            self.persist_sequence_features(user_id, sequences)
+            print(f"✅ Features rebuilt: {rows} daily records, {len(sequences)} sequences")
+        else:
+            print(f"✅ Features rebuilt: {rows} daily records")
+
+def rebuild_user_features(user_id: str, start_date: str, end_date: str) -> None:
+    """Rebuild features for one user; module-level so it can run in a worker process."""
+    FeatureStore().rebuild_features(user_id, start_date, end_date)
+
+def materialize_dirty_features(user_id: Optional[str] = None) -> Dict[str, int]:
+    """Materialize dirty feature dates; module-level so it can run in a worker process."""
+    return FeatureStore().materialize_dirty(user_id)
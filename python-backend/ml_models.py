@@ -5,61 +5,122 @@ Multi-task sequence models and trigger classifiers for health AI
 """
 
 import json
+import time
+import hashlib
+import threading
 import numpy as np
 import pandas as pd
-from typing import Dict, List, Optional, Tuple, Any
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple, Union, Any, TYPE_CHECKING
 import joblib
+from joblib import Parallel, delayed
 from pathlib import Path
 
 import torch
 import torch.nn as nn
-from torch.utils.data import Dataset, DataLoader
+from torch.utils.data import Dataset
 from sklearn.model_selection import TimeSeriesSplit
 from sklearn.preprocessing import StandardScaler
 from sklearn.pipeline import Pipeline
 from sklearn.linear_model import LogisticRegression
-from sklearn.ensemble import GradientBoostingClassifier
+from sklearn.ensemble import GradientBoostingClassifier, HistGradientBoostingClassifier
+from scipy.stats import rankdata
 from sklearn.metrics import roc_auc_score, brier_score_loss, classification_report
 
 from unified_health_ai import get_conn, ROLL_DAYS, SEQ_LEN, BATCH_SIZE, LEARNING_RATE, EPOCHS
 
+if TYPE_CHECKING:
+    from feature_store import FeatureMatrix
+
+# Configuration
+MODEL_CACHE_MAX_BYTES = 256 * 1024 * 1024   # loaded models kept in memory, by size on disk
+SEQUENCE_INFERENCE_THREADS = 1     # intra-op threads per forward pass; requests run in parallel
+SEQUENCE_INFERENCE_BATCH = 256     # windows per forward pass
+GLOBAL_MODEL_ID = "_global"        # models/<id> holds the cross-user model set
+GLOBAL_MODEL_FILE = "global.json"  # its user-level feature and calibration metadata
+# "user": a user's own models if saved, else the global set; "global": always the global set
+MODEL_SCOPE = "user"
+USER_PROFILE_DAYS = 28             # trailing rows summarized into user-level features
+USER_PROFILE_COLUMNS = ['mood', 'stress', 'energy', 'sleep_score', 'hrv_ms', 'steps', 'caffeine']
+CALIBRATION_MIN_ROWS = 30          # held-out rows a user needs for a calibration layer
+# "hist": HistGradientBoostingClassifier (binned, multi-threaded); "gbm": GradientBoostingClassifier
+CLASSIFIER_BACKEND = "hist"
+CLASSIFIER_N_JOBS = -1             # joblib workers for the fold x target fits (-1: all cores)
+CLASSIFIER_CV_SPLITS = 3
+PERMUTATION_REPEATS = 5            # shuffles per column for held-out importances (hist backend)
+PERMUTATION_BATCH_ROWS = 100_000   # shuffled rows scored per predict_proba call
+RETRAIN_MIN_NEW_ROWS = 7           # new feature days before a user's models are updated
+RETRAIN_MAX_WARM_UPDATES = 8       # warm updates in a row before a full retrain
+RETRAIN_WARM_TREES = 20            # boosting iterations added per warm classifier update
+RETRAIN_WARM_EPOCHS = 2            # fine-tuning epochs per warm sequence model update
+# One shared-encoder LSTM with a head per target ("sequence_multitask") instead of one per target
+SEQUENCE_MULTITASK = True
+SEQUENCE_TARGETS = ['gut', 'skin', 'mood', 'stress']
+
 ##############################
 # 1) SEQUENCE DATASET        #
 ##############################
 
 class HealthSequenceDataset(Dataset):
-    """Dataset for health sequence data."""
+    """Dataset for health sequence data.
     
-    def __init__(self, sequences: List[Dict[str, Any]], target: str = "gut"):
-        self.sequences = sequences
+    Windows are slices of one tensor over the daily feature matrix (see
+    feature_store.SequenceView), so no window is ever copied. Pass a list
+    of targets for one label column per target.
+    """
+    
+    def __init__(self, view, target: Union[str, List[str]] = "gut"):
+        self.seq_len = view.seq_len
         self.target = target
-        
+        self.targets = [target] if isinstance(target, str) else list(target)
+        # Lag features are NaN for a user's first days
+        self.X = torch.from_numpy(np.nan_to_num(view.matrix.X))
+        self.y = torch.from_numpy(np.nan_to_num(np.column_stack(
+            [view.label(f'y_{name}_next') for name in self.targets]
+        )).astype(self.X.numpy().dtype))
+        # [windows, seq_len, features] view of X; indexing a batch of it copies only the batch
+        self.windows = self.X.unfold(0, self.seq_len, 1)[:len(self.y)].transpose(1, 2)
+    
     def __len__(self):
-        return len(self.sequences)
+        return len(self.y)
     
     def __getitem__(self, idx):
-        seq = self.sequences[idx]
-        X = torch.FloatTensor(seq['X'])
-        y = torch.FloatTensor([seq['Y'].get(f'y_{self.target}_next', 0)])
-        return X, y
+        return self.windows[idx], self.y[idx]
+    
+    def batches(self, indices: torch.Tensor, shuffle: bool = False):
+        """(windows, labels) batches of BATCH_SIZE over the given window indices."""
+        if shuffle:
+            indices = indices[torch.randperm(len(indices))]
+        for start in range(0, len(indices), BATCH_SIZE):
+            idx = indices[start:start + BATCH_SIZE]
+            yield self.windows[idx], self.y[idx]
 
 ##############################
 # 2) LSTM MODEL             #
 ##############################
 
+def risk_head(hidden_dim: int, dropout: float) -> nn.Module:
+    """Output head mapping an encoder state to one risk in [0, 1]."""
+    return nn.Sequential(
+        nn.Linear(hidden_dim, 32),
+        nn.ReLU(),
+        nn.Dropout(dropout),
+        nn.Linear(32, 1),
+        nn.Sigmoid()
+    )
+
 class HealthLSTM(nn.Module):
     """LSTM model for health predictions."""
     
     def __init__(self, input_dim: int, hidden_dim: int = 64, num_layers: int = 2, dropout: float = 0.3):
         super().__init__()
+        self.input_dim = input_dim
+        self.hidden_dim = hidden_dim
+        self.num_layers = num_layers
+        self.dropout = dropout
         self.lstm = nn.LSTM(input_dim, hidden_dim, num_layers, batch_first=True, dropout=dropout)
-        self.fc = nn.Sequential(
-            nn.Linear(hidden_dim, 32),
-            nn.ReLU(),
-            nn.Dropout(dropout),
-            nn.Linear(32, 1),
-            nn.Sigmoid()
-        )
+        self.fc = risk_head(hidden_dim, dropout)
     
     def forward(self, x):
         # x: [batch, seq_len, features]
@@ -68,121 +129,524 @@ class HealthLSTM(nn.Module):
         out = self.fc(h_n[-1])
         return out
 
+class MultiTaskHealthLSTM(nn.Module):
+    """HealthLSTM encoder shared by one risk head per target; outputs [batch, targets]."""
+    
+    def __init__(self, input_dim: int, targets: List[str], hidden_dim: int = 64,
+                 num_layers: int = 2, dropout: float = 0.3):
+        super().__init__()
+        self.input_dim = input_dim
+        self.hidden_dim = hidden_dim
+        self.num_layers = num_layers
+        self.dropout = dropout
+        self.targets = list(targets)
+        self.lstm = nn.LSTM(input_dim, hidden_dim, num_layers, batch_first=True, dropout=dropout)
+        self.heads = nn.ModuleList([risk_head(hidden_dim, dropout) for _ in self.targets])
+    
+    def forward(self, x):
+        lstm_out, (h_n, c_n) = self.lstm(x)
+        hidden = h_n[-1]
+        outputs = []
+        for head in self.heads:
+            outputs.append(head(hidden))
+        return torch.cat(outputs, dim=1)
+
+def feature_schema_hash(feature_names: List[str]) -> str:
+    """Version of an input column layout."""
+    return hashlib.sha1(json.dumps(list(feature_names)).encode()).hexdigest()
+
+def sequence_metadata(model: nn.Module, feature_names: List[str], target: Union[str, List[str]],
+                      seq_len: int = SEQ_LEN) -> Dict[str, Any]:
+    """What is needed to rebuild a trained (multi-task) HealthLSTM around its state dict.
+    
+    'targets' names the model's output columns in order.
+    """
+    targets = [target] if isinstance(target, str) else list(target)
+    return {
+        'architecture': type(model).__name__,
+        'input_dim': model.input_dim,
+        'hidden_dim': model.hidden_dim,
+        'num_layers': model.num_layers,
+        'dropout': model.dropout,
+        'seq_len': seq_len,
+        'target': target if isinstance(target, str) else None,
+        'targets': targets,
+        'feature_names': list(feature_names),
+        'feature_schema': feature_schema_hash(feature_names),
+    }
+
+_inference_threads_set = False
+
+def _set_inference_threads() -> None:
+    """Apply SEQUENCE_INFERENCE_THREADS once per process."""
+    global _inference_threads_set
+    if not _inference_threads_set and SEQUENCE_INFERENCE_THREADS:
+        torch.set_num_threads(SEQUENCE_INFERENCE_THREADS)
+        _inference_threads_set = True
+
+def load_sequence_module(path: Path, metadata: Dict[str, Any]) -> nn.Module:
+    """Rebuild a saved (multi-task) HealthLSTM from its state dict and sidecar metadata."""
+    if metadata['architecture'] == MultiTaskHealthLSTM.__name__:
+        model = MultiTaskHealthLSTM(metadata['input_dim'], metadata['targets'], metadata['hidden_dim'],
+                                    metadata['num_layers'], metadata['dropout'])
+    else:
+        model = HealthLSTM(metadata['input_dim'], metadata['hidden_dim'],
+                           metadata['num_layers'], metadata['dropout'])
+    model.load_state_dict(torch.load(path, map_location='cpu', weights_only=True))
+    model.metadata = metadata
+    return model
+
+class SequenceInferenceModel:
+    """A saved HealthLSTM compiled to TorchScript for batched CPU inference."""
+    
+    def __init__(self, path: Path, metadata: Dict[str, Any]):
+        _set_inference_threads()
+        model = load_sequence_module(path, metadata)
+        model.eval()
+        self.module = torch.jit.freeze(torch.jit.script(model))
+        self.metadata = metadata
+        self.feature_names: List[str] = metadata['feature_names']
+        self.seq_len: int = metadata['seq_len']
+        # Output columns; sidecars from before multi-task models only name one target
+        self.targets: List[str] = metadata.get('targets') or [metadata['target']]
+    
+    def predict(self, windows: np.ndarray) -> np.ndarray:
+        """[windows, targets] risks for a [windows, seq_len, input_dim] array."""
+        X = torch.from_numpy(np.nan_to_num(np.asarray(windows, dtype=np.float32)))
+        out = np.empty((len(X), len(self.targets)), dtype=np.float32)
+        with torch.inference_mode():
+            for start in range(0, len(X), SEQUENCE_INFERENCE_BATCH):
+                batch = X[start:start + SEQUENCE_INFERENCE_BATCH]
+                out[start:start + len(batch)] = self.module(batch).numpy()
+        return out
+
+##############################
+# 3) USER-LEVEL FEATURES    #
+##############################
+
+def user_profile_names() -> List[str]:
+    """Names of the user-level features of the global model."""
+    from feature_store import LABEL_RULES
+    
+    return ([f'user_{col}_mean' for col in USER_PROFILE_COLUMNS]
+            + [f'user_{label}_rate' for label in LABEL_RULES] + ['user_profile_rows'])
+
+def user_profile_features(matrix: "FeatureMatrix") -> np.ndarray:
+    """User-level features of every row of one user's matrix.
+    
+    The trailing USER_PROFILE_DAYS-row means of key columns and the rates
+    of each label already known at that row (labels lag LABEL_HORIZON
+    rows), so they describe users the global model never saw and carry no
+    future information. Columns follow user_profile_names().
+    """
+    from feature_store import LABEL_RULES, LABEL_HORIZON, rolling_stats
+    
+    n = len(matrix.dates)
+    labels = np.full((n, len(LABEL_RULES)), np.nan)
+    for j, name in enumerate(LABEL_RULES):
+        labels[LABEL_HORIZON:, j] = matrix.label(name)[:n - LABEL_HORIZON]
+    values = np.hstack([matrix.columns(USER_PROFILE_COLUMNS).astype(np.float64), labels])
+    means = rolling_stats(values, USER_PROFILE_DAYS)[0]
+    rows = np.minimum(np.arange(1, n + 1), USER_PROFILE_DAYS)[:, None]
+    return np.nan_to_num(np.hstack([means, rows]))
+
+def global_design(matrix: "FeatureMatrix", feature_names: List[str]) -> np.ndarray:
+    """Global-model inputs of every row: the model's features, then user-level ones."""
+    return np.hstack([np.nan_to_num(matrix.columns(feature_names)), user_profile_features(matrix)])
+
+def calibrate(metadata: Dict[str, Any], target: str, user_ids: List[str],
+              risks: np.ndarray) -> np.ndarray:
+    """Apply each row's per-user calibration layer, where the user has one."""
+    layers = metadata.get('calibration', {}).get(target, {})
+    if not layers:
+        return risks
+    out = np.array(risks, dtype=np.float64)
+    logits = np.log(np.clip(out, 1e-6, 1 - 1e-6) / np.clip(1 - out, 1e-6, 1))
+    for i, user_id in enumerate(user_ids):
+        if user_id in layers:
+            slope, intercept = layers[user_id]
+            out[i] = 1 / (1 + np.exp(-(slope * logits[i] + intercept)))
+    return out
+
 ##############################
-# 3) MODEL TRAINER          #
+# 4) MODEL TRAINER          #
 ##############################
 
+def make_classifier(backend: str = CLASSIFIER_BACKEND):
+    """Unfitted trigger classifier for a backend (see CLASSIFIER_BACKEND)."""
+    if backend == "hist":
+        return HistGradientBoostingClassifier(
+            max_iter=100,
+            max_depth=4,
+            learning_rate=0.1,
+            early_stopping=False,
+            random_state=42
+        )
+    if backend == "gbm":
+        return GradientBoostingClassifier(
+            n_estimators=100,
+            max_depth=4,
+            learning_rate=0.1,
+            random_state=42
+        )
+    raise ValueError(f"Unknown classifier backend: {backend}")
+
+def _fit_fold(backend: str, X_train: np.ndarray, y_train: np.ndarray,
+              X_test: np.ndarray, y_test: np.ndarray) -> Tuple[Any, Optional[float], float]:
+    """Fit one fold on scaled rows: the classifier, its test AUC (None if undefined) and fit seconds."""
+    start = time.perf_counter()
+    classifier = make_classifier(backend).fit(X_train, y_train)
+    seconds = time.perf_counter() - start
+    
+    score = None
+    if len(np.unique(y_test)) > 1:
+        score = roc_auc_score(y_test, classifier.predict_proba(X_test)[:, 1])
+    return classifier, score, seconds
+
+def _auc_rows(y: np.ndarray, scores: np.ndarray) -> np.ndarray:
+    """ROC AUC of each row of scores [k, n] against binary labels y [n] (rank statistic)."""
+    ranks = rankdata(scores, axis=1)
+    positives = int(y.sum())
+    negatives = len(y) - positives
+    return (ranks[:, y == 1].sum(axis=1) - positives * (positives + 1) / 2) / (positives * negatives)
+
+def _held_out_importances(model: Pipeline, X_test: np.ndarray, y_test: np.ndarray) -> List[float]:
+    """Mean AUC drop on held-out rows when each column is shuffled.
+    
+    Permutation importance, with the shuffled copies of many columns
+    scored in one predict_proba call of at most PERMUTATION_BATCH_ROWS rows.
+    """
+    rng = np.random.default_rng(42)
+    n, d = X_test.shape
+    base = roc_auc_score(y_test, model.predict_proba(X_test)[:, 1])
+    copies = PERMUTATION_REPEATS * n
+    per_batch = max(1, PERMUTATION_BATCH_ROWS // copies)
+    drops = np.empty(d)
+    for start in range(0, d, per_batch):
+        cols = range(start, min(start + per_batch, d))
+        shuffled = np.tile(X_test, (PERMUTATION_REPEATS * len(cols), 1))
+        for k, j in enumerate(cols):
+            shuffled[k * copies:(k + 1) * copies, j] = np.concatenate(
+                [X_test[rng.permutation(n), j] for _ in range(PERMUTATION_REPEATS)])
+        risks = model.predict_proba(shuffled)[:, 1].reshape(len(cols), PERMUTATION_REPEATS, n)
+        aucs = _auc_rows(y_test, risks.reshape(-1, n)).reshape(len(cols), PERMUTATION_REPEATS)
+        drops[start:start + len(cols)] = base - aucs.mean(axis=1)
+    return drops.tolist()
+
 class HealthModelTrainer:
     """Train and evaluate health prediction models."""
     
-    def __init__(self):
+    def __init__(self, progress: Optional[Callable[[str], None]] = None,
+                 backend: str = CLASSIFIER_BACKEND, n_jobs: int = CLASSIFIER_N_JOBS,
+                 multitask: bool = SEQUENCE_MULTITASK):
         self.models = {}
+        self.feature_names: Optional[List[str]] = None  # column order the classifiers were fit on
+        self.global_metadata: Optional[Dict[str, Any]] = None  # set by train_global_classifiers
+        # Called with a message after each fitted model and epoch; may raise to stop training
+        self.progress = progress
+        self.backend = backend
+        self.n_jobs = n_jobs
+        self.multitask = multitask
+        # One entry per fit of the last classifier training: target, fold, seconds, AUC
+        self.fit_times: List[Dict[str, Any]] = []
+        # Held-out permutation importances of classifiers without feature_importances_, by model name
+        self.importances: Dict[str, List[float]] = {}
+        # Per model name, e.g. {'auc': ...} or {'val_loss': ...}; recorded in model_versions
+        self.metrics: Dict[str, Dict[str, Any]] = {}
     
-    def train_trigger_classifiers(self, user_id: str) -> Dict[str, Any]:
-        """Train trigger-based classifiers for each health target."""
-        with get_conn() as conn:
-            df = pd.read_sql_query(
-                """SELECT date, features_json, labels_json 
-                   FROM fs_daily_user 
-                   WHERE user_id=? 
-                   ORDER BY date""",
-                conn, params=[user_id]
-            )
+    def _report(self, message: str) -> None:
+        if self.progress:
+            self.progress(message)
+    
+    def _fit_best_classifiers(self, X: np.ndarray, labels: Dict[str, np.ndarray]
+                              ) -> Dict[str, Tuple[Pipeline, float, np.ndarray]]:
+        """Best pipeline per target over time-series folds, its AUC, and the last fold's test rows.
+        
+        Rows must be in time order; the last test fold is held out from
+        every candidate. Each fold is scaled once for all targets, and the
+        fold x target fits run on `n_jobs` joblib workers. Targets with no
+        fold scoring above 0 are left out. Classifiers without
+        feature_importances_ get permutation importances on the last test
+        fold in self.importances, for explanations.
+        """
+        self.fit_times = []
+        self.importances = {}
+        folds = []
+        for train_idx, test_idx in TimeSeriesSplit(n_splits=CLASSIFIER_CV_SPLITS).split(X):
+            scaler = StandardScaler().fit(X[train_idx])
+            folds.append((scaler, train_idx, test_idx,
+                          scaler.transform(X[train_idx]), scaler.transform(X[test_idx])))
+        
+        # A fold whose training rows hold one class can't be fit
+        tasks = [(target, k) for target, y in labels.items()
+                 for k, (_, train_idx, *_) in enumerate(folds) if len(np.unique(y[train_idx])) > 1]
+        start = time.perf_counter()
+        fits = Parallel(n_jobs=self.n_jobs)(
+            delayed(_fit_fold)(self.backend, folds[k][3], labels[target][folds[k][1]],
+                               folds[k][4], labels[target][folds[k][2]])
+            for target, k in tasks
+        )
+        wall = time.perf_counter() - start
+        
+        best: Dict[str, Tuple[Pipeline, float]] = {}
+        for (target, k), (classifier, score, seconds) in zip(tasks, fits):
+            self.fit_times.append({'target': target, 'fold': k, 'backend': self.backend,
+                                   'seconds': seconds, 'auc': score})
+            if score is not None and score > best.get(target, (None, 0))[1]:
+                best[target] = (Pipeline([('scaler', folds[k][0]), ('classifier', classifier)]), score)
+        if tasks:
+            print(f"  {len(tasks)} {self.backend} fits in {wall:.2f}s "
+                  f"({sum(fit[2] for fit in fits):.2f}s of fitting)")
+        
+        test_idx = folds[-1][2] if folds else np.array([], dtype=int)
+        explain = [target for target, (model, _) in best.items()
+                   if not hasattr(model.named_steps['classifier'], 'feature_importances_')
+                   and len(np.unique(labels[target][test_idx])) > 1]
+        importances = Parallel(n_jobs=self.n_jobs)(
+            delayed(_held_out_importances)(best[target][0], X[test_idx], labels[target][test_idx])
+            for target in explain
+        )
+        self.importances = {f'classifier_{target}': values
+                            for target, values in zip(explain, importances)}
+        
+        return {target: (model, score, test_idx) for target, (model, score) in best.items()}
+    
+    def train_trigger_classifiers(self, user_id: str,
+                                  matrix: Optional["FeatureMatrix"] = None,
+                                  targets: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Train trigger-based classifiers for each health target (or only `targets`).
         
-        if df.empty or len(df) < 30:
+        Pass matrix (e.g. dataset_export.open_dataset(...).matrix(user_id))
+        to train on an exported dataset instead of the stored rows.
+        """
+        from feature_store import FeatureStore
+        
+        if matrix is None:
+            matrix = FeatureStore().read_feature_matrix(user_id)
+        
+        if len(matrix.dates) < 30:
             print(f"⚠ Insufficient data for user {user_id}")
             return {}
         
-        # Parse features and labels
-        features_list = df['features_json'].apply(json.loads).tolist()
-        labels_list = df['labels_json'].apply(json.loads).tolist()
-        
-        # Convert to arrays
-        X = np.array([list(f.values()) for f in features_list])
+        # Lag features are NaN for a user's first days
+        X = np.nan_to_num(matrix.X)
+        self.feature_names = matrix.feature_names
         
         models = {}
-        targets = ['gut', 'skin', 'mood', 'stress']
+        targets = targets or ['gut', 'skin', 'mood', 'stress']
         
+        labels = {}
         for target in targets:
-            y_key = f'y_{target}_next'
-            y = np.array([l.get(y_key, 0) for l in labels_list])
+            y = np.nan_to_num(matrix.label(f'y_{target}_next')).astype(np.int8)
             
             # Skip if insufficient positive samples
-            if y.sum() < 5:
+            if y.sum() >= 5:
+                labels[target] = y
+        
+        fitted = self._fit_best_classifiers(X, labels)
+        for target in targets:
+            if target in fitted:
+                best_model, best_score, _ = fitted[target]
+                models[f'classifier_{target}'] = best_model
+                self.metrics[f'classifier_{target}'] = {'auc': best_score}
+                print(f"✅ Trained {target} classifier (AUC: {best_score:.3f})")
+            self._report(f"{target} classifier done")
+        
+        return models
+    
+    def train_global_classifiers(self, user_ids: Optional[List[str]] = None,
+                                 dataset: Any = None) -> Dict[str, Any]:
+        """Train one classifier per target on the pooled rows of many users.
+        
+        Inputs are the stored features plus user-level features (see
+        user_profile_features), so users with little history still get
+        predictions. Users with enough held-out rows also get a per-user
+        calibration layer (Platt scaling of the global score). Pass an
+        exported dataset (dataset_export.open_dataset) to train on it
+        instead of the stored rows; user_ids defaults to every user.
+        """
+        from feature_store import FeatureStore, LABEL_RULES
+        
+        if dataset is not None:
+            users = user_ids or dataset.users
+            matrices = [(uid, dataset.matrix(uid)) for uid in users]
+        else:
+            if user_ids is None:
+                with get_conn(readonly=True) as conn:
+                    user_ids = [row[0] for row in conn.execute(
+                        "SELECT DISTINCT user_id FROM fs_daily_user ORDER BY user_id")]
+            fs = FeatureStore()
+            matrices = [(uid, fs.read_feature_matrix(uid)) for uid in user_ids]
+        matrices = [(uid, matrix) for uid, matrix in matrices if matrix.dates]
+        if not matrices:
+            print("⚠ No stored feature rows to train a global model on")
+            return {}
+        
+        feature_names = list(dict.fromkeys(name for _, m in matrices for name in m.feature_names))
+        X = np.vstack([global_design(m, feature_names) for _, m in matrices])
+        Y = np.vstack([np.column_stack([m.label(name) for name in LABEL_RULES]) for _, m in matrices])
+        users = np.array([uid for uid, m in matrices for _ in m.dates])
+        # Folds split pooled rows by date, so every fold tests on later days
+        order = np.argsort(np.concatenate([m.dates for _, m in matrices]), kind='stable')
+        X, Y, users = X[order], Y[order], users[order]
+        
+        labels = {}
+        for j, label in enumerate(LABEL_RULES):
+            y = np.nan_to_num(Y[:, j]).astype(np.int8)
+            if y.sum() >= 5:
+                labels[label[len('y_'):-len('_next')]] = y
+        fitted = self._fit_best_classifiers(X, labels)
+        
+        models = {}
+        scores = {}
+        calibration: Dict[str, Dict[str, List[float]]] = {}
+        for target, (best_model, best_score, test_idx) in fitted.items():
+            y = labels[target]
+            models[f'classifier_{target}'] = best_model
+            scores[target] = best_score
+            
+            # Calibrate on held-out rows only
+            risks = best_model.predict_proba(X[test_idx])[:, 1]
+            logits = np.log(np.clip(risks, 1e-6, 1 - 1e-6) / np.clip(1 - risks, 1e-6, 1))
+            layers = {}
+            for uid in np.unique(users[test_idx]):
+                rows = users[test_idx] == uid
+                if rows.sum() >= CALIBRATION_MIN_ROWS and len(np.unique(y[test_idx][rows])) > 1:
+                    layer = LogisticRegression().fit(logits[rows, None], y[test_idx][rows])
+                    layers[str(uid)] = [float(layer.coef_[0, 0]), float(layer.intercept_[0])]
+            calibration[target] = layers
+            print(f"✅ Trained global {target} classifier (AUC: {best_score:.3f}, "
+                  f"{len(layers)} calibrated users)")
+            self._report(f"global {target} classifier done")
+        
+        self.feature_names = feature_names
+        self.global_metadata = {
+            'profile_names': user_profile_names(),
+            'profile_days': USER_PROFILE_DAYS,
+            'users': len(matrices),
+            'rows': len(X),
+            'auc': scores,
+            'calibration': calibration,
+        }
+        return models
+    
+    def update_classifiers(self, models: Dict[str, Pipeline], matrix: "FeatureMatrix",
+                           since: Optional[str] = None) -> Dict[str, Pipeline]:
+        """Warm-start saved classifiers on a user's current rows.
+        
+        Each GradientBoostingClassifier keeps its trees and scaler and adds
+        RETRAIN_WARM_TREES iterations fit on all rows, instead of being
+        cross-validated from scratch. The AUC recorded is the saved model's
+        on the rows after `since`, before the update. Histogram models are
+        left out: fit() rebins the data, which would move the thresholds of
+        their existing trees, so they must be refit from scratch.
+        """
+        X = np.nan_to_num(matrix.X)
+        self.feature_names = matrix.feature_names
+        new_rows = np.array([d > since for d in matrix.dates]) if since else np.ones(len(X), bool)
+        
+        updated = {}
+        for name, pipeline in models.items():
+            target = name[len('classifier_'):]
+            y = np.nan_to_num(matrix.label(f'y_{target}_next')).astype(np.int8)
+            scaler, classifier = pipeline.named_steps['scaler'], pipeline.named_steps['classifier']
+            if len(np.unique(y)) < 2 or not isinstance(classifier, GradientBoostingClassifier):
                 continue
             
-            # Time series split
-            tscv = TimeSeriesSplit(n_splits=3)
+            Xs = scaler.transform(X)
+            auc = None
+            if new_rows.any() and len(np.unique(y[new_rows])) > 1:
+                auc = roc_auc_score(y[new_rows], classifier.predict_proba(Xs[new_rows])[:, 1])
             
-            best_model = None
-            best_score = 0
+            # The scaler stays as fit; earlier trees split on its output
+            classifier.set_params(warm_start=True,
+                                  n_estimators=classifier.n_estimators + RETRAIN_WARM_TREES)
+            classifier.fit(Xs, y)
             
-            for train_idx, test_idx in tscv.split(X):
-                X_train, X_test = X[train_idx], X[test_idx]
-                y_train, y_test = y[train_idx], y[test_idx]
-                
-                # Train model
-                pipeline = Pipeline([
-                    ('scaler', StandardScaler()),
-                    ('classifier', GradientBoostingClassifier(
-                        n_estimators=100,
-                        max_depth=4,
-                        learning_rate=0.1,
-                        random_state=42
-                    ))
-                ])
-                
-                pipeline.fit(X_train, y_train)
-                
-                # Evaluate
-                if len(np.unique(y_test)) > 1:
-                    score = roc_auc_score(y_test, pipeline.predict_proba(X_test)[:, 1])
-                    if score > best_score:
-                        best_score = score
-                        best_model = pipeline
-            
-            if best_model:
-                models[f'classifier_{target}'] = best_model
-                print(f"✅ Trained {target} classifier (AUC: {best_score:.3f})")
+            updated[name] = pipeline
+            self.metrics[name] = {'auc_new_rows': auc, 'new_rows': int(new_rows.sum()),
+                                  'n_estimators': classifier.n_estimators}
+            print(f"✅ Updated {target} classifier ({int(new_rows.sum())} new rows)")
+            self._report(f"{target} classifier updated")
         
+        return updated
+    
+    def train_sequence_models(self, user_id: str, targets: List[str],
+                              matrix: Optional["FeatureMatrix"] = None,
+                              warm_start_dir: Optional[Path] = None) -> Dict[str, nn.Module]:
+        """Sequence models for the targets, by model name.
+        
+        One "sequence_multitask" model when self.multitask, else one
+        "sequence_<target>" model per target. With warm_start_dir, saved
+        models there with the same columns and targets are fine-tuned for
+        RETRAIN_WARM_EPOCHS epochs instead of trained anew.
+        """
+        from feature_store import FeatureStore
+        
+        if matrix is None:
+            matrix = FeatureStore().read_feature_matrix(user_id)
+        if self.multitask:
+            groups: Dict[str, Union[str, List[str]]] = {"sequence_multitask": list(targets)}
+        else:
+            groups = {f"sequence_{target}": target for target in targets}
+        
+        schema = feature_schema_hash(matrix.feature_names)
+        models = {}
+        for name, target in groups.items():
+            init = None
+            meta_file = warm_start_dir / f"{name}.meta.json" if warm_start_dir else None
+            if meta_file and meta_file.exists():
+                metadata = json.loads(meta_file.read_text())
+                if (metadata.get('feature_schema') == schema
+                        and (metadata.get('targets') or [metadata.get('target')]) == ([target] if isinstance(target, str) else target)):
+                    init = load_sequence_module(meta_file.parent / f"{name}.pth", metadata)
+            model = self.train_sequence_model(user_id, target, matrix, init=init,
+                                              epochs=RETRAIN_WARM_EPOCHS if init is not None else EPOCHS)
+            if model:
+                models[name] = model
         return models
     
-    def train_sequence_model(self, user_id: str, target: str = "gut") -> Optional[nn.Module]:
-        """Train LSTM sequence model for a specific target."""
-        with get_conn() as conn:
-            df = pd.read_sql_query(
-                """SELECT date, seq_json 
-                   FROM fs_seq_user 
-                   WHERE user_id=? 
-                   ORDER BY date""",
-                conn, params=[user_id]
-            )
+    def train_sequence_model(self, user_id: str, target: Union[str, List[str]] = "gut",
+                             matrix: Optional["FeatureMatrix"] = None,
+                             init: Optional[nn.Module] = None,
+                             epochs: int = EPOCHS) -> Optional[nn.Module]:
+        """Train LSTM sequence model for a target (optionally on an exported matrix).
+        
+        A list of targets trains one MultiTaskHealthLSTM on all of them.
+        Pass init (see load_sequence_module) to fine-tune a saved model for
+        a few epochs instead of training a new one.
+        """
+        from feature_store import FeatureStore, SequenceView
         
-        if df.empty or len(df) < 20:
+        view = SequenceView(matrix) if matrix is not None else FeatureStore().sequence_view(user_id)
+        
+        if len(view) < 20:
             print(f"⚠ Insufficient sequence data for user {user_id}")
             return None
         
-        # Parse sequences
-        sequences = [json.loads(row['seq_json']) for _, row in df.iterrows()]
+        # Windows and labels are tensors once; batches are gathered from them
+        dataset = HealthSequenceDataset(view, target)
+        name = target if isinstance(target, str) else "multi-task"
         
         # Split train/val
-        split_idx = int(len(sequences) * 0.8)
-        train_seqs = sequences[:split_idx]
-        val_seqs = sequences[split_idx:]
-        
-        # Create datasets
-        train_dataset = HealthSequenceDataset(train_seqs, target)
-        val_dataset = HealthSequenceDataset(val_seqs, target)
-        
-        train_loader = DataLoader(train_dataset, batch_size=BATCH_SIZE, shuffle=True)
-        val_loader = DataLoader(val_dataset, batch_size=BATCH_SIZE)
+        split_idx = int(len(dataset) * 0.8)
+        train_idx = torch.arange(split_idx)
+        val_idx = torch.arange(split_idx, len(dataset))
+        train_batches = -(-len(train_idx) // BATCH_SIZE)
+        val_batches = -(-len(val_idx) // BATCH_SIZE)
         
         # Get input dimension
-        sample_x, _ = train_dataset[0]
-        input_dim = sample_x.shape[1]
+        input_dim = dataset.X.shape[1]
         
         # Create model
-        model = HealthLSTM(input_dim)
+        if init is not None:
+            model = init
+        elif isinstance(target, str):
+            model = HealthLSTM(input_dim)
+        else:
+            model = MultiTaskHealthLSTM(input_dim, target)
+        # Saved with the state dict, so inference can rebuild the model
+        model.metadata = sequence_metadata(model, view.matrix.feature_names, target, view.seq_len)
         criterion = nn.BCELoss()
         optimizer = torch.optim.Adam(model.parameters(), lr=LEARNING_RATE)
         
@@ -191,11 +655,11 @@ class HealthModelTrainer:
         patience = 3
         patience_counter = 0
         
-        for epoch in range(EPOCHS):
+        for epoch in range(epochs):
             # Training
             model.train()
             train_loss = 0
-            for X_batch, y_batch in train_loader:
+            for X_batch, y_batch in dataset.batches(train_idx, shuffle=True):
                 optimizer.zero_grad()
                 outputs = model(X_batch)
                 loss = criterion(outputs, y_batch)
@@ -207,15 +671,16 @@ class HealthModelTrainer:
             model.eval()
             val_loss = 0
             with torch.no_grad():
-                for X_batch, y_batch in val_loader:
+                for X_batch, y_batch in dataset.batches(val_idx):
                     outputs = model(X_batch)
                     loss = criterion(outputs, y_batch)
                     val_loss += loss.item()
             
-            avg_train_loss = train_loss / len(train_loader)
-            avg_val_loss = val_loss / len(val_loader)
+            avg_train_loss = train_loss / train_batches
+            avg_val_loss = val_loss / val_batches
             
-            print(f"Epoch {epoch+1}/{EPOCHS} - Train Loss: {avg_train_loss:.4f}, Val Loss: {avg_val_loss:.4f}")
+            print(f"Epoch {epoch+1}/{epochs} - Train Loss: {avg_train_loss:.4f}, Val Loss: {avg_val_loss:.4f}")
+            self._report(f"{name} sequence model epoch {epoch+1}/{epochs}")
             
             # Early stopping
             if avg_val_loss < best_val_loss:
@@ -227,7 +692,9 @@ class HealthModelTrainer:
                     print(f"Early stopping at epoch {epoch+1}")
                     break
         
-        print(f"✅ Trained {target} sequence model")
+        key = f"sequence_{target}" if isinstance(target, str) else "sequence_multitask"
+        self.metrics[key] = {'val_loss': best_val_loss, 'epochs': epoch + 1, 'warm_start': init is not None}
+        print(f"✅ Trained {name} sequence model")
         return model
     
     def save_models(self, user_id: str, models: Dict[str, Any]) -> None:
@@ -237,12 +704,40 @@ class HealthModelTrainer:
         
         for name, model in models.items():
             if isinstance(model, nn.Module):
-                # Save PyTorch model
+                # Save PyTorch model with the metadata needed to load it
                 torch.save(model.state_dict(), model_dir / f"{name}.pth")
+                metadata = getattr(model, 'metadata', None)
+                if metadata:
+                    (model_dir / f"{name}.meta.json").write_text(json.dumps(metadata))
             else:
                 # Save sklearn model
                 joblib.dump(model, model_dir / f"{name}.pkl")
         
+        # A user has either one multi-task sequence model or per-target ones
+        if any(name == "sequence_multitask" for name in models):
+            stale = [f"sequence_{target}" for target in SEQUENCE_TARGETS]
+        elif any(name.startswith("sequence_") for name in models):
+            stale = ["sequence_multitask"]
+        else:
+            stale = []
+        for name in stale:
+            for suffix in (".pth", ".meta.json"):
+                (model_dir / f"{name}{suffix}").unlink(missing_ok=True)
+        
+        # Classifier input columns, so prediction can align stored rows by name
+        if self.feature_names:
+            (model_dir / "feature_names.json").write_text(json.dumps(self.feature_names))
+        if self.global_metadata:
+            (model_dir / GLOBAL_MODEL_FILE).write_text(json.dumps(self.global_metadata))
+        if self.fit_times:
+            (model_dir / "fit_times.json").write_text(json.dumps(self.fit_times))
+        if any(name.startswith("classifier_") for name in models):
+            # Importances of older classifiers must not outlive them
+            if self.importances:
+                (model_dir / "importances.json").write_text(json.dumps(self.importances))
+            else:
+                (model_dir / "importances.json").unlink(missing_ok=True)
+        
         print(f"✅ Models saved to {model_dir}")
     
     def load_models(self, user_id: str) -> Dict[str, Any]:
@@ -257,100 +752,331 @@ class HealthModelTrainer:
         for pkl_file in model_dir.glob("*.pkl"):
             models[pkl_file.stem] = joblib.load(pkl_file)
         
-        # Load PyTorch models
+        # Load PyTorch models; ones saved without metadata can't be rebuilt
         for pth_file in model_dir.glob("*.pth"):
-            # Note: Need to know input_dim to load LSTM
-            # For now, just save the path
-            models[pth_file.stem] = str(pth_file)
+            meta_file = pth_file.with_suffix(".meta.json")
+            if meta_file.exists():
+                models[pth_file.stem] = SequenceInferenceModel(pth_file, json.loads(meta_file.read_text()))
+            else:
+                print(f"⚠ No metadata for {pth_file}; retrain to use it")
         
         return models
+    
+    def load_global_metadata(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """User-level feature and calibration metadata, if this is a global model set."""
+        path = Path("models") / user_id / GLOBAL_MODEL_FILE
+        if not path.exists():
+            return None
+        return json.loads(path.read_text())
+    
+    def load_feature_names(self, user_id: str) -> Optional[List[str]]:
+        """Column order the user's classifiers were trained on, if recorded."""
+        path = Path("models") / user_id / "feature_names.json"
+        if not path.exists():
+            return None
+        return json.loads(path.read_text())
+    
+    def load_importances(self, user_id: str) -> Dict[str, List[float]]:
+        """Saved held-out importances of the user's classifiers, by model name."""
+        path = Path("models") / user_id / "importances.json"
+        if not path.exists():
+            return {}
+        return json.loads(path.read_text())
 
 ##############################
-# 4) PREDICTION ENGINE      #
+# 5) MODEL CACHE            #
 ##############################
 
-class HealthPredictionEngine:
-    """Generate predictions using trained models."""
+def model_version(user_id: str) -> Optional[str]:
+    """Fingerprint of a user's saved models (file names, sizes and mtimes).
     
-    def __init__(self):
-        self.models = {}
+    None if the user has no model directory. A retrain rewrites the files,
+    so it changes the version, including from another process.
+    """
+    model_dir = Path("models") / user_id
+    if not model_dir.is_dir():
+        return None
+    entries = sorted((path.name, stat.st_size, stat.st_mtime_ns)
+                     for path in model_dir.iterdir() if path.is_file()
+                     for stat in [path.stat()])
+    return hashlib.sha1(json.dumps(entries).encode()).hexdigest()[:16]
+
+class LoadedModels(NamedTuple):
+    """One version of a user's models, as loaded from disk."""
+    user_id: str
+    version: Optional[str]
+    models: Dict[str, Any]
+    feature_names: Optional[List[str]]
+    nbytes: int   # size of the model files, an estimate of memory held
+    metadata: Optional[Dict[str, Any]] = None   # set for the global model set
+    importances: Optional[Dict[str, List[float]]] = None   # see HealthModelTrainer.importances
+    
+    @property
+    def is_global(self) -> bool:
+        return self.metadata is not None
+
+class ModelCache:
+    """LRU cache of loaded per-user models under a byte budget.
+    
+    Entries are keyed by (user_id, model_version) and must be treated as
+    read-only; a new version replaces the user's older ones. Loads are
+    single-flight: concurrent misses on one key wait for the first load
+    instead of reading the same files again.
+    """
+    
+    def __init__(self, max_bytes: int = MODEL_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, str], LoadedModels]" = OrderedDict()
+        self._loading: Dict[Tuple[str, str], Future] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'coalesced': 0, 'loads': 0, 'load_errors': 0,
+                       'evictions': 0, 'load_ms_total': 0.0, 'load_ms_max': 0.0}
     
-    def load_models(self, user_id: str) -> None:
-        """Load models for a user."""
+    def _drop(self, key: Tuple[str, str]) -> None:
+        self._bytes -= self._entries.pop(key).nbytes
+    
+    def get(self, user_id: str) -> LoadedModels:
+        """The current version of a user's models (empty if none are saved)."""
+        version = model_version(user_id)
+        if version is None:
+            return LoadedModels(user_id, None, {}, None, 0)
+        
+        key = (user_id, version)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return entry
+            future = self._loading.get(key)
+            owner = future is None
+            if owner:
+                future = self._loading[key] = Future()
+                self._stats['misses'] += 1
+            else:
+                self._stats['coalesced'] += 1
+        if not owner:
+            return future.result()
+        
+        start = time.perf_counter()
+        try:
+            entry = self._load(user_id, version)
+        except BaseException as e:
+            with self._lock:
+                del self._loading[key]
+                self._stats['load_errors'] += 1
+            future.set_exception(e)
+            raise
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        
+        with self._lock:
+            del self._loading[key]
+            self._stats['loads'] += 1
+            self._stats['load_ms_total'] += elapsed_ms
+            self._stats['load_ms_max'] = max(self._stats['load_ms_max'], elapsed_ms)
+            for old in [k for k in self._entries if k[0] == user_id]:
+                self._drop(old)
+            # A user's models bigger than the whole budget are served uncached
+            if entry.nbytes <= self.max_bytes:
+                self._entries[key] = entry
+                self._bytes += entry.nbytes
+                while self._bytes > self.max_bytes:
+                    self._drop(next(iter(self._entries)))
+                    self._stats['evictions'] += 1
+        future.set_result(entry)
+        return entry
+    
+    @staticmethod
+    def _load(user_id: str, version: str) -> LoadedModels:
         trainer = HealthModelTrainer()
-        self.models = trainer.load_models(user_id)
+        models = trainer.load_models(user_id)
+        nbytes = sum(path.stat().st_size for path in (Path("models") / user_id).iterdir()
+                     if path.is_file())
+        return LoadedModels(user_id, version, models, trainer.load_feature_names(user_id), nbytes,
+                            trainer.load_global_metadata(user_id), trainer.load_importances(user_id))
+    
+    def invalidate(self, user_id: str) -> int:
+        """Drop every cached version of a user's models."""
+        with self._lock:
+            keys = [key for key in self._entries if key[0] == user_id]
+            for key in keys:
+                self._drop(key)
+            return len(keys)
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+    
+    def stats(self) -> Dict[str, Any]:
+        """Size and hit/miss/eviction counters with load latency."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+            stats['bytes'] = self._bytes
+        lookups = stats['hits'] + stats['misses'] + stats['coalesced']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        stats['load_ms_avg'] = stats['load_ms_total'] / stats['loads'] if stats['loads'] else 0.0
+        stats['max_bytes'] = self.max_bytes
+        return stats
+
+_model_cache: Optional[ModelCache] = None
+
+def get_model_cache() -> ModelCache:
+    """Get the process-wide model cache."""
+    global _model_cache
+    if _model_cache is None:
+        _model_cache = ModelCache()
+    return _model_cache
+
+##############################
+# 6) PREDICTION ENGINE      #
+##############################
+
+class HealthPredictionEngine:
+    """Generate predictions using trained models.
+    
+    Holds no per-user state: each call looks up the user's current models
+    in the shared model cache.
+    """
+    
+    def __init__(self, cache: Optional[ModelCache] = None):
+        self.cache = cache or get_model_cache()
+    
+    def load_models(self, user_id: str) -> LoadedModels:
+        """Models for a user through the cache: their own or the global set (see MODEL_SCOPE)."""
+        if MODEL_SCOPE != "global":
+            loaded = self.cache.get(user_id)
+            if loaded.models:
+                return loaded
+        return self.cache.get(GLOBAL_MODEL_ID)
+    
+    @staticmethod
+    def _global_rows(user_id: str, matrix: "FeatureMatrix", dates: List[str],
+                     loaded: LoadedModels) -> Dict[str, np.ndarray]:
+        """Global-model inputs for dates in matrix, {date: row}.
+        
+        The user's stored rows of the preceding USER_PROFILE_DAYS days are
+        read to compute the user-level features.
+        """
+        from feature_store import FeatureStore, _shift_date
+        
+        history = FeatureStore().read_feature_matrix(
+            user_id, _shift_date(min(dates), -USER_PROFILE_DAYS), max(dates)
+        ).merge(matrix)
+        X = global_design(history, loaded.feature_names)
+        wanted = set(dates)
+        return {day: X[i] for i, day in enumerate(history.dates) if day in wanted}
     
-    def predict_daily_risk(self, user_id: str, date: str) -> Dict[str, float]:
-        """Predict daily risk scores for all targets."""
+    def daily_matrix(self, user_id: str, date: str) -> "FeatureMatrix":
+        """The stored feature row for a date, or, if it isn't materialized
+        yet, a targeted build of just the features the models use."""
         from feature_store import FeatureStore
         
         fs = FeatureStore()
-        features = fs.get_daily_features(user_id, date)
+        matrix = fs.read_daily_row(user_id, date)
+        feature_names = self.load_models(user_id).feature_names
+        if not matrix.dates and feature_names:
+            matrix = fs.build_feature_matrix(user_id, date, date, feature_names)
+        return matrix
+    
+    def predict_daily_risk(self, user_id: str, date: str,
+                           matrix: Optional["FeatureMatrix"] = None) -> Dict[str, float]:
+        """Predict daily risk scores for all targets.
+        
+        Pass matrix (e.g. online features) to skip reading the stored row.
+        """
+        if matrix is None:
+            matrix = self.daily_matrix(user_id, date)
         
-        if not features:
+        if not matrix.dates:
             return {}
         
-        X = np.array([list(features['features'].values())])
+        loaded = self.load_models(user_id)
+        if loaded.is_global:
+            X = self._global_rows(user_id, matrix, [date], loaded)[date][None]
+        else:
+            # Models saved before feature names were recorded use stored order
+            X = matrix.columns(loaded.feature_names) if loaded.feature_names else matrix.X
+            X = np.nan_to_num(X)
         
         predictions = {}
         targets = ['gut', 'skin', 'mood', 'stress']
         
         for target in targets:
             model_name = f'classifier_{target}'
-            if model_name in self.models:
-                model = self.models[model_name]
-                pred_proba = model.predict_proba(X)[0, 1]
-                predictions[target] = float(pred_proba)
+            if model_name in loaded.models:
+                model = loaded.models[model_name]
+                pred_proba = model.predict_proba(X)[:1, 1]
+                if loaded.is_global:
+                    pred_proba = calibrate(loaded.metadata, target, [user_id], pred_proba)
+                predictions[target] = float(pred_proba[0])
         
         return predictions
     
     def predict_sequence_risk(self, user_id: str, date: str) -> Dict[str, float]:
         """Predict risk using sequence models."""
-        from feature_store import FeatureStore
+        return self.predict_sequence_series(user_id, date, date).get(date, {})
+    
+    def predict_sequence_series(self, user_id: str, start_date: str,
+                                end_date: str) -> Dict[str, Dict[str, float]]:
+        """Sequence-model risk for every stored date in a range, {date: {target: risk}}.
         
-        fs = FeatureStore()
-        seq_features = fs.get_sequence_features(user_id, date)
+        All windows of the range go through each model in batched passes.
+        """
+        from feature_store import FeatureStore, SequenceView, _shift_date
         
-        if not seq_features:
+        loaded = self.load_models(user_id)
+        sequence_models = [model for name, model in sorted(loaded.models.items())
+                           if name.startswith('sequence_')]
+        if not sequence_models:
             return {}
         
-        X = torch.FloatTensor(seq_features['X']).unsqueeze(0)  # Add batch dimension
-        
-        predictions = {}
-        targets = ['gut', 'skin', 'mood', 'stress']
-        
-        for target in targets:
-            model_name = f'sequence_{target}'
-            if model_name in self.models:
-                model_path = self.models[model_name]
-                # Load and predict (simplified)
-                # In production, cache loaded models
-                predictions[target] = 0.5  # Placeholder
+        seq_len = max(model.seq_len for model in sequence_models)
+        matrix = FeatureStore().read_feature_matrix(user_id, _shift_date(start_date, -seq_len), end_date)
         
+        predictions: Dict[str, Dict[str, float]] = {}
+        for model in sequence_models:
+            view = SequenceView(matrix, model.seq_len)
+            rows = [i for i, day in enumerate(view.dates) if day >= start_date]
+            if not rows:
+                continue
+            # Windows of the model's own columns, aligned by name
+            X = matrix.columns(model.feature_names)
+            windows = np.stack([X[i:i + model.seq_len] for i in rows])
+            # A multi-task model scores every target in the same pass
+            for i, risks in zip(rows, model.predict(windows).tolist()):
+                predictions.setdefault(view.dates[i], {}).update(zip(model.targets, risks))
         return predictions
     
-    def get_explanations(self, user_id: str, date: str) -> Dict[str, Dict[str, float]]:
+    def get_explanations(self, user_id: str, date: str,
+                         matrix: Optional["FeatureMatrix"] = None) -> Dict[str, Dict[str, float]]:
         """Get feature importance explanations."""
-        from feature_store import FeatureStore
+        if matrix is None:
+            matrix = self.daily_matrix(user_id, date)
         
-        fs = FeatureStore()
-        features = fs.get_daily_features(user_id, date)
-        
-        if not features:
+        if not matrix.dates:
             return {}
         
+        loaded = self.load_models(user_id)
+        feature_names = loaded.feature_names or matrix.feature_names
+        if loaded.is_global:
+            feature_names = feature_names + loaded.metadata['profile_names']
         explanations = {}
         targets = ['gut', 'skin', 'mood', 'stress']
         
         for target in targets:
             model_name = f'classifier_{target}'
-            if model_name in self.models:
-                model = self.models[model_name]
+            if model_name in loaded.models:
+                model = loaded.models[model_name]
                 
-                # Get feature importances
-                if hasattr(model.named_steps['classifier'], 'feature_importances_'):
-                    importances = model.named_steps['classifier'].feature_importances_
-                    feature_names = list(features['features'].keys())
+                # Impurity importances, else the ones computed on held-out rows at train time
+                importances = getattr(model.named_steps['classifier'], 'feature_importances_', None)
+                if importances is None and loaded.importances:
+                    importances = loaded.importances.get(model_name)
+                if importances is not None:
+                    importances = np.asarray(importances)
                     
                     # Top 5 features
                     top_indices = np.argsort(importances)[-5:][::-1]
@@ -359,4 +1085,337 @@ class HealthPredictionEngine:
                         for i in top_indices
                     }
         
-        return explanations
\ No newline at end of file
+        return explanations
+
+##############################
+# 7) BATCH PREDICTION       #
+##############################
+
+def _batch_features(user_id: str, dates: List[str], loaded: LoadedModels) -> Dict[str, np.ndarray]:
+    """Model inputs of one user's dates, {date: row}, from one stored read.
+    
+    Dates with no stored row get a targeted build of the model's features,
+    one per run of consecutive missing dates; dates with no data at all are
+    left out.
+    """
+    from feature_store import FeatureStore, _shift_date, date_runs
+    
+    fs = FeatureStore()
+    feature_names = loaded.feature_names
+    # The global model's user-level features also read the rows before
+    start = _shift_date(min(dates), -USER_PROFILE_DAYS) if loaded.is_global else min(dates)
+    matrix = fs.read_feature_matrix(user_id, start, max(dates))
+    
+    missing = set(dates) - set(matrix.dates)
+    if missing and feature_names:
+        # Stored days between missing ones are not rebuilt
+        for first, last in date_runs(list(missing)):
+            matrix = matrix.merge(fs.build_feature_matrix(user_id, first, last, feature_names))
+    
+    if loaded.is_global:
+        X = global_design(matrix, feature_names)
+    else:
+        X = np.nan_to_num(matrix.columns(feature_names) if feature_names else matrix.X)
+    wanted = set(dates)
+    return {day: X[i] for i, day in enumerate(matrix.dates) if day in wanted}
+
+def predict_batch(pairs: List[Tuple[str, str]], persist: bool = False,
+                  engine: Optional[HealthPredictionEngine] = None) -> List[Dict[str, Any]]:
+    """Daily risk for many (user_id, date) pairs, in the order given.
+    
+    Each user's rows are fetched with one read, and rows scored by the same
+    model are stacked into one predict_proba call (one call per target for
+    every user on the global model set). With persist, the scores
+    are written to the predictions table in one transaction. Pairs without
+    models or features get empty predictions.
+    """
+    engine = engine or HealthPredictionEngine()
+    pairs = list(dict.fromkeys((user_id, str(date)) for user_id, date in pairs))
+    by_user: Dict[str, List[str]] = {}
+    for user_id, date in pairs:
+        by_user.setdefault(user_id, []).append(date)
+    
+    # id(model) -> (loaded set, model, target, keys, rows)
+    groups: Dict[int, Tuple[LoadedModels, Any, str, List[Tuple[str, str]], List[np.ndarray]]] = {}
+    for user_id, dates in by_user.items():
+        loaded = engine.load_models(user_id)
+        classifiers = {target: loaded.models[f'classifier_{target}']
+                       for target in ['gut', 'skin', 'mood', 'stress']
+                       if f'classifier_{target}' in loaded.models}
+        if not classifiers:
+            continue
+        
+        rows = _batch_features(user_id, dates, loaded)
+        for target, model in classifiers.items():
+            group = groups.setdefault(id(model), (loaded, model, target, [], []))
+            for date, row in rows.items():
+                group[3].append((user_id, date))
+                group[4].append(row)
+    
+    results: Dict[Tuple[str, str], Dict[str, float]] = {pair: {} for pair in pairs}
+    for loaded, model, target, keys, rows in groups.values():
+        risks = model.predict_proba(np.vstack(rows))[:, 1]
+        if loaded.is_global:
+            risks = calibrate(loaded.metadata, target, [user_id for user_id, _ in keys], risks)
+        for key, risk in zip(keys, risks.tolist()):
+            results[key][target] = risk
+    
+    if persist:
+        with get_conn() as conn:
+            conn.executemany(
+                """INSERT INTO predictions (user_id, date, model_type, target, prediction)
+                   VALUES (?, ?, 'tabular', ?, ?)""",
+                [(user_id, date, target, risk)
+                 for (user_id, date), predictions in results.items()
+                 for target, risk in predictions.items()]
+            )
+    
+    return [{'user_id': user_id, 'date': date, 'predictions': results[(user_id, date)]}
+            for user_id, date in pairs]
+
+##############################
+# 8) TRAINING ENTRY POINTS  #
+##############################
+
+def train_user_models(user_id: str, targets: List[str],
+                      progress: Optional[Callable[[float, str], None]] = None) -> None:
+    """Train and save all models for a user.
+    
+    Synchronous and module-level so it can run in a worker process.
+    progress(fraction, message) is called as training advances and may
+    raise to stop it; errors are re-raised after being logged.
+    """
+    from feature_store import FeatureStore
+    
+    # Stages: classifiers, sequence models, save
+    stage = [0]
+    stages = 3
+    
+    def report(message: str) -> None:
+        if progress:
+            progress(stage[0] / stages, message)
+    
+    try:
+        # Rows arriving while training count towards the next retrain
+        rows, data_through = feature_extent(user_id)
+        trainer = HealthModelTrainer(report)
+        matrix = FeatureStore().read_feature_matrix(user_id)
+        
+        # Train trigger classifiers
+        classifiers = trainer.train_trigger_classifiers(user_id, matrix)
+        stage[0] += 1
+        
+        # Train sequence models (one multi-task model, or one per target)
+        sequence_models = trainer.train_sequence_models(user_id, targets, matrix)
+        stage[0] += 1
+        report("sequence models done")
+        
+        # Save all models
+        all_models = {**classifiers, **sequence_models}
+        trainer.save_models(user_id, all_models)
+        record_model_versions(user_id, all_models, "full", rows, data_through, trainer.metrics)
+        stage[0] += 1
+        report("models saved")
+        
+        print(f"✅ Models trained for user {user_id}")
+    
+    except Exception as e:
+        print(f"❌ Error training models for user {user_id}: {e}")
+        raise
+
+def train_global_models(user_ids: Optional[List[str]] = None,
+                        dataset_path: Optional[str] = None,
+                        progress: Optional[Callable[[float, str], None]] = None) -> None:
+    """Train and save the cross-user classifiers (see train_global_classifiers).
+    
+    Synchronous and module-level so it can run in a worker process;
+    progress works as in train_user_models.
+    """
+    # One report per target classifier, then the save
+    stages = len(['gut', 'skin', 'mood', 'stress']) + 1
+    done = [0]
+    
+    def report(message: str) -> None:
+        done[0] += 1
+        if progress:
+            progress(min(done[0] / stages, 1.0), message)
+    
+    try:
+        dataset = None
+        if dataset_path:
+            from dataset_export import open_dataset
+            dataset = open_dataset(dataset_path)
+        
+        trainer = HealthModelTrainer(report)
+        models = trainer.train_global_classifiers(user_ids, dataset)
+        if models:
+            trainer.save_models(GLOBAL_MODEL_ID, models)
+        done[0] = stages - 1
+        report("models saved")
+        
+        print(f"✅ Global models trained on {(trainer.global_metadata or {}).get('users', 0)} users")
+    
+    except Exception as e:
+        print(f"❌ Error training global models: {e}")
+        raise
+
+##############################
+# 9) RETRAINING POLICY      #
+##############################
+
+def feature_extent(user_id: str) -> Tuple[int, Optional[str]]:
+    """A user's stored feature row count and last feature date."""
+    with get_conn(readonly=True) as conn:
+        rows, last_date = conn.execute(
+            "SELECT COUNT(*), MAX(date) FROM fs_daily_user WHERE user_id=?", (user_id,)
+        ).fetchone()
+    return rows, last_date
+
+def record_model_versions(user_id: str, models: Dict[str, Any], mode: str, rows: int,
+                          data_through: Optional[str],
+                          metrics: Optional[Dict[str, Dict[str, Any]]] = None) -> None:
+    """Add the saved models to model_versions as the user's active versions.
+    
+    mode is 'full' or 'warm'; rows and data_through describe the feature
+    rows the models were trained on, so the next retrain can count new ones.
+    """
+    version = model_version(user_id)
+    model_dir = Path("models") / user_id
+    metrics = metrics or {}
+    with get_conn() as conn:
+        for name, model in models.items():
+            kind, target = name.split('_', 1)
+            model_type = 'tabular' if kind == 'classifier' else 'sequence'
+            suffix = '.pth' if isinstance(model, nn.Module) else '.pkl'
+            conn.execute(
+                "UPDATE model_versions SET is_active=FALSE WHERE user_id=? AND model_type=? AND target=?",
+                (user_id, model_type, target)
+            )
+            conn.execute(
+                """INSERT INTO model_versions
+                   (user_id, model_type, target, version, model_path, metrics_json,
+                    train_mode, rows_trained, data_through, is_active)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, TRUE)""",
+                (user_id, model_type, target, version, str(model_dir / f"{name}{suffix}"),
+                 json.dumps(metrics.get(name, {})), mode, rows, data_through)
+            )
+
+def retrain_decision(user_id: str) -> Dict[str, Any]:
+    """Whether a user's models need retraining, from rows added since their active version.
+    
+    'skip' below RETRAIN_MIN_NEW_ROWS new feature days, 'update' (warm
+    start) above it, and 'full' for users without recorded versions or
+    after RETRAIN_MAX_WARM_UPDATES updates in a row.
+    """
+    with get_conn(readonly=True) as conn:
+        active = conn.execute(
+            """SELECT data_through, rows_trained FROM model_versions
+               WHERE user_id=? AND is_active ORDER BY model_id DESC LIMIT 1""",
+            (user_id,)
+        ).fetchone()
+        if active is None or not (Path("models") / user_id).is_dir():
+            rows = conn.execute("SELECT COUNT(*) FROM fs_daily_user WHERE user_id=?",
+                                (user_id,)).fetchone()[0]
+            return {'user_id': user_id, 'action': 'full', 'new_rows': rows,
+                    'reason': 'no trained model version'}
+        
+        data_through = active['data_through']
+        new_rows = conn.execute(
+            "SELECT COUNT(*) FROM fs_daily_user WHERE user_id=? AND date > ?",
+            (user_id, data_through or '')
+        ).fetchone()[0]
+        warm_updates = conn.execute(
+            """SELECT COUNT(DISTINCT version) FROM model_versions
+               WHERE user_id=? AND train_mode='warm' AND model_id > COALESCE(
+                   (SELECT MAX(model_id) FROM model_versions WHERE user_id=? AND train_mode='full'), 0)""",
+            (user_id, user_id)
+        ).fetchone()[0]
+    
+    decision = {'user_id': user_id, 'new_rows': new_rows, 'data_through': data_through,
+                'warm_updates': warm_updates}
+    if new_rows < RETRAIN_MIN_NEW_ROWS:
+        return {**decision, 'action': 'skip', 'reason': f'{new_rows} new rows'}
+    if warm_updates >= RETRAIN_MAX_WARM_UPDATES:
+        return {**decision, 'action': 'full', 'reason': f'{warm_updates} warm updates since last full retrain'}
+    return {**decision, 'action': 'update', 'reason': f'{new_rows} new rows'}
+
+def update_user_models(user_id: str, targets: List[str], since: Optional[str],
+                       progress: Optional[Callable[[float, str], None]] = None) -> bool:
+    """Warm-start a user's saved models on their current rows and save them.
+    
+    Returns False, leaving the models untouched, if the stored feature
+    columns no longer match the ones the models were trained on. Targets
+    without a classifier that can be warm-started (none saved, or a
+    histogram model) get one cross-validated from scratch.
+    """
+    from feature_store import FeatureStore
+    
+    stage = [0]
+    stages = 3
+    
+    def report(message: str) -> None:
+        if progress:
+            progress(stage[0] / stages, message)
+    
+    rows, data_through = feature_extent(user_id)
+    model_dir = Path("models") / user_id
+    trainer = HealthModelTrainer(report)
+    matrix = FeatureStore().read_feature_matrix(user_id)
+    if trainer.load_feature_names(user_id) != matrix.feature_names:
+        return False
+    
+    saved = {path.stem: joblib.load(path) for path in model_dir.glob("classifier_*.pkl")}
+    classifiers = trainer.update_classifiers(saved, matrix, since)
+    wanted = dict.fromkeys(targets + [name[len('classifier_'):] for name in saved])
+    missing = [target for target in wanted if f'classifier_{target}' not in classifiers]
+    if missing:
+        classifiers.update(trainer.train_trigger_classifiers(user_id, matrix, missing))
+    stage[0] += 1
+    
+    sequence_models = trainer.train_sequence_models(user_id, targets, matrix, warm_start_dir=model_dir)
+    stage[0] += 1
+    report("sequence models done")
+    
+    all_models = {**classifiers, **sequence_models}
+    trainer.save_models(user_id, all_models)
+    record_model_versions(user_id, all_models, "warm", rows, data_through, trainer.metrics)
+    stage[0] += 1
+    report("models saved")
+    return True
+
+def retrain_user_models(user_id: str, targets: List[str], force: bool = False,
+                        progress: Optional[Callable[[float, str], None]] = None) -> Dict[str, Any]:
+    """Keep a user's models fresh: skip, warm-start or fully retrain (see retrain_decision).
+    
+    force=True always retrains from scratch. Returns the decision taken;
+    runs in a worker process like train_user_models.
+    """
+    decision = retrain_decision(user_id)
+    if force:
+        decision = {**decision, 'action': 'full', 'reason': 'forced'}
+    
+    if decision['action'] == 'skip':
+        print(f"✅ Models for user {user_id} are fresh ({decision['reason']})")
+        return decision
+    
+    if decision['action'] == 'update':
+        try:
+            updated = update_user_models(user_id, targets, decision.get('data_through'), progress)
+        except Exception as e:
+            print(f"❌ Error updating models for user {user_id}: {e}")
+            raise
+        if updated:
+            print(f"✅ Models updated for user {user_id} ({decision['reason']})")
+            return decision
+        decision = {**decision, 'action': 'full', 'reason': 'feature columns changed'}
+    
+    train_user_models(user_id, targets, progress)
+    return decision
+
+def retrain_candidates(user_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """Retrain decisions for every (or the given) user with stored features."""
+    if user_ids is None:
+        with get_conn(readonly=True) as conn:
+            user_ids = [row[0] for row in conn.execute(
+                "SELECT DISTINCT user_id FROM fs_daily_user ORDER BY user_id")]
+    return [retrain_decision(user_id) for user_id in user_ids]
@@ -0,0 +1,402 @@
+"""
+Online Features
+===============
+Per-user running feature state updated at ingest time, so the current
+day's feature vector exists before the batch feature store catches up
+"""
+
+import math
+import threading
+import datetime as dt
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Mapping, Optional, Tuple
+
+import numpy as np
+from pydantic import BaseModel
+
+from unified_health_ai import INGEST_SPECS, ROLL_DAYS, get_conn
+from feature_store import (
+    FeatureStore, FeatureMatrix, FEATURE_DTYPE, FEATURE_LOOKBACK_DAYS, HRV_BASELINE_DAYS,
+    MAX_LAG, ROLLING_COLUMNS, LAG_COLUMNS, DERIVED_INPUTS, derived_features
+)
+
+# Configuration
+ONLINE_MAX_USERS = 10000               # user states kept in memory (LRU)
+ONLINE_RECONCILE_INTERVAL_S = 600
+ONLINE_RECONCILE_TOLERANCE = 1e-6      # relative, per feature
+
+# How each record adds to its day's base columns, mirroring the batch SQL
+# in FeatureStore.build_daily_features: (column, record field, aggregate).
+# Symptoms add MAX(severity) to a column named after their type.
+ONLINE_AGGREGATES: Dict[str, List[Tuple[str, Optional[str], str]]] = {
+    'meal': [('caffeine', 'caffeine_mg', 'sum'), ('meals_cnt', None, 'count'),
+             ('avg_calories', 'calories', 'avg'), ('total_protein', 'protein_g', 'sum'),
+             ('total_carbs', 'carbs_g', 'sum'), ('total_fat', 'fat_g', 'sum'),
+             ('total_fiber', 'fiber_g', 'sum'), ('total_sugar', 'sugar_g', 'sum')],
+    'sleep': [('sleep_min', 'total_min', 'sum'), ('sleep_score', 'sleep_score', 'avg'),
+              ('deep_min', 'deep_min', 'sum'), ('rem_min', 'rem_min', 'sum'),
+              ('avg_awakenings', 'awakenings', 'avg')],
+    'vital': [('hrv_ms', 'hrv_ms', 'avg'), ('steps', 'steps', 'sum'), ('hr_mean', 'hr_mean', 'avg'),
+              ('hr_max', 'hr_max', 'max'), ('spo2', 'spo2', 'avg'),
+              ('active_min', 'active_min', 'sum'), ('calories_burned', 'calories_burned', 'sum')],
+    # daily_logs has one row per day; the latest upsert replaces it
+    'daily_log': [('mood', 'mood', 'last'), ('stress', 'stress', 'last'),
+                  ('energy', 'energy', 'last'), ('focus', 'focus', 'last')],
+    'workout': [('workout_count', None, 'count'), ('total_workout_min', 'duration_min', 'sum'),
+                ('avg_intensity', 'intensity', 'avg'), ('workout_calories', 'calories_burned', 'sum')],
+}
+_COLUMN_AGGREGATE = {col: how for specs in ONLINE_AGGREGATES.values() for col, _, how in specs}
+
+class RollingWindow:
+    """Mean, std, min and max over the last `size` daily values in O(1).
+    
+    The size - 1 closed days sit in a ring buffer with Welford running
+    moments and monotonic deques for min/max; the still-open current day is
+    folded in when stats are read, since it changes with every record.
+    """
+    
+    def __init__(self, size: int):
+        self.capacity = size - 1
+        self._ring = [0.0] * self.capacity
+        self._start = 0
+        self.count = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._pushed = 0
+        self._min: Deque[Tuple[int, float]] = deque()  # increasing values
+        self._max: Deque[Tuple[int, float]] = deque()  # decreasing values
+    
+    def push(self, value: float) -> None:
+        """Close a day, evicting the oldest closed day once full."""
+        if self.capacity == 0:
+            return
+        if self.count == self.capacity:
+            old = self._ring[self._start]
+            self._start = (self._start + 1) % self.capacity
+            self.count -= 1
+            if self.count:
+                delta = old - self._mean
+                self._mean -= delta / self.count
+                self._m2 -= delta * (old - self._mean)
+            else:
+                self._mean = self._m2 = 0.0
+        
+        self._ring[(self._start + self.count) % self.capacity] = value
+        self.count += 1
+        delta = value - self._mean
+        self._mean += delta / self.count
+        self._m2 += delta * (value - self._mean)
+        
+        seq = self._pushed
+        self._pushed += 1
+        while self._min and self._min[-1][1] >= value:
+            self._min.pop()
+        self._min.append((seq, value))
+        while self._max and self._max[-1][1] <= value:
+            self._max.pop()
+        self._max.append((seq, value))
+        oldest = self._pushed - self.capacity
+        while self._min[0][0] < oldest:
+            self._min.popleft()
+        while self._max[0][0] < oldest:
+            self._max.popleft()
+    
+    def stats(self, current: float) -> Tuple[float, float, float, float]:
+        """(mean, std, min, max) of the closed days plus the current value."""
+        n = self.count + 1
+        delta = current - self._mean
+        mean = self._mean + delta / n
+        m2 = self._m2 + delta * (current - mean)
+        # Sample std, 0 for a single value as in the batch features
+        std = math.sqrt(max(m2, 0.0) / (n - 1)) if n > 1 else 0.0
+        low = min(current, self._min[0][1]) if self._min else current
+        high = max(current, self._max[0][1]) if self._max else current
+        return mean, std, low, high
+
+def _field(record: Any, name: str) -> Any:
+    return record.get(name) if isinstance(record, Mapping) else getattr(record, name, None)
+
+def _contributed_columns(data_type: str, record: Any) -> List[str]:
+    if data_type == 'symptom':
+        return [_field(record, 'type')]
+    return [col for col, _, _ in ONLINE_AGGREGATES.get(data_type, [])]
+
+class DayAccumulator:
+    """Base column aggregates of one day, updated record by record."""
+    
+    def __init__(self):
+        self._sums: Dict[str, float] = {}
+        self._counts: Dict[str, int] = {}
+        self._values: Dict[str, float] = {}  # max / last aggregates
+    
+    def add(self, data_type: str, record: Any) -> None:
+        """Fold one record (model or row mapping) into the day."""
+        if data_type == 'symptom':
+            col = _field(record, 'type')
+            self._values[col] = max(self._values.get(col, 0.0), float(_field(record, 'severity') or 0))
+            return
+        for col, field, how in ONLINE_AGGREGATES.get(data_type, []):
+            value = _field(record, field) if field else None
+            if how == 'count':
+                self._counts[col] = self._counts.get(col, 0) + 1
+            elif how == 'last':
+                self._values[col] = float(value or 0)
+            elif value is None:
+                continue  # SQL aggregates skip NULLs
+            elif how == 'max':
+                self._values[col] = max(self._values.get(col, value), value)
+            else:
+                self._sums[col] = self._sums.get(col, 0.0) + value
+                if how == 'avg':
+                    self._counts[col] = self._counts.get(col, 0) + 1
+    
+    def value(self, col: str) -> float:
+        """Column value; days without data are 0, as in the batch features."""
+        how = _COLUMN_AGGREGATE.get(col, 'max')
+        if how == 'count':
+            return float(self._counts.get(col, 0))
+        if how == 'avg':
+            count = self._counts.get(col, 0)
+            return self._sums[col] / count if count else 0.0
+        if how == 'sum':
+            return self._sums.get(col, 0.0)
+        return self._values.get(col, 0.0)
+
+class UserFeatureState:
+    """Running feature state of one user, open on `day`."""
+    
+    def __init__(self, columns: List[str], day: dt.date):
+        self.columns = columns
+        self.column_set = set(columns)
+        self.day = day
+        self.today = DayAccumulator()
+        self.windows = {col: RollingWindow(ROLL_DAYS) for col in ROLLING_COLUMNS if col in self.column_set}
+        self.hrv_baseline = RollingWindow(HRV_BASELINE_DAYS) if 'hrv_ms' in self.column_set else None
+        self.lags = {col: deque(maxlen=MAX_LAG) for col in LAG_COLUMNS if col in self.column_set}
+    
+    def close_day(self, values: Optional[Dict[str, float]] = None) -> None:
+        """Push the open day's (or the given) base values into the windows."""
+        if values is None:
+            values = {col: self.today.value(col) for col in self.columns}
+        for col, window in self.windows.items():
+            window.push(values[col])
+        if self.hrv_baseline is not None:
+            self.hrv_baseline.push(values['hrv_ms'])
+        for col, lag in self.lags.items():
+            lag.append(values[col])
+    
+    def advance(self, day: dt.date) -> None:
+        """Close the open day and any empty days up to `day`."""
+        self.close_day()
+        empty = {col: 0.0 for col in self.columns}
+        # Past the longest window, more empty days change nothing
+        gap = min((day - self.day).days - 1, max(ROLL_DAYS, HRV_BASELINE_DAYS, MAX_LAG))
+        for _ in range(gap):
+            self.close_day(empty)
+        self.day = day
+        self.today = DayAccumulator()
+    
+    def features(self) -> Tuple[List[str], np.ndarray]:
+        """The open day's feature vector, in batch column order."""
+        base = {col: self.today.value(col) for col in self.columns}
+        names = list(self.columns)
+        values = [base[col] for col in self.columns]
+        
+        for col in ROLLING_COLUMNS:
+            if col in self.windows:
+                names += [f'{col}_rmean_{ROLL_DAYS}', f'{col}_rstd_{ROLL_DAYS}',
+                          f'{col}_rmin_{ROLL_DAYS}', f'{col}_rmax_{ROLL_DAYS}']
+                values += self.windows[col].stats(base[col])
+        
+        for col in LAG_COLUMNS:
+            if col in self.lags:
+                history = self.lags[col]
+                for lag in range(1, MAX_LAG + 1):
+                    names.append(f'{col}_lag{lag}')
+                    values.append(history[-lag] if len(history) >= lag else math.nan)
+        
+        hrv_baseline = None
+        if self.hrv_baseline is not None:
+            hrv_baseline = np.array([self.hrv_baseline.stats(base['hrv_ms'])[0]])
+        inputs = {col: np.array([base[col]]) for col in DERIVED_INPUTS if col in base}
+        for name, array in derived_features(inputs, hrv_baseline):
+            names.append(name)
+            values.append(float(array[0]))
+        
+        return names, np.array(values, dtype=FEATURE_DTYPE)
+
+class OnlineFeatureEngine:
+    """Keeps each active user's current-day features up to date at ingest.
+    
+    Register `on_ingest` with unified_health_ai.add_ingest_listener. A
+    user's state is seeded from the database the first time it is needed
+    (a read, or a record for today); records for an earlier day or for a
+    new column drop it so the next use reseeds.
+    """
+    
+    def __init__(self, max_users: int = ONLINE_MAX_USERS):
+        self.max_users = max_users
+        self._store = FeatureStore()
+        self._states: "OrderedDict[str, UserFeatureState]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._stats = {
+            'updates': 0,
+            'seeds': 0,
+            'invalidations': 0,
+            'reconciled_users': 0,
+            'reconcile_mismatches': 0,
+        }
+    
+    def on_ingest(self, records: List[Tuple[str, BaseModel]]) -> None:
+        """Ingest listener: fold committed records into their users' state."""
+        by_user: Dict[str, List[Tuple[str, BaseModel, dt.date]]] = {}
+        for data_type, record in records:
+            feature_date = INGEST_SPECS[data_type].feature_date
+            if feature_date is not None:
+                by_user.setdefault(record.user_id, []).append((data_type, record, feature_date(record)))
+        
+        with self._lock:
+            for user_id, items in by_user.items():
+                self._apply(user_id, items)
+    
+    def _apply(self, user_id: str, items: List[Tuple[str, BaseModel, dt.date]]) -> None:
+        latest = max(day for _, _, day in items)
+        state = self._states.get(user_id)
+        if state is None:
+            if latest >= dt.date.today():
+                # The records are committed, so seeding already includes them
+                self._seed(user_id, latest)
+            return
+        
+        stale = any(
+            day < state.day or not state.column_set.issuperset(_contributed_columns(data_type, record))
+            for data_type, record, day in items
+        )
+        if stale:
+            del self._states[user_id]
+            self._stats['invalidations'] += 1
+            return
+        
+        for data_type, record, day in sorted(items, key=lambda item: item[2]):
+            if day > state.day:
+                state.advance(day)
+            state.today.add(data_type, record)
+        self._states.move_to_end(user_id)
+        self._stats['updates'] += len(items)
+    
+    def _seed(self, user_id: str, day: dt.date) -> UserFeatureState:
+        """Build a user's state open on `day` from the stored raw data."""
+        store = self._store
+        state = UserFeatureState(store.user_base_columns(user_id), day)
+        
+        bounds = store.user_date_bounds(user_id)
+        day_str = day.isoformat()
+        if bounds and state.columns:
+            start = max(bounds[0], (day - dt.timedelta(days=FEATURE_LOOKBACK_DAYS)).isoformat())
+            end = (day - dt.timedelta(days=1)).isoformat()
+            if start <= end:
+                closed = store.build_daily_features(user_id, start, end, state.columns)
+                for row in closed[state.columns].to_dict('records'):
+                    state.close_day(row)
+        
+        with get_conn(readonly=True) as conn:
+            for data_type, spec in INGEST_SPECS.items():
+                if spec.date_sql is None:
+                    continue
+                rows = conn.execute(
+                    f"SELECT * FROM {spec.table} WHERE user_id=? AND {spec.date_sql}=? ORDER BY rowid",
+                    (user_id, day_str)
+                ).fetchall()
+                for row in rows:
+                    state.today.add(data_type, dict(row))
+        
+        self._states[user_id] = state
+        self._states.move_to_end(user_id)
+        while len(self._states) > self.max_users:
+            self._states.popitem(last=False)
+        self._stats['seeds'] += 1
+        return state
+    
+    def current_matrix(self, user_id: str, date: str) -> Optional[FeatureMatrix]:
+        """One-row feature matrix for `date` if it is the user's current day.
+        
+        Returns None for days before the user's open day, which the batch
+        feature store serves, and for days after today.
+        """
+        day = dt.date.fromisoformat(date)
+        if day > dt.date.today():
+            return None
+        with self._lock:
+            state = self._states.get(user_id)
+            if state is None:
+                if day < dt.date.today():
+                    return None
+                state = self._seed(user_id, day)
+            elif day < state.day:
+                return None
+            elif day > state.day:
+                state.advance(day)
+            self._states.move_to_end(user_id)
+            names, vector = state.features()
+        
+        return FeatureMatrix([date], vector[None, :], names,
+                             np.empty((1, 0), dtype=FEATURE_DTYPE), [])
+    
+    def reconcile(self, tolerance: float = ONLINE_RECONCILE_TOLERANCE,
+                  max_samples: int = 20) -> Dict[str, Any]:
+        """Compare every user's online vector with a batch build of the same day.
+        
+        Mismatching users are dropped and reseed on next use.
+        """
+        with self._lock:
+            snapshot = [(uid, state.day, state.columns) + state.features()
+                        for uid, state in self._states.items()]
+        
+        report = {'users_checked': 0, 'users_mismatched': 0, 'max_abs_diff': 0.0, 'mismatches': []}
+        for user_id, day, columns, names, online in snapshot:
+            bounds = self._store.user_date_bounds(user_id)
+            day_str = day.isoformat()
+            start = (day - dt.timedelta(days=FEATURE_LOOKBACK_DAYS)).isoformat()
+            if bounds:
+                start = max(start, min(bounds[0], day_str))
+            batch = self._store.build_daily_features(user_id, start, day_str, columns)
+            expected = batch.iloc[-1]
+            
+            bad = []
+            for name, value in zip(names, online.tolist()):
+                reference = float(expected[name]) if name in expected.index else math.nan
+                if math.isnan(value) and math.isnan(reference):
+                    continue
+                diff = abs(value - reference)
+                if not math.isnan(diff):
+                    report['max_abs_diff'] = max(report['max_abs_diff'], diff)
+                if not diff <= tolerance * max(1.0, abs(reference)):
+                    bad.append(name)
+            
+            report['users_checked'] += 1
+            if bad:
+                report['users_mismatched'] += 1
+                if len(report['mismatches']) < max_samples:
+                    report['mismatches'].append({'user_id': user_id, 'date': day_str, 'features': bad})
+                with self._lock:
+                    self._states.pop(user_id, None)
+        
+        self._stats['reconciled_users'] += report['users_checked']
+        self._stats['reconcile_mismatches'] += report['users_mismatched']
+        return report
+    
+    def stats(self) -> Dict[str, Any]:
+        """State size and update/seed/reconcile counters."""
+        stats = dict(self._stats)
+        stats['users'] = len(self._states)
+        stats['max_users'] = self.max_users
+        return stats
+
+_engine: Optional[OnlineFeatureEngine] = None
+
+def get_online_engine() -> OnlineFeatureEngine:
+    """Get the process-wide online feature engine."""
+    global _engine
+    if _engine is None:
+        _engine = OnlineFeatureEngine()
+    return _engine
@@ -0,0 +1,18 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import unified_health_ai
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A fresh database (and models directory) under a temporary directory."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(unified_health_ai, "DB_PATH", tmp_path / "unified_health.db")
+    unified_health_ai.close_pool()
+    unified_health_ai.init_db()
+    yield tmp_path
+    unified_health_ai.close_pool()
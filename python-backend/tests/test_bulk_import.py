@@ -0,0 +1,66 @@
+import io
+import json
+
+from fastapi.testclient import TestClient
+
+from bulk_import import import_file, import_stream
+from unified_health_ai import get_conn
+import api_server
+
+def _vitals(days, steps=100):
+    return "".join(json.dumps({"date": f"2025-01-{day:02d}", "steps": steps}) + "\n"
+                   for day in range(1, days + 1))
+
+def test_new_contents_under_same_filename_are_imported_in_full(db):
+    path = db / "vitals.ndjson"
+    path.write_text(_vitals(5))
+    assert import_file(str(path), data_type="vital", user_id="u1")['imported'] == 5
+    
+    path.write_text(_vitals(7, steps=200))
+    result = import_file(str(path), data_type="vital", user_id="u1")
+    
+    assert result['resumed_at'] == 0
+    assert result['imported'] == 7
+
+def test_upload_with_same_filename_is_not_skipped(db):
+    client = TestClient(api_server.app)
+    form = {"data_type": "vital", "user_id": "u1"}
+    first = client.post("/data/import", data=form,
+                        files={"file": ("vitals.ndjson", _vitals(5).encode())})
+    second = client.post("/data/import", data=form,
+                         files={"file": ("vitals.ndjson", _vitals(7, steps=200).encode())})
+    
+    assert first.status_code == second.status_code == 200
+    assert first.json()['import_id'] != second.json()['import_id']
+    assert second.json()['imported'] == 7
+
+def test_explicit_import_id_resumes_unfinished_checkpoint(db):
+    import_stream(io.StringIO(_vitals(3)), "ndjson", "backfill", data_type="vital", user_id="u1",
+                  chunk_rows=1)
+    # Mark the checkpoint unfinished, as if the import had been interrupted
+    with get_conn() as conn:
+        conn.execute("UPDATE import_checkpoints SET completed=0 WHERE import_id='backfill'")
+    
+    result = import_stream(io.StringIO(_vitals(5)), "ndjson", "backfill", data_type="vital",
+                           user_id="u1")
+    
+    assert result['resumed_at'] == 3
+    assert result['imported'] == 2
+
+def test_completed_checkpoint_starts_a_new_import(db):
+    import_stream(io.StringIO(_vitals(3)), "ndjson", "backfill", data_type="vital", user_id="u1")
+    
+    result = import_stream(io.StringIO(_vitals(5)), "ndjson", "backfill", data_type="vital",
+                           user_id="u1")
+    
+    assert result['resumed_at'] == 0
+    assert result['imported'] == 5
+
+def test_rows_that_are_not_objects_fail_alone(db):
+    lines = '42\n"x"\n[1, 2]\n' + json.dumps({"data_type": "vital", "user_id": "u1", "date": "2025-01-01"}) + "\n"
+    
+    result = import_stream(io.StringIO(lines), "ndjson", "mixed")
+    
+    assert result['imported'] == 1
+    assert result['failed'] == 3
+    assert [error['error'] for error in result['errors']] == ["Row is not an object"] * 3
@@ -0,0 +1,88 @@
+import datetime as dt
+
+import joblib
+import numpy as np
+
+import feature_store
+from feature_store import FeatureMatrix
+from ml_models import (HealthModelTrainer, HealthPredictionEngine, ModelCache, RETRAIN_WARM_TREES,
+                       make_classifier, update_user_models)
+
+def _matrix(days=240):
+    """Rows whose next-day low mood is driven by one feature."""
+    rng = np.random.default_rng(0)
+    names = ['sleep_min', 'steps', 'caffeine', 'hrv_ms']
+    X = rng.normal(size=(days, len(names))).astype(np.float32)
+    y_mood = (X[:, 0] + 0.3 * rng.normal(size=days) < -0.5).astype(np.float32)
+    dates = [str(dt.date(2025, 1, 1) + dt.timedelta(days=i)) for i in range(days)]
+    return FeatureMatrix(dates, X, names, y_mood[:, None], ['y_mood_next'])
+
+def test_hist_classifiers_are_explained_by_held_out_importances(db):
+    matrix = _matrix()
+    trainer = HealthModelTrainer(backend="hist", n_jobs=1)
+    models = trainer.train_trigger_classifiers("u1", matrix)
+    trainer.save_models("u1", models)
+    
+    assert list(trainer.importances) == ['classifier_mood']
+    explanations = HealthPredictionEngine(ModelCache()).get_explanations("u1", matrix.dates[-1], matrix)
+    assert list(explanations) == ['mood']
+    assert next(iter(explanations['mood'])) == 'sleep_min'
+
+def _two_target_matrix():
+    matrix = _matrix()
+    y_stress = (matrix.X[:, 1] > 0.8).astype(np.float32)
+    return matrix._replace(Y=np.column_stack([matrix.Y[:, 0], y_stress]),
+                           label_names=['y_mood_next', 'y_stress_next'])
+
+def _rows(matrix, stop):
+    return matrix._replace(dates=matrix.dates[:stop], X=matrix.X[:stop], Y=matrix.Y[:stop])
+
+def test_warm_update_fits_targets_without_a_saved_classifier(db, monkeypatch):
+    matrix = _two_target_matrix()
+    trainer = HealthModelTrainer(backend="hist", n_jobs=1)
+    trainer.save_models("u1", trainer.train_trigger_classifiers("u1", matrix, ['mood']))
+    monkeypatch.setattr(feature_store.FeatureStore, "read_feature_matrix",
+                        lambda self, user_id, *args, **kwargs: matrix)
+    
+    assert update_user_models("u1", ['mood', 'stress'], since=matrix.dates[-30])
+    
+    assert (db / "models" / "u1" / "classifier_stress.pkl").exists()
+    explanations = HealthPredictionEngine(ModelCache()).get_explanations("u1", matrix.dates[-1], matrix)
+    assert set(explanations) == {'mood', 'stress'}
+    assert next(iter(explanations['stress'])) == 'steps'
+
+def test_warm_update_keeps_existing_gbm_trees(db):
+    matrix = _two_target_matrix()
+    # New rows come from a shifted distribution
+    matrix = matrix._replace(X=np.vstack([matrix.X[:200], matrix.X[200:] + 2]))
+    old = _rows(matrix, 200)
+    trainer = HealthModelTrainer(backend="gbm", n_jobs=1)
+    pipeline = trainer.train_trigger_classifiers("u1", old, ['mood'])['classifier_mood']
+    Xs = pipeline.named_steps['scaler'].transform(np.nan_to_num(old.X))
+    classifier = pipeline.named_steps['classifier']
+    trees = classifier.n_estimators
+    before = classifier.decision_function(Xs)
+    
+    updated = trainer.update_classifiers({'classifier_mood': pipeline}, matrix, old.dates[-1])
+    
+    classifier = updated['classifier_mood'].named_steps['classifier']
+    assert classifier.n_estimators == trees + RETRAIN_WARM_TREES
+    stages = list(classifier.staged_decision_function(Xs))
+    np.testing.assert_allclose(stages[trees - 1].ravel(), before)
+
+def test_warm_update_refits_hist_classifiers_and_their_importances(db, monkeypatch):
+    matrix = _two_target_matrix()
+    matrix = matrix._replace(X=np.vstack([matrix.X[:200], matrix.X[200:] + 2]))
+    trainer = HealthModelTrainer(backend="hist", n_jobs=1)
+    trainer.save_models("u1", trainer.train_trigger_classifiers("u1", _rows(matrix, 200), ['mood']))
+    saved_importances = trainer.load_importances("u1")
+    monkeypatch.setattr(feature_store.FeatureStore, "read_feature_matrix",
+                        lambda self, user_id, *args, **kwargs: matrix)
+    
+    assert update_user_models("u1", ['mood'], since=matrix.dates[199])
+    
+    classifier = joblib.load(db / "models" / "u1" / "classifier_mood.pkl").named_steps['classifier']
+    assert classifier.n_iter_ == classifier.max_iter == make_classifier("hist").max_iter
+    importances = trainer.load_importances("u1")
+    assert set(importances) == {'classifier_mood'}
+    assert importances != saved_importances
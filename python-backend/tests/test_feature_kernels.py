@@ -0,0 +1,78 @@
+import datetime as dt
+
+import numpy as np
+import pytest
+
+from feature_store import FEATURES, FeatureStore, FeatureCache
+from unified_health_ai import (DailyLogIn, MealIn, SleepSessionIn, SymptomIn, VitalIn, WorkoutIn,
+                               insert_records)
+
+START = dt.date(2025, 1, 1)
+DAYS = 60
+
+@pytest.fixture
+def history(db):
+    """Two months of mixed data for one user, with gaps in every source."""
+    rng = np.random.default_rng(7)
+    records = []
+    for i in range(DAYS):
+        day = START + dt.timedelta(days=i)
+        noon = dt.datetime.combine(day, dt.time(12))
+        if i % 7 != 3:
+            records.append(("daily_log", DailyLogIn(
+                user_id="u1", date=day, mood=int(rng.integers(1, 11)),
+                stress=int(rng.integers(1, 11)), energy=int(rng.integers(1, 11)),
+                focus=int(rng.integers(1, 11)))))
+        if i % 5 != 0:
+            records.append(("meal", MealIn(
+                user_id="u1", ts=noon, items="lunch", calories=int(rng.integers(300, 900)),
+                caffeine_mg=int(rng.integers(0, 300)), protein_g=float(rng.uniform(10, 50)),
+                fiber_g=float(rng.uniform(0, 15)))))
+        if i % 6 != 1:
+            end = dt.datetime.combine(day, dt.time(7))
+            records.append(("sleep", SleepSessionIn(
+                user_id="u1", start_time=end - dt.timedelta(hours=7), end_time=end,
+                total_min=int(rng.integers(300, 540)), deep_min=int(rng.integers(30, 120)),
+                rem_min=int(rng.integers(40, 130)), awakenings=int(rng.integers(0, 6)),
+                sleep_score=float(rng.uniform(3, 10)))))
+        if i % 4 != 2:
+            records.append(("vital", VitalIn(
+                user_id="u1", date=day, hrv_ms=float(rng.uniform(20, 90)),
+                hr_mean=float(rng.uniform(55, 80)), steps=int(rng.integers(1000, 15000)))))
+        if i % 3 == 0:
+            records.append(("workout", WorkoutIn(
+                user_id="u1", ts=noon, type="run", duration_min=int(rng.integers(20, 60)),
+                intensity=int(rng.integers(1, 6)))))
+        if rng.random() < 0.3:
+            records.append(("symptom", SymptomIn(
+                user_id="u1", date=day, type=str(rng.choice(["bloating", "acne"])),
+                severity=int(rng.integers(0, 11)))))
+    insert_records(records)
+    return FeatureStore(cache=FeatureCache())
+
+def test_numpy_kernel_matches_pandas_reference(history):
+    start, end = str(START), str(START + dt.timedelta(days=DAYS - 1))
+    base_columns = history.user_base_columns("u1")
+    
+    expected = history.build_daily_features("u1", start, end, base_columns, kernel="pandas")
+    actual = history.build_daily_features("u1", start, end, base_columns, kernel="numpy")
+    
+    assert set(actual.columns) == set(expected.columns)
+    assert list(actual['date']) == list(expected['date'])
+    cols = [col for col in expected.columns if col != 'date']
+    expected_values = expected[cols].to_numpy(dtype=np.float64)
+    actual_values = actual[cols].to_numpy(dtype=np.float64)
+    assert np.isnan(expected_values).any()
+    np.testing.assert_array_equal(np.isnan(actual_values), np.isnan(expected_values))
+    np.testing.assert_allclose(actual_values, expected_values, rtol=1e-5, atol=1e-6, equal_nan=True)
+
+def test_targeted_build_reads_only_requested_rolling_columns(history):
+    start, end = str(START), str(START + dt.timedelta(days=DAYS - 1))
+    base_columns = history.user_base_columns("u1")
+    wanted = ['mood_rmean_7', 'steps_rmax_7', 'hrv_recovery']
+    
+    assert FEATURES.sources(wanted) == {'mood', 'steps', 'hrv_ms'}
+    full = history.build_daily_features("u1", start, end, base_columns)
+    targeted = history.build_daily_features("u1", start, end, base_columns, features=wanted)
+    np.testing.assert_allclose(targeted[wanted].to_numpy(dtype=np.float64),
+                               full[wanted].to_numpy(dtype=np.float64), equal_nan=True)
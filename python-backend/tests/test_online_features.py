@@ -0,0 +1,126 @@
+import datetime as dt
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import api_server
+import online_features
+from feature_store import FeatureStore, FeatureCache
+from ml_models import HealthModelTrainer
+from online_features import OnlineFeatureEngine, RollingWindow
+from unified_health_ai import (DailyLogIn, MealIn, SleepSessionIn, SymptomIn, VitalIn, WorkoutIn,
+                               add_ingest_listener, insert_records, remove_ingest_listener)
+
+TODAY = dt.date.today()
+
+def _day_records(day, rng, meals=1):
+    """One day of mixed records for u1."""
+    noon = dt.datetime.combine(day, dt.time(12))
+    end = dt.datetime.combine(day, dt.time(7))
+    records = [
+        ("daily_log", DailyLogIn(user_id="u1", date=day, mood=int(rng.integers(1, 11)),
+                                 stress=int(rng.integers(1, 11)), energy=int(rng.integers(1, 11)),
+                                 focus=int(rng.integers(1, 11)))),
+        ("sleep", SleepSessionIn(user_id="u1", start_time=end - dt.timedelta(hours=7), end_time=end,
+                                 total_min=int(rng.integers(300, 540)), awakenings=int(rng.integers(0, 6)),
+                                 sleep_score=float(rng.uniform(3, 10)))),
+        ("vital", VitalIn(user_id="u1", date=day, hrv_ms=float(rng.uniform(20, 90)),
+                          steps=int(rng.integers(1000, 15000)))),
+        ("workout", WorkoutIn(user_id="u1", ts=noon, type="run", duration_min=int(rng.integers(20, 60)),
+                              intensity=int(rng.integers(1, 6)))),
+        ("symptom", SymptomIn(user_id="u1", date=day, type="gut", severity=int(rng.integers(0, 11)))),
+    ]
+    records += [("meal", MealIn(user_id="u1", ts=noon + dt.timedelta(hours=i), items="meal",
+                                calories=int(rng.integers(300, 900)), caffeine_mg=int(rng.integers(0, 200))))
+                for i in range(meals)]
+    return records
+
+def _history(first, last, rng, skip=()):
+    records = []
+    day = first
+    while day <= last:
+        if day not in skip:
+            records += _day_records(day, rng)
+        day += dt.timedelta(days=1)
+    insert_records(records)
+
+@pytest.fixture
+def engine(db):
+    engine = OnlineFeatureEngine()
+    add_ingest_listener(engine.on_ingest)
+    yield engine
+    remove_ingest_listener(engine.on_ingest)
+
+def _batch_row(user_id, day, columns):
+    store = FeatureStore(cache=FeatureCache())
+    first = (day - dt.timedelta(days=40)).isoformat()
+    return store.build_daily_features(user_id, first, day.isoformat(), columns).iloc[-1]
+
+def _assert_matches_batch(engine, user_id):
+    matrix = engine.current_matrix(user_id, TODAY.isoformat())
+    expected = _batch_row(user_id, TODAY, engine._store.user_base_columns(user_id))
+    assert matrix.feature_names == [col for col in expected.index if col != 'date'
+                                    and not col.startswith('y_')]
+    np.testing.assert_allclose(matrix.X[0], expected[matrix.feature_names].to_numpy(dtype=np.float64),
+                               rtol=1e-5, atol=1e-5, equal_nan=True)
+    report = engine.reconcile()
+    assert report['users_checked'] == 1
+    assert report['users_mismatched'] == 0, report['mismatches']
+
+def test_rolling_window_matches_recomputed_stats():
+    rng = np.random.default_rng(3)
+    # Repeated values exercise the min/max deques' tie handling
+    values = rng.integers(0, 5, size=40).astype(float)
+    window = RollingWindow(7)
+    for i, current in enumerate(values):
+        expected = values[max(0, i - 6):i + 1]
+        mean, std, low, high = window.stats(current)
+        assert mean == pytest.approx(expected.mean())
+        assert std == pytest.approx(expected.std(ddof=1) if len(expected) > 1 else 0.0)
+        assert (low, high) == (expected.min(), expected.max())
+        window.push(current)
+
+def test_same_day_ingest_matches_batch_build(engine):
+    rng = np.random.default_rng(11)
+    _history(TODAY - dt.timedelta(days=30), TODAY - dt.timedelta(days=1), rng,
+             skip={TODAY - dt.timedelta(days=9), TODAY - dt.timedelta(days=4)})
+    
+    # The first record of the day seeds the state; later ones update it
+    insert_records(_day_records(TODAY, rng)[:2])
+    insert_records(_day_records(TODAY, rng, meals=3)[2:])
+    
+    assert engine.stats()['seeds'] == 1
+    assert engine.stats()['updates'] > 0
+    _assert_matches_batch(engine, "u1")
+
+def test_state_advanced_across_empty_days_matches_batch_build(engine):
+    rng = np.random.default_rng(5)
+    _history(TODAY - dt.timedelta(days=30), TODAY - dt.timedelta(days=5), rng)
+    engine._seed("u1", TODAY - dt.timedelta(days=3))
+    
+    insert_records(_day_records(TODAY, rng, meals=2))
+    
+    assert engine.stats()['seeds'] == 1
+    _assert_matches_batch(engine, "u1")
+
+def test_predict_daily_serves_today_from_online_features(db, monkeypatch):
+    rng = np.random.default_rng(2)
+    _history(TODAY - dt.timedelta(days=60), TODAY - dt.timedelta(days=1), rng)
+    store = FeatureStore(cache=FeatureCache())
+    store.rebuild_features("u1", (TODAY - dt.timedelta(days=60)).isoformat(),
+                           (TODAY - dt.timedelta(days=1)).isoformat())
+    trainer = HealthModelTrainer(backend="hist", n_jobs=1)
+    trainer.save_models("u1", trainer.train_trigger_classifiers("u1"))
+    insert_records(_day_records(TODAY, rng))
+    monkeypatch.setattr(online_features, "_engine", OnlineFeatureEngine())
+    
+    response = TestClient(api_server.app).post("/predict/daily",
+                                               json={"user_id": "u1", "date": TODAY.isoformat()})
+    
+    assert response.status_code == 200
+    predictions = response.json()['predictions']
+    assert predictions
+    assert online_features.get_online_engine().stats()['seeds'] == 1
+    batch = api_server.prediction_engine.predict_daily_risk("u1", TODAY.isoformat())
+    assert predictions == pytest.approx(batch, abs=1e-5)
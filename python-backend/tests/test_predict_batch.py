@@ -0,0 +1,44 @@
+import datetime as dt
+
+import numpy as np
+import pytest
+
+from feature_store import FeatureStore, FeatureCache, date_runs
+from ml_models import HealthModelTrainer, HealthPredictionEngine, ModelCache, predict_batch
+from unified_health_ai import DailyLogIn, VitalIn, get_conn, insert_records
+
+START = dt.date(2025, 1, 1)
+DAYS = [str(START + dt.timedelta(days=i)) for i in range(60)]
+
+def test_date_runs_groups_consecutive_dates():
+    assert date_runs(["2025-01-05", "2025-01-01", "2025-01-02", "2025-01-31"]) == [
+        ("2025-01-01", "2025-01-02"), ("2025-01-05", "2025-01-05"), ("2025-01-31", "2025-01-31")]
+
+def test_missing_dates_are_built_without_rebuilding_stored_ones(db, monkeypatch):
+    rng = np.random.default_rng(4)
+    insert_records([record for day in DAYS for record in (
+        ("daily_log", DailyLogIn(user_id="u1", date=day, mood=int(rng.integers(1, 11)),
+                                 stress=int(rng.integers(1, 11)))),
+        ("vital", VitalIn(user_id="u1", date=day, steps=int(rng.integers(1000, 15000)))),
+    )])
+    FeatureStore(cache=FeatureCache()).rebuild_features("u1", DAYS[0], DAYS[-1])
+    trainer = HealthModelTrainer(backend="hist", n_jobs=1)
+    trainer.save_models("u1", trainer.train_trigger_classifiers("u1"))
+    engine = HealthPredictionEngine(ModelCache())
+    pairs = [("u1", day) for day in DAYS[30:]]
+    stored = predict_batch(pairs, engine=engine)
+    assert all(result['predictions'] for result in stored)
+    
+    # One old gap and the latest day lose their stored rows
+    with get_conn() as conn:
+        conn.executemany("DELETE FROM fs_daily_user WHERE user_id='u1' AND date=?",
+                         [(DAYS[34],), (DAYS[35],), (DAYS[-1],)])
+    builds = []
+    build = FeatureStore.build_feature_matrix
+    monkeypatch.setattr(FeatureStore, "build_feature_matrix", lambda self, user_id, start, end, *args:
+                        builds.append((start, end)) or build(self, user_id, start, end, *args))
+    rebuilt = predict_batch(pairs, engine=engine)
+    
+    assert builds == [(DAYS[34], DAYS[35]), (DAYS[-1], DAYS[-1])]
+    for before, after in zip(stored, rebuilt):
+        assert after['predictions'] == pytest.approx(before['predictions'], abs=1e-6)
@@ -0,0 +1,268 @@
+"""
+Training Jobs
+=============
+Persistent queue of model training jobs, run on the training process pool
+with progress, cancellation and one active job per model set
+"""
+
+import json
+import asyncio
+import sqlite3
+from typing import Any, Dict, List, Optional
+
+from unified_health_ai import get_conn
+from executors import TRAINING_WORKERS, run_blocking, run_training
+
+# Configuration
+TRAINING_POLL_INTERVAL_S = 5.0         # how often the scheduler looks for new jobs
+TRAINING_JOB_KINDS = ("user", "global", "retrain")
+ACTIVE_JOB_STATUSES = ("queued", "running")
+
+class JobCancelled(Exception):
+    """Raised from a progress report once cancellation of the job was requested."""
+
+def _job_dict(row: sqlite3.Row) -> Dict[str, Any]:
+    job = dict(row)
+    job['params'] = json.loads(job.pop('params_json') or '{}')
+    job['cancel_requested'] = bool(job['cancel_requested'])
+    return job
+
+def submit_training_job(user_id: str, kind: str = "user",
+                        params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Queue a training job for a model set.
+    
+    A model set has at most one queued or running job; submitting while one
+    exists returns that job with deduplicated=True instead of a new one.
+    """
+    if kind not in TRAINING_JOB_KINDS:
+        raise ValueError(f"Unknown training job kind: {kind}")
+    
+    with get_conn() as conn:
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO training_jobs (user_id, kind, params_json) VALUES (?, ?, ?)",
+            (user_id, kind, json.dumps(params or {}))
+        )
+        deduplicated = cursor.rowcount == 0
+        if deduplicated:
+            row = conn.execute(
+                "SELECT * FROM training_jobs WHERE user_id=? AND status IN ('queued', 'running')",
+                (user_id,)
+            ).fetchone()
+        else:
+            row = conn.execute("SELECT * FROM training_jobs WHERE job_id=?",
+                               (cursor.lastrowid,)).fetchone()
+    
+    job = _job_dict(row)
+    job['deduplicated'] = deduplicated
+    return job
+
+def get_job(job_id: int) -> Optional[Dict[str, Any]]:
+    """A job by id, or None."""
+    with get_conn(readonly=True) as conn:
+        row = conn.execute("SELECT * FROM training_jobs WHERE job_id=?", (job_id,)).fetchone()
+    return _job_dict(row) if row else None
+
+def latest_job(user_id: str) -> Optional[Dict[str, Any]]:
+    """The most recently submitted job for a model set, or None."""
+    with get_conn(readonly=True) as conn:
+        row = conn.execute(
+            "SELECT * FROM training_jobs WHERE user_id=? ORDER BY job_id DESC LIMIT 1", (user_id,)
+        ).fetchone()
+    return _job_dict(row) if row else None
+
+def list_jobs(status: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+    """Most recent jobs first, optionally only those with the given status."""
+    query = "SELECT * FROM training_jobs"
+    params: List[Any] = []
+    if status:
+        query += " WHERE status=?"
+        params.append(status)
+    query += " ORDER BY job_id DESC LIMIT ?"
+    params.append(limit)
+    with get_conn(readonly=True) as conn:
+        return [_job_dict(row) for row in conn.execute(query, params).fetchall()]
+
+def cancel_job(job_id: int) -> Optional[Dict[str, Any]]:
+    """Cancel a job: queued jobs stop at once, running ones at their next progress report."""
+    with get_conn() as conn:
+        conn.execute(
+            """UPDATE training_jobs SET status='cancelled', finished_at=CURRENT_TIMESTAMP,
+                      message='cancelled before start'
+               WHERE job_id=? AND status='queued'""",
+            (job_id,)
+        )
+        conn.execute(
+            "UPDATE training_jobs SET cancel_requested=1 WHERE job_id=? AND status='running'",
+            (job_id,)
+        )
+        row = conn.execute("SELECT * FROM training_jobs WHERE job_id=?", (job_id,)).fetchone()
+    return _job_dict(row) if row else None
+
+def recover_jobs() -> int:
+    """Requeue jobs left running by a stopped server; returns how many."""
+    with get_conn() as conn:
+        cursor = conn.execute(
+            """UPDATE training_jobs
+               SET status=CASE WHEN cancel_requested THEN 'cancelled' ELSE 'queued' END,
+                   progress=0, started_at=NULL,
+                   finished_at=CASE WHEN cancel_requested THEN CURRENT_TIMESTAMP END
+               WHERE status='running'"""
+        )
+        return cursor.rowcount
+
+def claim_next_job() -> Optional[int]:
+    """Mark the oldest queued job running and return its id, or None if there is none."""
+    with get_conn() as conn:
+        while True:
+            row = conn.execute(
+                "SELECT job_id FROM training_jobs WHERE status='queued' ORDER BY job_id LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            # Guarded so a job cancelled in the meantime is not started
+            cursor = conn.execute(
+                """UPDATE training_jobs SET status='running', started_at=CURRENT_TIMESTAMP,
+                          message='started'
+                   WHERE job_id=? AND status='queued'""",
+                (row[0],)
+            )
+            if cursor.rowcount:
+                return row[0]
+
+def finish_job(job_id: int, status: str, message: Optional[str] = None,
+               error: Optional[str] = None) -> None:
+    """Record a running job's final status."""
+    with get_conn() as conn:
+        conn.execute(
+            """UPDATE training_jobs
+               SET status=?, message=COALESCE(?, message), error=?, finished_at=CURRENT_TIMESTAMP,
+                   progress=CASE WHEN ?='succeeded' THEN 1 ELSE progress END
+               WHERE job_id=? AND status='running'""",
+            (status, message, error, status, job_id)
+        )
+
+def report_progress(job_id: int, fraction: float, message: str) -> None:
+    """Store a running job's progress; raises JobCancelled if cancellation was requested."""
+    with get_conn() as conn:
+        conn.execute(
+            "UPDATE training_jobs SET progress=?, message=? WHERE job_id=?",
+            (max(0.0, min(fraction, 1.0)), message, job_id)
+        )
+        row = conn.execute(
+            "SELECT cancel_requested FROM training_jobs WHERE job_id=?", (job_id,)
+        ).fetchone()
+    if row and row[0]:
+        raise JobCancelled(f"Training job {job_id} cancelled")
+
+def run_training_job(job_id: int) -> str:
+    """Run a claimed job to completion and record the outcome; returns the final status.
+    
+    Module-level so the scheduler can run it in a training worker process.
+    """
+    from ml_models import train_user_models, train_global_models, retrain_user_models
+    
+    job = get_job(job_id)
+    if job is None or job['status'] != 'running':
+        return job['status'] if job else 'missing'
+    params = job['params']
+    
+    def progress(fraction: float, message: str) -> None:
+        report_progress(job_id, fraction, message)
+    
+    try:
+        if job['kind'] == 'global':
+            train_global_models(params.get('user_ids'), params.get('dataset_path'), progress)
+        elif job['kind'] == 'retrain':
+            decision = retrain_user_models(job['user_id'], params.get('targets', ['gut', 'skin', 'mood', 'stress']),
+                                           params.get('force', False), progress)
+            finish_job(job_id, 'succeeded', message=f"{decision['action']}: {decision['reason']}")
+            return 'succeeded'
+        else:
+            train_user_models(job['user_id'], params.get('targets', ['gut', 'skin', 'mood', 'stress']),
+                              progress)
+    except JobCancelled:
+        finish_job(job_id, 'cancelled', message='cancelled while running')
+        return 'cancelled'
+    except Exception as e:
+        finish_job(job_id, 'failed', error=str(e))
+        return 'failed'
+    
+    finish_job(job_id, 'succeeded', message='done')
+    return 'succeeded'
+
+class TrainingScheduler:
+    """Start queued training jobs on the training pool, at most `workers` at a time.
+    
+    Jobs are claimed from the training_jobs table, so queued work survives a
+    restart; call wake() after submitting to start it without waiting for
+    the next poll.
+    """
+    
+    def __init__(self, workers: int = TRAINING_WORKERS,
+                 poll_interval: float = TRAINING_POLL_INTERVAL_S):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._running: Dict[int, asyncio.Task] = {}
+        self._wake: Optional[asyncio.Event] = None
+        self._stats = {
+            'started': 0,
+            'succeeded': 0,
+            'failed': 0,
+            'cancelled': 0,
+            'recovered': 0,
+        }
+    
+    def wake(self) -> None:
+        """Look for queued jobs now."""
+        if self._wake is not None:
+            self._wake.set()
+    
+    async def run(self) -> None:
+        """Scheduling loop; runs until cancelled."""
+        self._wake = asyncio.Event()
+        self._stats['recovered'] += await run_blocking(recover_jobs)
+        try:
+            while True:
+                self._wake.clear()
+                try:
+                    while len(self._running) < self.workers:
+                        job_id = await run_blocking(claim_next_job)
+                        if job_id is None:
+                            break
+                        self._stats['started'] += 1
+                        self._running[job_id] = asyncio.create_task(self._run_job(job_id))
+                except Exception as e:
+                    print(f"⚠ Training scheduler failed to claim a job: {e}")
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            # Jobs still running are requeued by recover_jobs on the next start
+            for task in self._running.values():
+                task.cancel()
+    
+    async def _run_job(self, job_id: int) -> None:
+        try:
+            status = await run_training(run_training_job, job_id)
+        except Exception as e:
+            # The worker itself died; the job cannot have recorded its outcome
+            status = 'failed'
+            await run_blocking(finish_job, job_id, 'failed', None, f"worker error: {e}")
+        finally:
+            self._running.pop(job_id, None)
+            self.wake()
+        if status in self._stats:
+            self._stats[status] += 1
+    
+    def stats(self) -> Dict[str, Any]:
+        return {**self._stats, 'workers': self.workers, 'running': len(self._running)}
+
+_scheduler: Optional[TrainingScheduler] = None
+
+def get_training_scheduler() -> TrainingScheduler:
+    """Get the process-wide training scheduler."""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = TrainingScheduler()
+    return _scheduler
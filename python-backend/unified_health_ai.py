@@ -9,8 +9,12 @@ import math
 import time
 import datetime as dt
 from pathlib import Path
-from typing import List, Optional, Dict, Any, Union
+from typing import List, Optional, Dict, Any, Union, Tuple, NamedTuple, Type, Callable, Iterator
 import hashlib
+import threading
+import queue
+from concurrent.futures import Future
+from contextlib import contextmanager
 
 import numpy as np
 import pandas as pd
@@ -35,6 +39,19 @@ BATCH_SIZE = 32
 LEARNING_RATE = 1e-3
 EPOCHS = 10
 
+# Connection pool
+DB_POOL_SIZE = 8             # threads that may hold a connection at once
+DB_CONN_MAX_AGE_S = 600      # recycle pooled connections after this many seconds
+DB_BUSY_TIMEOUT_MS = 5000
+
+# Group-commit writer
+WRITER_MAX_BATCH_ROWS = 256    # commit once this many rows are queued
+WRITER_MAX_DELAY_MS = 5        # ...or once the oldest queued row waited this long
+WRITER_SYNCHRONOUS = "NORMAL"  # PRAGMA synchronous: OFF, NORMAL, FULL or EXTRA
+
+# Event log
+EVENT_PROJECTION_CHUNK = 500   # events projected per transaction
+
 ############################
 # 1) DATABASE SCHEMA       #
 ############################
@@ -67,10 +84,19 @@ CREATE TABLE IF NOT EXISTS events (
   payload_hash TEXT,
   raw_json TEXT NOT NULL,
   processed BOOLEAN DEFAULT FALSE,
+  projection_error TEXT,  -- set (with processed) when the payload failed validation
   FOREIGN KEY (user_id) REFERENCES users(user_id),
   FOREIGN KEY (app_id) REFERENCES apps(app_id)
 );
 
+-- Typed rows written by the event projector, so projections can be replayed
+CREATE TABLE IF NOT EXISTS event_projections (
+  event_id INTEGER PRIMARY KEY,
+  table_name TEXT NOT NULL,
+  row_id INTEGER NOT NULL,
+  FOREIGN KEY (event_id) REFERENCES events(event_id)
+);
+
 -- Health/time-series data
 CREATE TABLE IF NOT EXISTS daily_logs (
   user_id TEXT NOT NULL,
@@ -259,14 +285,34 @@ CREATE TABLE IF NOT EXISTS device_sync (
 );
 
 -- Feature store (materialized)
+-- Column layouts of the binary feature rows; a new layout gets a new schema_id
+CREATE TABLE IF NOT EXISTS fs_feature_schemas (
+  schema_id INTEGER PRIMARY KEY AUTOINCREMENT,
+  schema_hash TEXT NOT NULL UNIQUE,
+  feature_names_json TEXT NOT NULL,  -- JSON array, index = position in features
+  label_names_json TEXT NOT NULL,  -- JSON array, index = position in labels
+  dtypes_json TEXT,  -- [feature dtypes, label dtypes] of packed compact rows; NULL = float32 vectors
+  created_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+
 CREATE TABLE IF NOT EXISTS fs_daily_user (
   user_id TEXT NOT NULL,
   date TEXT NOT NULL,
-  features_json TEXT NOT NULL,
-  labels_json TEXT,
+  schema_id INTEGER NOT NULL,
+  features BLOB NOT NULL,  -- little-endian float32 vector
+  labels BLOB NOT NULL,  -- little-endian float32 vector, NaN = unknown
   created_at TEXT DEFAULT CURRENT_TIMESTAMP,
   PRIMARY KEY (user_id, date),
-  FOREIGN KEY (user_id) REFERENCES users(user_id)
+  FOREIGN KEY (user_id) REFERENCES users(user_id),
+  FOREIGN KEY (schema_id) REFERENCES fs_feature_schemas(schema_id)
+);
+
+-- Raw (user_id, date) pairs touched by ingestion since features were last materialized
+CREATE TABLE IF NOT EXISTS fs_dirty_dates (
+  user_id TEXT NOT NULL,
+  date TEXT NOT NULL,
+  seq INTEGER NOT NULL,  -- bumped on every touch so concurrent marks aren't lost
+  PRIMARY KEY (user_id, date)
 );
 
 CREATE TABLE IF NOT EXISTS fs_seq_user (
@@ -308,7 +354,11 @@ CREATE TABLE IF NOT EXISTS model_versions (
   model_path TEXT NOT NULL,
   metrics_json TEXT,  -- JSON object with performance metrics
   created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-  is_active BOOLEAN DEFAULT FALSE
+  is_active BOOLEAN DEFAULT FALSE,
+  user_id TEXT,  -- owner of a per-user model
+  train_mode TEXT,  -- 'full', 'warm'
+  rows_trained INTEGER,  -- fs_daily_user rows when training started
+  data_through TEXT  -- last feature date trained on (YYYY-MM-DD)
 );
 
 CREATE TABLE IF NOT EXISTS predictions (
@@ -324,25 +374,280 @@ CREATE TABLE IF NOT EXISTS predictions (
   FOREIGN KEY (user_id) REFERENCES users(user_id)
 );
 
+-- Resumable bulk imports: rows of the source already consumed
+CREATE TABLE IF NOT EXISTS import_checkpoints (
+  import_id TEXT PRIMARY KEY,
+  source TEXT,
+  rows_done INTEGER NOT NULL DEFAULT 0,
+  rows_failed INTEGER NOT NULL DEFAULT 0,
+  completed BOOLEAN DEFAULT FALSE,
+  updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Fleet feature backfills: users already rebuilt in each run
+CREATE TABLE IF NOT EXISTS feature_backfill_progress (
+  run_id TEXT NOT NULL,
+  user_id TEXT NOT NULL,
+  rows INTEGER NOT NULL DEFAULT 0,
+  completed_at TEXT DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (run_id, user_id)
+);
+
+-- Model training jobs, run by the API's training scheduler
+CREATE TABLE IF NOT EXISTS training_jobs (
+  job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+  user_id TEXT NOT NULL,  -- model set trained ('_global' for the cross-user set)
+  kind TEXT NOT NULL,  -- 'user', 'global'
+  params_json TEXT,  -- JSON object of training arguments
+  status TEXT NOT NULL DEFAULT 'queued',  -- 'queued', 'running', 'succeeded', 'failed', 'cancelled'
+  progress REAL NOT NULL DEFAULT 0,  -- 0..1
+  message TEXT,
+  error TEXT,
+  cancel_requested BOOLEAN DEFAULT FALSE,
+  created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+  started_at TEXT,
+  finished_at TEXT
+);
+
 -- Indexes for performance
 CREATE INDEX IF NOT EXISTS idx_events_user_time ON events(user_id, event_time);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_events_user_payload ON events(user_id, payload_hash);
+CREATE INDEX IF NOT EXISTS idx_events_processed ON events(processed, event_id);
 CREATE INDEX IF NOT EXISTS idx_symptoms_user_date ON symptoms(user_id, date);
 CREATE INDEX IF NOT EXISTS idx_meals_user_ts ON meals(user_id, ts);
 CREATE INDEX IF NOT EXISTS idx_sleep_user_start ON sleep_sessions(user_id, start_time);
 CREATE INDEX IF NOT EXISTS idx_predictions_user_date ON predictions(user_id, date);
+CREATE INDEX IF NOT EXISTS idx_model_versions_user ON model_versions(user_id, model_type, target, is_active);
+CREATE INDEX IF NOT EXISTS idx_training_jobs_status ON training_jobs(status, job_id);
+CREATE INDEX IF NOT EXISTS idx_training_jobs_user ON training_jobs(user_id, job_id);
+-- At most one queued or running job per model set
+CREATE UNIQUE INDEX IF NOT EXISTS idx_training_jobs_active ON training_jobs(user_id)
+  WHERE status IN ('queued', 'running');
 """
 
-def get_conn():
-    """Get database connection with proper settings."""
-    conn = sqlite3.connect(DB_PATH.as_posix())
-    conn.execute("PRAGMA foreign_keys=ON;")
-    conn.execute("PRAGMA journal_mode=WAL;")
-    conn.row_factory = sqlite3.Row
-    return conn
+class ConnectionPool:
+    """Per-thread SQLite connections with separate read-only and writer handles.
+    
+    Each thread keeps at most one read-only and one writer connection, opened
+    lazily with their PRAGMAs applied once. At most `pool_size` threads may
+    hold a checkout at a time, and writer checkouts are serialized so callers
+    queue in-process instead of spinning on SQLITE_BUSY.
+    """
+    
+    def __init__(self, db_path: Path, pool_size: int = DB_POOL_SIZE,
+                 max_age_s: float = DB_CONN_MAX_AGE_S):
+        self.db_path = db_path
+        self.pool_size = pool_size
+        self.max_age_s = max_age_s
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._write_lock = threading.Lock()
+        self._local = threading.local()
+        self._registry_lock = threading.Lock()
+        # (thread ident, readonly) -> (connection, owning thread)
+        self._registry: Dict[Tuple[int, bool], Tuple[sqlite3.Connection, threading.Thread]] = {}
+        self._generation = 0
+        self._wal_enabled = False
+        self._stats = {
+            'checkouts': 0,
+            'readonly_checkouts': 0,
+            'write_checkouts': 0,
+            'in_use': 0,
+            'opened': 0,
+            'recycled': 0,
+            'wait_total_ms': 0.0,
+            'wait_max_ms': 0.0,
+            'write_wait_total_ms': 0.0,
+            'write_wait_max_ms': 0.0,
+        }
+    
+    def _open(self, readonly: bool) -> sqlite3.Connection:
+        """Open a connection and apply its PRAGMAs."""
+        # Connections never leave their thread while in use; the flag only
+        # lets close_all() close them from the shutdown thread.
+        conn = sqlite3.connect(self.db_path.as_posix(), check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA foreign_keys=ON;")
+        conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS};")
+        if readonly:
+            conn.execute("PRAGMA query_only=ON;")
+        elif not self._wal_enabled:
+            # journal_mode is persistent in the database file
+            conn.execute("PRAGMA journal_mode=WAL;")
+            self._wal_enabled = True
+        
+        thread = threading.current_thread()
+        with self._registry_lock:
+            # Drop connections owned by threads that have exited
+            for key, (old_conn, owner) in list(self._registry.items()):
+                if not owner.is_alive():
+                    old_conn.close()
+                    del self._registry[key]
+            self._registry[(thread.ident, readonly)] = (conn, thread)
+            self._stats['opened'] += 1
+        return conn
+    
+    def _thread_conn(self, readonly: bool) -> sqlite3.Connection:
+        """Return this thread's connection, reopening it when stale."""
+        local = self._local
+        key = 'ro' if readonly else 'rw'
+        entry = getattr(local, key, None)
+        if entry is not None:
+            conn, opened_at, generation = entry
+            if generation == self._generation and time.monotonic() - opened_at < self.max_age_s:
+                return conn
+            self._discard(conn, readonly)
+        
+        conn = self._open(readonly)
+        setattr(local, key, (conn, time.monotonic(), self._generation))
+        return conn
+    
+    def _discard(self, conn: sqlite3.Connection, readonly: bool) -> None:
+        with self._registry_lock:
+            self._registry.pop((threading.get_ident(), readonly), None)
+            self._stats['recycled'] += 1
+        try:
+            conn.close()
+        except sqlite3.ProgrammingError:
+            pass
+    
+    @contextmanager
+    def connection(self, readonly: bool = False) -> Iterator[sqlite3.Connection]:
+        """Check out this thread's connection.
+        
+        Writer checkouts commit on success and roll back on error, matching
+        the `with sqlite3.connect(...)` behaviour callers relied on. Nested
+        checkouts on the same thread reuse the outer one; only the outermost
+        writer checkout commits.
+        """
+        local = self._local
+        depth_key = 'ro_depth' if readonly else 'rw_depth'
+        depth = getattr(local, depth_key, 0)
+        if depth:
+            setattr(local, depth_key, depth + 1)
+            try:
+                yield getattr(local, 'ro' if readonly else 'rw')[0]
+            finally:
+                setattr(local, depth_key, depth)
+            return
+        
+        holds_slot = getattr(local, 'ro_depth', 0) or getattr(local, 'rw_depth', 0)
+        wait_start = time.perf_counter()
+        if not holds_slot:
+            self._slots.acquire()
+        slot_waited = time.perf_counter() - wait_start
+        write_waited = None
+        if not readonly:
+            write_start = time.perf_counter()
+            self._write_lock.acquire()
+            write_waited = time.perf_counter() - write_start
+        self._record_checkout(readonly, slot_waited, write_waited)
+        
+        try:
+            conn = self._thread_conn(readonly)
+            setattr(local, depth_key, 1)
+            try:
+                yield conn
+                if not readonly:
+                    conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+        finally:
+            setattr(local, depth_key, 0)
+            with self._registry_lock:
+                self._stats['in_use'] -= 1
+            if not readonly:
+                self._write_lock.release()
+            if not holds_slot:
+                self._slots.release()
+    
+    def _record_checkout(self, readonly: bool, slot_waited: float,
+                         write_waited: Optional[float]) -> None:
+        with self._registry_lock:
+            stats = self._stats
+            stats['checkouts'] += 1
+            stats['in_use'] += 1
+            stats['readonly_checkouts' if readonly else 'write_checkouts'] += 1
+            stats['wait_total_ms'] += slot_waited * 1000
+            stats['wait_max_ms'] = max(stats['wait_max_ms'], slot_waited * 1000)
+            if write_waited is not None:
+                stats['write_wait_total_ms'] += write_waited * 1000
+                stats['write_wait_max_ms'] = max(stats['write_wait_max_ms'], write_waited * 1000)
+    
+    def recycle(self) -> None:
+        """Reopen every connection on its next checkout."""
+        self._generation += 1
+    
+    def close_all(self) -> None:
+        """Close every pooled connection (e.g. on shutdown)."""
+        self._generation += 1
+        with self._registry_lock:
+            for conn, _ in self._registry.values():
+                try:
+                    conn.close()
+                except sqlite3.ProgrammingError:
+                    pass
+            self._registry.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Pool size and checkout-wait metrics."""
+        with self._registry_lock:
+            stats = dict(self._stats)
+            stats['pool_size'] = self.pool_size
+            stats['open_connections'] = len(self._registry)
+        checkouts = stats['checkouts'] or 1
+        stats['wait_avg_ms'] = stats['wait_total_ms'] / checkouts
+        stats['write_wait_avg_ms'] = stats['write_wait_total_ms'] / (stats['write_checkouts'] or 1)
+        return stats
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    """Get the process-wide connection pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_PATH)
+    return _pool
+
+def close_pool() -> None:
+    """Close all pooled connections."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close_all()
+            _pool = None
+
+def get_conn(readonly: bool = False):
+    """Check out a pooled database connection.
+    
+    Use as `with get_conn() as conn:`; writer connections commit on exit.
+    Pass readonly=True for queries so they don't wait on writers.
+    """
+    return get_pool().connection(readonly)
 
 def init_db():
     """Initialize database with schema."""
     with get_conn() as conn:
+        # fs_daily_user used to hold JSON rows; it is derived data, so drop
+        # the old layout and let features be rebuilt in the binary one
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(fs_daily_user)")]
+        if 'features_json' in columns:
+            conn.execute("DROP TABLE fs_daily_user")
+            print("⚠ Dropped JSON feature rows; rebuild features to repopulate fs_daily_user")
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(fs_feature_schemas)")]
+        if columns and 'dtypes_json' not in columns:
+            conn.execute("ALTER TABLE fs_feature_schemas ADD COLUMN dtypes_json TEXT")
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(events)")]
+        if columns and 'projection_error' not in columns:
+            conn.execute("ALTER TABLE events ADD COLUMN projection_error TEXT")
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(model_versions)")]
+        for column, sql_type in (('user_id', 'TEXT'), ('train_mode', 'TEXT'),
+                                 ('rows_trained', 'INTEGER'), ('data_through', 'TEXT')):
+            if columns and column not in columns:
+                conn.execute(f"ALTER TABLE model_versions ADD COLUMN {column} {sql_type}")
         conn.executescript(DDL)
         print("✅ Database initialized successfully")
 
@@ -364,7 +669,8 @@ class EventIn(BaseModel):
     
     @validator('event_time')
     def validate_event_time(cls, v):
-        if v > dt.datetime.now():
+        # Webhooks usually send offsets or "Z"; compare in the value's own timezone
+        if v > dt.datetime.now(v.tzinfo):
             raise ValueError('Event time cannot be in the future')
         return v
 
@@ -455,99 +761,655 @@ def calculate_payload_hash(payload: Dict[str, Any]) -> str:
     payload_str = json.dumps(payload, sort_keys=True)
     return hashlib.md5(payload_str.encode()).hexdigest()
 
+def _daily_log_row(log: DailyLogIn) -> tuple:
+    return (log.user_id, log.date.isoformat(), log.mood, log.stress, log.energy,
+            log.focus, log.notes, log.journal_entry,
+            json.dumps(log.coping_strategies) if log.coping_strategies else None)
+
+def _symptom_row(symptom: SymptomIn) -> tuple:
+    return (symptom.user_id, symptom.date.isoformat(), symptom.type, symptom.severity,
+            symptom.onset_time.isoformat() if symptom.onset_time else None,
+            symptom.duration_min, symptom.location,
+            json.dumps(symptom.triggers) if symptom.triggers else None,
+            symptom.notes)
+
+def _meal_row(meal: MealIn) -> tuple:
+    return (meal.user_id, meal.ts.isoformat(), meal.items, json.dumps(meal.tags),
+            meal.calories, meal.caffeine_mg, meal.protein_g, meal.carbs_g,
+            meal.fat_g, meal.fiber_g, meal.sugar_g)
+
+def _sleep_session_row(sleep: SleepSessionIn) -> tuple:
+    return (sleep.user_id, sleep.start_time.isoformat(), sleep.end_time.isoformat(),
+            sleep.total_min, sleep.deep_min, sleep.light_min, sleep.rem_min,
+            sleep.awake_min, sleep.awakenings, sleep.sleep_score,
+            json.dumps(sleep.sleep_factors) if sleep.sleep_factors else None,
+            sleep.notes)
+
+def _workout_row(workout: WorkoutIn) -> tuple:
+    return (workout.user_id, workout.ts.isoformat(), workout.type, workout.duration_min,
+            workout.intensity, workout.calories_burned, workout.heart_rate_avg,
+            workout.heart_rate_max, workout.notes)
+
+def _vital_row(vital: VitalIn) -> tuple:
+    return (vital.user_id, vital.date.isoformat(), vital.hr_mean, vital.hr_max,
+            vital.hrv_ms, vital.spo2, vital.steps, vital.active_min, vital.calories_burned)
+
+def _journal_row(journal: JournalIn) -> tuple:
+    return (journal.user_id, journal.ts.isoformat(), journal.text,
+            journal.mood_context, journal.stress_context)
+
+def _sql_date(ts: dt.datetime) -> dt.date:
+    """The day SQLite's date() gives a stored timestamp (UTC for aware values)."""
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(dt.timezone.utc)
+    return ts.date()
+
+class IngestSpec(NamedTuple):
+    """How one ingestion data type maps onto its table."""
+    model: Type[BaseModel]
+    table: str
+    sql: str
+    to_row: Callable[[Any], tuple]
+    # Day a record contributes to in the feature store (None: not a feature source)
+    feature_date: Optional[Callable[[Any], dt.date]] = None
+    # The same day as a SQL expression over the table's columns
+    date_sql: Optional[str] = None
+
+# Keyed by the `data_type` values accepted by the ingestion API
+INGEST_SPECS: Dict[str, IngestSpec] = {
+    "daily_log": IngestSpec(
+        DailyLogIn, "daily_logs",
+        """INSERT OR REPLACE INTO daily_logs 
+           (user_id, date, mood, stress, energy, focus, notes, journal_entry, coping_strategies)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        _daily_log_row, lambda r: r.date, "date"),
+    "symptom": IngestSpec(
+        SymptomIn, "symptoms",
+        """INSERT INTO symptoms 
+           (user_id, date, type, severity, onset_time, duration_min, location, triggers, notes)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        _symptom_row, lambda r: r.date, "date"),
+    "meal": IngestSpec(
+        MealIn, "meals",
+        """INSERT INTO meals 
+           (user_id, ts, items, tags, calories, caffeine_mg, protein_g, carbs_g, fat_g, fiber_g, sugar_g)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        _meal_row, lambda r: _sql_date(r.ts), "date(ts)"),
+    "sleep": IngestSpec(
+        SleepSessionIn, "sleep_sessions",
+        """INSERT INTO sleep_sessions 
+           (user_id, start_time, end_time, total_min, deep_min, light_min, rem_min, 
+            awake_min, awakenings, sleep_score, sleep_factors, notes)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        _sleep_session_row, lambda r: _sql_date(r.end_time), "date(end_time)"),
+    "workout": IngestSpec(
+        WorkoutIn, "workouts",
+        """INSERT INTO workouts 
+           (user_id, ts, type, duration_min, intensity, calories_burned, heart_rate_avg, heart_rate_max, notes)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        _workout_row, lambda r: _sql_date(r.ts), "date(ts)"),
+    "vital": IngestSpec(
+        VitalIn, "vitals",
+        """INSERT INTO vitals 
+           (user_id, date, hr_mean, hr_max, hrv_ms, spo2, steps, active_min, calories_burned)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        _vital_row, lambda r: r.date, "date"),
+    "journal": IngestSpec(
+        JournalIn, "journals",
+        """INSERT INTO journals 
+           (user_id, ts, text, mood_context, stress_context)
+           VALUES (?, ?, ?, ?, ?)""",
+        _journal_row),
+}
+
+def mark_dirty_dates(conn: sqlite3.Connection, data_type: str, records: List[BaseModel]) -> None:
+    """Record the (user_id, date) pairs a write touched, in the same transaction.
+    
+    The feature store's materializer expands these to every feature row the
+    change reaches and recomputes only those.
+    """
+    feature_date = INGEST_SPECS[data_type].feature_date
+    if feature_date is None:
+        return
+    seq = time.time_ns()
+    conn.executemany(
+        """INSERT INTO fs_dirty_dates (user_id, date, seq) VALUES (?, ?, ?)
+           ON CONFLICT (user_id, date) DO UPDATE SET seq=excluded.seq""",
+        [(user_id, day, seq) for user_id, day in
+         {(r.user_id, feature_date(r).isoformat()) for r in records}]
+    )
+
 def upsert_daily_log(log: DailyLogIn) -> int:
     """Upsert daily log entry."""
     with get_conn() as conn:
-        conn.execute(
-            """INSERT OR REPLACE INTO daily_logs 
-               (user_id, date, mood, stress, energy, focus, notes, journal_entry, coping_strategies)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-            (log.user_id, log.date.isoformat(), log.mood, log.stress, log.energy, 
-             log.focus, log.notes, log.journal_entry, 
-             json.dumps(log.coping_strategies) if log.coping_strategies else None)
-        )
-        return conn.total_changes
+        cursor = conn.execute(INGEST_SPECS["daily_log"].sql, _daily_log_row(log))
+        mark_dirty_dates(conn, "daily_log", [log])
+    notify_ingest([("daily_log", log)])
+    return cursor.rowcount
+
+IngestListener = Callable[[List[Tuple[str, BaseModel]]], None]
+_ingest_listeners: List[IngestListener] = []
+
+def add_ingest_listener(listener: IngestListener) -> None:
+    """Call listener with every batch of (data_type, model) records once committed."""
+    if listener not in _ingest_listeners:
+        _ingest_listeners.append(listener)
+
+def remove_ingest_listener(listener: IngestListener) -> None:
+    if listener in _ingest_listeners:
+        _ingest_listeners.remove(listener)
+
+def notify_ingest(records: List[Tuple[str, BaseModel]]) -> None:
+    """Hand committed records to the ingest listeners.
+    
+    A failing listener is reported and skipped; the records are already
+    stored, so ingestion itself never fails because of one.
+    """
+    if not records:
+        return
+    for listener in list(_ingest_listeners):
+        try:
+            listener(records)
+        except Exception as e:
+            print(f"⚠ Ingest listener failed: {e}")
 
 def insert_symptom(symptom: SymptomIn) -> int:
     """Insert symptom entry."""
     with get_conn() as conn:
-        cursor = conn.execute(
-            """INSERT INTO symptoms 
-               (user_id, date, type, severity, onset_time, duration_min, location, triggers, notes)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-            (symptom.user_id, symptom.date.isoformat(), symptom.type, symptom.severity,
-             symptom.onset_time.isoformat() if symptom.onset_time else None,
-             symptom.duration_min, symptom.location,
-             json.dumps(symptom.triggers) if symptom.triggers else None,
-             symptom.notes)
-        )
-        return cursor.lastrowid
+        cursor = conn.execute(INGEST_SPECS["symptom"].sql, _symptom_row(symptom))
+        mark_dirty_dates(conn, "symptom", [symptom])
+    notify_ingest([("symptom", symptom)])
+    return cursor.lastrowid
 
 def insert_meal(meal: MealIn) -> int:
     """Insert meal entry."""
     with get_conn() as conn:
-        cursor = conn.execute(
-            """INSERT INTO meals 
-               (user_id, ts, items, tags, calories, caffeine_mg, protein_g, carbs_g, fat_g, fiber_g, sugar_g)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-            (meal.user_id, meal.ts.isoformat(), meal.items, json.dumps(meal.tags),
-             meal.calories, meal.caffeine_mg, meal.protein_g, meal.carbs_g, 
-             meal.fat_g, meal.fiber_g, meal.sugar_g)
-        )
-        return cursor.lastrowid
+        cursor = conn.execute(INGEST_SPECS["meal"].sql, _meal_row(meal))
+        mark_dirty_dates(conn, "meal", [meal])
+    notify_ingest([("meal", meal)])
+    return cursor.lastrowid
 
 def insert_sleep_session(sleep: SleepSessionIn) -> int:
     """Insert sleep session entry."""
     with get_conn() as conn:
-        cursor = conn.execute(
-            """INSERT INTO sleep_sessions 
-               (user_id, start_time, end_time, total_min, deep_min, light_min, rem_min, 
-                awake_min, awakenings, sleep_score, sleep_factors, notes)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-            (sleep.user_id, sleep.start_time.isoformat(), sleep.end_time.isoformat(),
-             sleep.total_min, sleep.deep_min, sleep.light_min, sleep.rem_min,
-             sleep.awake_min, sleep.awakenings, sleep.sleep_score,
-             json.dumps(sleep.sleep_factors) if sleep.sleep_factors else None,
-             sleep.notes)
-        )
-        return cursor.lastrowid
+        cursor = conn.execute(INGEST_SPECS["sleep"].sql, _sleep_session_row(sleep))
+        mark_dirty_dates(conn, "sleep", [sleep])
+    notify_ingest([("sleep", sleep)])
+    return cursor.lastrowid
 
 def insert_workout(workout: WorkoutIn) -> int:
     """Insert workout entry."""
     with get_conn() as conn:
-        cursor = conn.execute(
-            """INSERT INTO workouts 
-               (user_id, ts, type, duration_min, intensity, calories_burned, heart_rate_avg, heart_rate_max, notes)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-            (workout.user_id, workout.ts.isoformat(), workout.type, workout.duration_min,
-             workout.intensity, workout.calories_burned, workout.heart_rate_avg,
-             workout.heart_rate_max, workout.notes)
-        )
-        return cursor.lastrowid
+        cursor = conn.execute(INGEST_SPECS["workout"].sql, _workout_row(workout))
+        mark_dirty_dates(conn, "workout", [workout])
+    notify_ingest([("workout", workout)])
+    return cursor.lastrowid
 
 def insert_vital(vital: VitalIn) -> int:
     """Insert vital signs entry."""
     with get_conn() as conn:
-        cursor = conn.execute(
-            """INSERT INTO vitals 
-               (user_id, date, hr_mean, hr_max, hrv_ms, spo2, steps, active_min, calories_burned)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-            (vital.user_id, vital.date.isoformat(), vital.hr_mean, vital.hr_max,
-             vital.hrv_ms, vital.spo2, vital.steps, vital.active_min, vital.calories_burned)
-        )
-        return cursor.lastrowid
+        cursor = conn.execute(INGEST_SPECS["vital"].sql, _vital_row(vital))
+        mark_dirty_dates(conn, "vital", [vital])
+    notify_ingest([("vital", vital)])
+    return cursor.lastrowid
 
 def insert_journal(journal: JournalIn) -> int:
     """Insert journal entry."""
     with get_conn() as conn:
-        cursor = conn.execute(
-            """INSERT INTO journals 
-               (user_id, ts, text, mood_context, stress_context)
-               VALUES (?, ?, ?, ?, ?)""",
-            (journal.user_id, journal.ts.isoformat(), journal.text,
-             journal.mood_context, journal.stress_context)
+        cursor = conn.execute(INGEST_SPECS["journal"].sql, _journal_row(journal))
+    notify_ingest([("journal", journal)])
+    return cursor.lastrowid
+
+#########################
+# 4) BATCH INGESTION     #
+#########################
+
+def validate_records(user_id: str, records: List[Tuple[str, Dict[str, Any]]]
+                     ) -> Tuple[List[Tuple[int, str, BaseModel]], Dict[int, str]]:
+    """Validate a mixed list of (data_type, data) records for one user.
+    
+    Returns the valid records as (index, data_type, model) and the
+    validation errors keyed by the record's index in the input list.
+    """
+    valid = []
+    errors = {}
+    for idx, (data_type, data) in enumerate(records):
+        spec = INGEST_SPECS.get(data_type)
+        if spec is None:
+            errors[idx] = f"Unknown data type: {data_type}"
+            continue
+        try:
+            valid.append((idx, data_type, spec.model(**{**data, "user_id": user_id})))
+        except ValueError as e:
+            errors[idx] = str(e)
+    return valid, errors
+
+def _write_records(conn: sqlite3.Connection, data_type: str,
+                   records: List[BaseModel]) -> List[int]:
+    """Write one group of same-typed records with a single executemany.
+    
+    Must run inside the caller's transaction. Returns the rowid of every
+    record, in input order.
+    """
+    spec = INGEST_SPECS[data_type]
+    conn.executemany(spec.sql, [spec.to_row(r) for r in records])
+    
+    if data_type == "daily_log":
+        # Upserts can replace earlier rows, so look the rowids up by key
+        ids = [
+            conn.execute(
+                "SELECT rowid FROM daily_logs WHERE user_id=? AND date=?",
+                (r.user_id, r.date.isoformat())
+            ).fetchone()[0]
+            for r in records
+        ]
+    else:
+        # AUTOINCREMENT rowids handed out inside one write transaction are
+        # consecutive, so the batch ends at last_insert_rowid()
+        last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+        ids = list(range(last_id - len(records) + 1, last_id + 1))
+    
+    mark_dirty_dates(conn, data_type, records)
+    return ids
+
+def _ensure_users(conn: sqlite3.Connection, user_ids) -> None:
+    """Create missing user rows so typed inserts satisfy the users foreign key."""
+    conn.executemany(
+        "INSERT OR IGNORE INTO users (user_id) VALUES (?)",
+        [(uid,) for uid in set(user_ids)]
+    )
+
+def _group_by_type(records: List[Tuple[str, BaseModel]]) -> Dict[str, List[int]]:
+    """Positions of each data type in a mixed record list, in input order."""
+    groups: Dict[str, List[int]] = {}
+    for pos, (data_type, _) in enumerate(records):
+        groups.setdefault(data_type, []).append(pos)
+    return groups
+
+def write_records(conn: sqlite3.Connection, records: List[Tuple[str, BaseModel]]) -> List[int]:
+    """Write validated (data_type, model) records inside the caller's transaction.
+    
+    Records are grouped by table and written with executemany. Returns
+    rowids in input order.
+    """
+    ids: List[int] = [0] * len(records)
+    # Offline uploads may arrive before the user row exists
+    _ensure_users(conn, [r.user_id for _, r in records])
+    for data_type, positions in _group_by_type(records).items():
+        group_ids = _write_records(conn, data_type, [records[p][1] for p in positions])
+        for pos, row_id in zip(positions, group_ids):
+            ids[pos] = row_id
+    return ids
+
+def insert_records(records: List[Tuple[str, BaseModel]]) -> List[int]:
+    """Insert validated (data_type, model) records in one transaction.
+    
+    A batch costs one commit instead of one per record.
+    """
+    with get_conn() as conn:
+        ids = write_records(conn, records)
+    notify_ingest(records)
+    return ids
+
+#########################
+# 5) GROUP-COMMIT WRITER #
+#########################
+
+SYNCHRONOUS_LEVELS = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+class GroupCommitWriter:
+    """Write-behind writer that coalesces queued inserts into group commits.
+    
+    A single thread owns all writes it is given: jobs queue up until
+    `max_batch_rows` are waiting or the oldest has waited `max_delay_ms`,
+    then the whole group is written and committed at once. Each caller's
+    future resolves with the record's rowid once its group is committed.
+    
+    `synchronous` trades durability for latency: NORMAL (the WAL default)
+    may lose the last commits on power loss, FULL/EXTRA fsync every commit.
+    """
+    
+    def __init__(self, max_batch_rows: int = WRITER_MAX_BATCH_ROWS,
+                 max_delay_ms: float = WRITER_MAX_DELAY_MS,
+                 synchronous: str = WRITER_SYNCHRONOUS):
+        synchronous = synchronous.upper()
+        if synchronous not in SYNCHRONOUS_LEVELS:
+            raise ValueError(f"synchronous must be one of {SYNCHRONOUS_LEVELS}")
+        self.max_batch_rows = max_batch_rows
+        self.max_delay_ms = max_delay_ms
+        self.synchronous = synchronous
+        self._queue: "queue.Queue[Optional[Tuple[str, BaseModel, Future]]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._stats = {
+            'groups': 0,
+            'rows': 0,
+            'failed_rows': 0,
+            'commit_total_ms': 0.0,
+            'max_group_rows': 0,
+        }
+    
+    def start(self) -> None:
+        """Start the writer thread if it is not running."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="group-commit-writer", daemon=True
+                )
+                self._thread.start()
+    
+    def submit(self, data_type: str, record: BaseModel) -> Future:
+        """Queue a validated record; the future resolves with its rowid."""
+        if data_type not in INGEST_SPECS:
+            raise ValueError(f"Unknown data type: {data_type}")
+        self.start()
+        future: Future = Future()
+        self._queue.put((data_type, record, future))
+        return future
+    
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Flush queued jobs and stop the writer thread."""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None and thread.is_alive():
+            self._queue.put(None)
+            thread.join(timeout)
+    
+    def _run(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            batch = [job]
+            stopping = False
+            deadline = time.monotonic() + self.max_delay_ms / 1000
+            while len(batch) < self.max_batch_rows:
+                remaining = deadline - time.monotonic()
+                try:
+                    job = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None:
+                    stopping = True
+                    break
+                batch.append(job)
+            self._commit_group(batch)
+            if stopping:
+                return
+    
+    def _commit_group(self, batch: List[Tuple[str, BaseModel, Future]]) -> None:
+        """Write and commit one group, then resolve its futures."""
+        results: Dict[int, Union[int, BaseException]] = {}
+        start = time.perf_counter()
+        try:
+            with get_conn() as conn:
+                # Per-connection setting; cheap, and keeps a recycled
+                # connection on the configured durability level
+                conn.execute(f"PRAGMA synchronous={self.synchronous};")
+                conn.execute("BEGIN")
+                _ensure_users(conn, [record.user_id for _, record, _ in batch])
+                records = [(data_type, record) for data_type, record, _ in batch]
+                for data_type, positions in _group_by_type(records).items():
+                    self._write_group(conn, data_type, [(p, records[p][1]) for p in positions], results)
+        except BaseException as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            self._stats['failed_rows'] += len(batch)
+            return
+        
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        # Before resolving futures, so callers see their rows in listeners' state
+        notify_ingest([(data_type, record) for pos, (data_type, record, _) in enumerate(batch)
+                       if not isinstance(results[pos], BaseException)])
+        failed = 0
+        for pos, (_, _, future) in enumerate(batch):
+            outcome = results[pos]
+            if isinstance(outcome, BaseException):
+                failed += 1
+                future.set_exception(outcome)
+            else:
+                future.set_result(outcome)
+        
+        stats = self._stats
+        stats['groups'] += 1
+        stats['rows'] += len(batch) - failed
+        stats['failed_rows'] += failed
+        stats['commit_total_ms'] += elapsed_ms
+        stats['max_group_rows'] = max(stats['max_group_rows'], len(batch))
+    
+    @staticmethod
+    def _write_group(conn: sqlite3.Connection, data_type: str,
+                     items: List[Tuple[int, BaseModel]],
+                     results: Dict[int, Union[int, BaseException]]) -> None:
+        """executemany a same-typed group, isolating bad rows on failure."""
+        conn.execute("SAVEPOINT grp")
+        try:
+            ids = _write_records(conn, data_type, [record for _, record in items])
+        except sqlite3.Error:
+            conn.execute("ROLLBACK TO grp")
+            conn.execute("RELEASE grp")
+        else:
+            conn.execute("RELEASE grp")
+            for (pos, _), row_id in zip(items, ids):
+                results[pos] = row_id
+            return
+        
+        # A row violated a constraint: retry one by one so only it fails
+        for pos, record in items:
+            conn.execute("SAVEPOINT row")
+            try:
+                results[pos] = _write_records(conn, data_type, [record])[0]
+                conn.execute("RELEASE row")
+            except sqlite3.Error as e:
+                conn.execute("ROLLBACK TO row")
+                conn.execute("RELEASE row")
+                results[pos] = e
+    
+    def stats(self) -> Dict[str, Any]:
+        """Group-commit throughput and queue-depth metrics."""
+        stats = dict(self._stats)
+        stats['queue_depth'] = self._queue.qsize()
+        stats['avg_group_rows'] = stats['rows'] / max(1, stats['groups'])
+        stats['avg_commit_ms'] = stats['commit_total_ms'] / max(1, stats['groups'])
+        stats['synchronous'] = self.synchronous
+        stats['max_batch_rows'] = self.max_batch_rows
+        stats['max_delay_ms'] = self.max_delay_ms
+        return stats
+
+_writer: Optional[GroupCommitWriter] = None
+
+def get_writer() -> GroupCommitWriter:
+    """Get the process-wide group-commit writer, starting it on first use."""
+    global _writer
+    with _pool_lock:
+        if _writer is None:
+            _writer = GroupCommitWriter()
+    _writer.start()
+    return _writer
+
+def stop_writer(timeout: Optional[float] = None) -> None:
+    """Flush and stop the group-commit writer."""
+    global _writer
+    with _pool_lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        writer.stop(timeout)
+
+#########################
+# 6) EVENT LOG           #
+#########################
+
+def _event_payload_hash(event: EventIn) -> str:
+    """Idempotency key for an event; resent webhooks hash identically."""
+    return calculate_payload_hash({
+        'app_id': event.app_id,
+        'event_type': event.event_type,
+        'event_time': event.event_time.isoformat(),
+        'raw_json': event.raw_json,
+    })
+
+def ingest_events(events: List[EventIn]) -> List[Tuple[int, bool]]:
+    """Append raw events to the event log in one transaction.
+    
+    Duplicates are rejected by the unique (user_id, payload_hash) index.
+    Returns (event_id, created) per event; created is False for a duplicate,
+    whose event_id is the one stored first.
+    """
+    results = []
+    with get_conn() as conn:
+        _ensure_users(conn, [e.user_id for e in events])
+        conn.executemany(
+            "INSERT OR IGNORE INTO apps (app_id, name) VALUES (?, ?)",
+            [(app_id, app_id) for app_id in {e.app_id for e in events}]
         )
-        return cursor.lastrowid
+        for event in events:
+            payload_hash = _event_payload_hash(event)
+            cursor = conn.execute(
+                """INSERT INTO events (user_id, app_id, event_type, event_time, payload_hash, raw_json)
+                   VALUES (?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (user_id, payload_hash) DO NOTHING""",
+                (event.user_id, event.app_id, event.event_type, event.event_time.isoformat(),
+                 payload_hash, json.dumps(event.raw_json))
+            )
+            if cursor.rowcount:
+                results.append((cursor.lastrowid, True))
+            else:
+                existing = conn.execute(
+                    "SELECT event_id FROM events WHERE user_id=? AND payload_hash=?",
+                    (event.user_id, payload_hash)
+                ).fetchone()
+                results.append((existing[0], False))
+    return results
+
+def ingest_event(event: EventIn) -> Tuple[int, bool]:
+    """Append one raw event; see ingest_events."""
+    return ingest_events([event])[0]
+
+def project_events(user_id: Optional[str] = None,
+                   event_types: Optional[List[str]] = None,
+                   chunk_size: int = EVENT_PROJECTION_CHUNK) -> Dict[str, int]:
+    """Drain unprocessed events into the typed tables.
+    
+    Events whose event_type is an ingestion data type are validated and
+    written like a batch ingest; each chunk is one transaction that also
+    marks its events processed. Other event types are only marked processed.
+    Events that fail validation are marked processed with their
+    projection_error, so later drains skip them; replay_events retries them.
+    """
+    totals = {'projected': 0, 'skipped': 0, 'failed': 0}
+    last_event_id = 0
+    filters, params = "", []
+    if user_id:
+        filters += " AND user_id = ?"
+        params.append(user_id)
+    if event_types:
+        filters += f" AND event_type IN ({', '.join('?' * len(event_types))})"
+        params += event_types
+    
+    while True:
+        with get_conn() as conn:
+            rows = conn.execute(
+                f"""SELECT event_id, user_id, event_type, raw_json
+                    FROM events
+                    WHERE processed = FALSE AND event_id > ? {filters}
+                    ORDER BY event_id
+                    LIMIT ?""",
+                [last_event_id] + params + [chunk_size]
+            ).fetchall()
+            if not rows:
+                break
+            last_event_id = rows[-1]['event_id']
+            
+            records: List[Tuple[str, BaseModel]] = []
+            record_events: List[int] = []
+            done: List[int] = []
+            failed: List[Tuple[str, int]] = []
+            for row in rows:
+                spec = INGEST_SPECS.get(row['event_type'])
+                if spec is None:
+                    done.append(row['event_id'])
+                    totals['skipped'] += 1
+                    continue
+                try:
+                    data = json.loads(row['raw_json'])
+                    record = spec.model(**{**data, 'user_id': row['user_id']})
+                except ValueError as e:
+                    failed.append((str(e), row['event_id']))
+                    totals['failed'] += 1
+                    continue
+                records.append((row['event_type'], record))
+                record_events.append(row['event_id'])
+            
+            row_ids = write_records(conn, records)
+            projections = [
+                (event_id, INGEST_SPECS[data_type].table, row_id)
+                for event_id, (data_type, _), row_id in zip(record_events, records, row_ids)
+            ]
+            
+            conn.executemany(
+                "INSERT OR REPLACE INTO event_projections (event_id, table_name, row_id) VALUES (?, ?, ?)",
+                projections
+            )
+            conn.executemany(
+                "UPDATE events SET processed = TRUE WHERE event_id = ?",
+                [(event_id,) for event_id in done + record_events]
+            )
+            conn.executemany(
+                "UPDATE events SET processed = TRUE, projection_error = ? WHERE event_id = ?", failed
+            )
+            totals['projected'] += len(records)
+        notify_ingest(records)
+    
+    return totals
+
+def replay_events(user_id: Optional[str] = None,
+                  event_types: Optional[List[str]] = None) -> Dict[str, int]:
+    """Rebuild projections from the event log.
+    
+    Deletes the typed rows previously projected from the selected events,
+    marks those events unprocessed (clearing any projection error) and
+    projects them again. Use after changing how events map onto the typed
+    tables or fixing why events failed.
+    """
+    filters, params = [], []
+    if user_id:
+        filters.append("e.user_id = ?")
+        params.append(user_id)
+    if event_types:
+        filters.append(f"e.event_type IN ({', '.join('?' * len(event_types))})")
+        params += event_types
+    where = f"WHERE {' AND '.join(filters)}" if filters else ""
+    
+    with get_conn() as conn:
+        projected = conn.execute(
+            f"""SELECT p.event_id, p.table_name, p.row_id
+                FROM event_projections p JOIN events e ON e.event_id = p.event_id
+                {where}""",
+            params
+        ).fetchall()
+        
+        for spec in INGEST_SPECS.values():
+            row_ids = [(row['row_id'],) for row in projected if row['table_name'] == spec.table]
+            if not row_ids:
+                continue
+            if spec.date_sql:
+                # Features built from the rows being removed must be recomputed
+                conn.executemany(
+                    f"""INSERT INTO fs_dirty_dates (user_id, date, seq)
+                        SELECT user_id, {spec.date_sql}, ? FROM {spec.table} WHERE rowid = ?
+                        ON CONFLICT (user_id, date) DO UPDATE SET seq=excluded.seq""",
+                    [(time.time_ns(), row_id) for (row_id,) in row_ids]
+                )
+            conn.executemany(f"DELETE FROM {spec.table} WHERE rowid = ?", row_ids)
+        conn.executemany(
+            "DELETE FROM event_projections WHERE event_id = ?",
+            [(row['event_id'],) for row in projected]
+        )
+        conn.execute(f"UPDATE events AS e SET processed = FALSE, projection_error = NULL {where}", params)
+    
+    return project_events(user_id, event_types)
 
 if __name__ == "__main__":
     init_db()